@@ -15,6 +15,7 @@ import io
 import csv
 from typing import Dict, Any, List, Optional
 import uuid
+import hmac
 
 # Import our enhanced modules
 import sys
@@ -22,9 +23,14 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.enhanced_variable_selector_v2 import EnhancedVariableSelectorV2
 from core.enhanced_variable_selector_v3 import EnhancedVariableSelectorV3
-from core.audience_builder import DataRetriever, ConstrainedKMedians
+from core.audience_builder import ConstrainedKMedians
+from core.dataset_registry import DatasetRegistry
 from core.prizm_analyzer import PRIZMAnalyzer
-from config.settings import SYNTHETIC_DATA_PATH, API_HOST, API_PORT, API_DEBUG
+from core.cluster_cache import ClusterModelCache
+from core.segment_profiler import GroupedFrame, profile_groups
+from config.settings import (SYNTHETIC_DATA_PATH, API_HOST, API_PORT, API_DEBUG, DATA_STORAGE, DATA_DOWNCAST,
+                             CLUSTER_CACHE_DIR, CLUSTER_CACHE_MAX_ENTRIES, CLUSTER_CACHE_MAX_MB,
+                             DATASET_MANIFEST_PATH, ADMIN_TOKEN)
 
 # Define WorkflowState locally
 class WorkflowState:
@@ -60,15 +66,19 @@ except Exception as e:
         print(f"⚠️  Failed to load V3 with embeddings: {e2}")
         variable_selector = EnhancedVariableSelectorV2()
         print("ℹ️  Using Enhanced Variable Selector V2 with TF-IDF")
-data_retriever = DataRetriever()
+# Versioned dataset: requests acquire the current version, /api/data/reload swaps in new data
+dataset_registry = DatasetRegistry(DATASET_MANIFEST_PATH, storage=DATA_STORAGE, downcast=DATA_DOWNCAST)
 # Load the 100k dataset
-data_retriever.load_data(SYNTHETIC_DATA_PATH)
-clusterer = ConstrainedKMedians()
+dataset_registry.load(SYNTHETIC_DATA_PATH)
+# Settings for the per-request clusterers; a shared instance would mix fitted attributes across threads
+CLUSTER_PARAMS = ConstrainedKMedians().get_params()
+cluster_cache = ClusterModelCache(CLUSTER_CACHE_DIR, max_entries=CLUSTER_CACHE_MAX_ENTRIES,
+                                  max_bytes=CLUSTER_CACHE_MAX_MB * 1024 ** 2)
 prizm_analyzer = PRIZMAnalyzer()
 
 # Data loading status
 try:
-    print(f"✅ Loaded synthetic data with {len(data_retriever.data)} records from: {SYNTHETIC_DATA_PATH}")
+    print(f"✅ Loaded synthetic data with {dataset_registry.current_version()['n_rows']} records from: {SYNTHETIC_DATA_PATH}")
 except Exception as e:
     print(f"⚠️ Warning: Could not load data: {e}")
 
@@ -238,37 +248,38 @@ def process_nl_request():
                     confirmed_codes = [v['code'] for v in state.suggested_variables[:7]]
                 
                 # Fetch data and cluster
-                data_df = data_retriever.fetch_data(confirmed_codes)
+                with dataset_registry.acquire() as data_retriever:
+                    data_df = data_retriever.fetch_data(confirmed_codes)
+                    fingerprint = data_retriever.get_fingerprint()
                 
                 if data_df.empty:
                     return jsonify({'error': 'No data available'}), 400
                 
-                # Apply clustering
-                cluster_labels = clusterer.fit_predict(data_df)
+                # Apply clustering (reusing a cached model for this variable set when available)
+                cluster_labels = cluster_with_cache(data_df, confirmed_codes, fingerprint)
                 data_df['Group'] = cluster_labels
                 
-                # Calculate statistics
-                result_df = data_df.sort_values('Group').reset_index(drop=True)
-                group_stats = result_df.groupby('Group').size()
-                group_pcts = (group_stats / len(result_df) * 100).round(2)
+                # Group rows by label with a counting sort instead of sorting the frame
+                grouped = GroupedFrame(data_df, cluster_labels)
+                group_pcts = (grouped.sizes / len(data_df) * 100).round(2)
+                group_characteristics = analyze_groups_characteristics(grouped)
+                # PRIZM distribution for every group from one cross-tab
+                prizm_info = (prizm_analyzer.analyze_segment_distribution(data_df[['Group', 'PRIZM_SEGMENT']])
+                              if 'PRIZM_SEGMENT' in data_df.columns else {})
                 
                 # Create segments with descriptive names
                 segments = []
-                for group_id in sorted(result_df['Group'].unique()):
-                    group_data = result_df[result_df['Group'] == group_id]
-                    
+                for (group_id, rows), pct in zip(grouped, group_pcts):
                     segment = {
                         'group_id': int(group_id),
-                        'size': len(group_data),
-                        'size_percentage': float(group_pcts[group_id]),
-                        'characteristics': analyze_group_characteristics(group_data)
+                        'size': len(rows),
+                        'size_percentage': float(pct),
+                        'characteristics': group_characteristics[group_id]
                     }
                     
                     # Add PRIZM if available
-                    if 'PRIZM_SEGMENT' in group_data.columns:
-                        prizm_info = prizm_analyzer.analyze_segment_distribution(group_data)
-                        if 'segment_profiles' in prizm_info and str(group_id) in prizm_info['segment_profiles']:
-                            segment['prizm_profile'] = prizm_info['segment_profiles'][str(group_id)]
+                    if 'segment_profiles' in prizm_info and str(group_id) in prizm_info['segment_profiles']:
+                        segment['prizm_profile'] = prizm_info['segment_profiles'][str(group_id)]
                     
                     segments.append(segment)
                 
@@ -279,7 +290,8 @@ def process_nl_request():
                 audience_id = str(uuid.uuid4())
                 state.audience_id = audience_id
                 state.segments = segments
-                state.data = result_df
+                state.data = data_df
+                state.grouped = grouped
                 state.current_step = 'complete'
                 state.export_ready = True
                 
@@ -289,7 +301,7 @@ def process_nl_request():
                 return jsonify({
                     'status': 'complete',
                     'segments': segments,
-                    'total_records': len(result_df),
+                    'total_records': len(data_df),
                     'variables_used': confirmed_codes,
                     'audience_id': audience_id,
                     'data_type': state.data_type,
@@ -306,39 +318,40 @@ def process_nl_request():
             print(f"Confirming variables: {confirmed_codes}")
             
             # Fetch data and cluster
-            data_df = data_retriever.fetch_data(confirmed_codes)
+            with dataset_registry.acquire() as data_retriever:
+                data_df = data_retriever.fetch_data(confirmed_codes)
+                fingerprint = data_retriever.get_fingerprint()
             
             if data_df.empty:
                 return jsonify({'error': 'No data available for selected variables'}), 400
             
             print(f"Fetched data shape: {data_df.shape}")
             
-            # Apply clustering
-            cluster_labels = clusterer.fit_predict(data_df)
+            # Apply clustering (reusing a cached model for this variable set when available)
+            cluster_labels = cluster_with_cache(data_df, confirmed_codes, fingerprint)
             data_df['Group'] = cluster_labels
             
-            # Calculate statistics
-            result_df = data_df.sort_values('Group').reset_index(drop=True)
-            group_stats = result_df.groupby('Group').size()
-            group_pcts = (group_stats / len(result_df) * 100).round(2)
+            # Group rows by label with a counting sort instead of sorting the frame
+            grouped = GroupedFrame(data_df, cluster_labels)
+            group_pcts = (grouped.sizes / len(data_df) * 100).round(2)
+            group_characteristics = analyze_groups_characteristics(grouped)
+            # PRIZM distribution for every group from one cross-tab
+            prizm_info = (prizm_analyzer.analyze_segment_distribution(data_df[['Group', 'PRIZM_SEGMENT']])
+                          if 'PRIZM_SEGMENT' in data_df.columns else {})
             
             # Create segments with descriptive names
             segments = []
-            for group_id in sorted(result_df['Group'].unique()):
-                group_data = result_df[result_df['Group'] == group_id]
-                
+            for (group_id, rows), pct in zip(grouped, group_pcts):
                 segment = {
                     'group_id': int(group_id),
-                    'size': len(group_data),
-                    'size_percentage': float(group_pcts[group_id]),
-                    'characteristics': analyze_group_characteristics(group_data)
+                    'size': len(rows),
+                    'size_percentage': float(pct),
+                    'characteristics': group_characteristics[group_id]
                 }
                 
                 # Add PRIZM if available
-                if 'PRIZM_SEGMENT' in group_data.columns:
-                    prizm_info = prizm_analyzer.analyze_segment_distribution(group_data)
-                    if 'segment_profiles' in prizm_info and str(group_id) in prizm_info['segment_profiles']:
-                        segment['prizm_profile'] = prizm_info['segment_profiles'][str(group_id)]
+                if 'segment_profiles' in prizm_info and str(group_id) in prizm_info['segment_profiles']:
+                    segment['prizm_profile'] = prizm_info['segment_profiles'][str(group_id)]
                 
                 segments.append(segment)
             
@@ -349,7 +362,8 @@ def process_nl_request():
             audience_id = str(uuid.uuid4())
             state.audience_id = audience_id
             state.segments = segments
-            state.data = result_df
+            state.data = data_df
+            state.grouped = grouped
             state.current_step = 'complete'
             state.export_ready = True
             
@@ -359,7 +373,7 @@ def process_nl_request():
             return jsonify({
                 'status': 'complete',
                 'segments': segments,
-                'total_records': len(result_df),
+                'total_records': len(data_df),
                 'variables_used': confirmed_codes,
                 'audience_id': audience_id,
                 'data_type': state.data_type,
@@ -372,37 +386,55 @@ def process_nl_request():
         print(f"Error processing request: {e}")
         return jsonify({'error': str(e)}), 500
 
+def cluster_with_cache(data_df: pd.DataFrame, variable_codes: List[str], fingerprint: Optional[str]) -> np.ndarray:
+    """Cluster data_df, returning cached labels when the same variables were clustered on the dataset version"""
+    key = cluster_cache.make_key(variable_codes, CLUSTER_PARAMS, fingerprint) if fingerprint else None
+    
+    if key:
+        entry = cluster_cache.get(key)
+        if entry is not None and len(entry['labels']) == len(data_df):
+            print(f"Using cached cluster model for {len(variable_codes)} variables")
+            return entry['labels']
+    
+    clusterer = ConstrainedKMedians(**CLUSTER_PARAMS)
+    cluster_labels = clusterer.fit_predict(data_df)
+    if key:
+        cluster_cache.put(key, cluster_labels, clusterer.cluster_centers_, clusterer.feature_layout_)
+    return cluster_labels
+
 def analyze_group_characteristics(group_data: pd.DataFrame) -> Dict[str, Any]:
     """Analyze characteristics of a group"""
+    if group_data.empty:
+        return {}
+    grouped = GroupedFrame(group_data, np.zeros(len(group_data), dtype=int))
+    return analyze_groups_characteristics(grouped)[0]
+
+def analyze_groups_characteristics(grouped: GroupedFrame) -> Dict[Any, Dict[str, Any]]:
+    """Analyze characteristics of every group in one pass over the result frame"""
     characteristics = {}
-    
-    for col in group_data.columns:
-        if col == 'Group':
-            continue
-            
-        if group_data[col].dtype == 'object' or group_data[col].dtype == 'category':
-            # Categorical variable
-            value_counts = group_data[col].value_counts()
-            mode_value = value_counts.index[0] if len(value_counts) > 0 else 'Unknown'
-            mode_pct = (value_counts.iloc[0] / len(group_data) * 100) if len(value_counts) > 0 else 0
-            
-            characteristics[col] = {
-                'type': 'categorical',
-                'dominant_value': str(mode_value),
-                'dominant_percentage': round(mode_pct, 1),
-                'distribution': value_counts.head(5).to_dict()
-            }
-        else:
-            # Numeric variable
-            characteristics[col] = {
-                'type': 'numeric',
-                'mean': round(float(group_data[col].mean()), 2),
-                'median': round(float(group_data[col].median()), 2),
-                'std': round(float(group_data[col].std()), 2),
-                'min': round(float(group_data[col].min()), 2),
-                'max': round(float(group_data[col].max()), 2)
-            }
-    
+    profiles = profile_groups(grouped, exclude=['Group'])
+    for group_id, size in zip(grouped.group_ids, grouped.sizes.tolist()):
+        characteristics[group_id] = {}
+        for col, stats in profiles[group_id].items():
+            if stats['type'] == 'categorical':
+                # Categorical variable
+                has_values = stats['dominant_value'] is not None
+                characteristics[group_id][col] = {
+                    'type': 'categorical',
+                    'dominant_value': str(stats['dominant_value']) if has_values else 'Unknown',
+                    'dominant_percentage': round(stats['dominant_count'] / size * 100, 1) if has_values else 0,
+                    'distribution': stats['distribution']
+                }
+            else:
+                # Numeric variable
+                characteristics[group_id][col] = {
+                    'type': 'numeric',
+                    'mean': round(stats['mean'], 2),
+                    'median': round(stats['median'], 2),
+                    'std': round(stats['std'], 2),
+                    'min': round(stats['min'], 2),
+                    'max': round(stats['max'], 2)
+                }
     return characteristics
 
 @app.route('/api/export/<audience_id>', methods=['GET'])
@@ -447,8 +479,11 @@ def export_audience(audience_id):
                 output.write(f"# - {segment_name}: {seg['size']} records ({seg['size_percentage']:.1f}%)\n")
             output.write("#\n")
         
-        # Write data
-        state.data.to_csv(output, index=False)
+        # Write data in group order, one group at a time
+        if getattr(state, 'grouped', None) is not None:
+            state.grouped.to_csv(output, index=False)
+        else:
+            state.data.to_csv(output, index=False)
         
         # Create response
         output.seek(0)
@@ -469,11 +504,27 @@ def health_check():
         'status': 'healthy',
         'components': {
             'variable_selector': 'ready',
-            'data_retriever': 'ready' if data_retriever.data is not None else 'no_data',
-            'sessions_active': len(sessions)
-        }
+            'data_retriever': 'ready' if dataset_registry.current_version() else 'no_data',
+            'sessions_active': len(sessions),
+            'cluster_cache': cluster_cache.stats()
+        },
+        'dataset': dataset_registry.stats()
     })
 
+@app.route('/api/data/reload', methods=['POST'])
+def reload_data():
+    """
+    Reload SYNTHETIC_DATA_PATH as a new dataset version in the background;
+    requests keep using the current one until it is ready. Admin only.
+    """
+    supplied = request.headers.get('X-Admin-Token', '')
+    if not ADMIN_TOKEN or not hmac.compare_digest(supplied.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({'error': 'Forbidden'}), 403
+    if not os.path.exists(SYNTHETIC_DATA_PATH):
+        return jsonify({'error': 'Data file not found'}), 400
+    dataset_registry.reload_async(SYNTHETIC_DATA_PATH)
+    return jsonify({'status': 'reloading', 'current': dataset_registry.current_version()}), 202
+
 @app.route('/api/distribute', methods=['POST'])
 def distribute_audience():
     """Handle audience distribution to platforms"""
@@ -6,6 +6,8 @@ Combines EnhancedVariableSelector and PRIZMAnalyzer into the workflow
 from enhanced_variable_selector_v2 import EnhancedVariableSelectorV2
 from prizm_analyzer import PRIZMAnalyzer
 from audience_builder import DataRetriever, ConstrainedKMedians
+from segment_profiler import GroupedFrame, profile_groups
+import io
 import json
 import pandas as pd
 from typing import Dict, Any, List, Optional
@@ -24,6 +26,7 @@ class WorkflowState:
         self.suggested_variables = []
         self.confirmed_variables = []
         self.data = None
+        self.grouped = None
         self.segments = []
         self.timestamp = datetime.now()
 
@@ -235,30 +238,28 @@ Be conversational and confirm understanding at each step."""
         cluster_labels = self.clusterer.fit_predict(data)
         data['Group'] = cluster_labels
         
-        # Calculate statistics
-        result = data.sort_values('Group').reset_index(drop=True)
-        group_stats = result.groupby('Group').size()
-        group_pcts = (group_stats / len(result) * 100).round(2)
+        # Group rows by label with a counting sort instead of sorting the frame
+        grouped = GroupedFrame(data, cluster_labels)
+        group_pcts = (grouped.sizes / len(data) * 100).round(2)
         
         # Create detailed segment profiles
         segments = []
         
         # Check if we have PRIZM data
-        has_prizm = 'PRIZM_CLUSTER' in result.columns
+        has_prizm = 'PRIZM_CLUSTER' in data.columns
         prizm_insights = None
         
         if has_prizm:
             # Analyze with PRIZM
-            prizm_insights = self.prizm_analyzer.analyze_segment_distribution(result)
+            prizm_insights = self.prizm_analyzer.analyze_segment_distribution(data)
         
-        for group_id in sorted(result['Group'].unique()):
-            group_data = result[result['Group'] == group_id]
-            
+        group_characteristics = self._analyze_groups_characteristics(grouped)
+        for (group_id, rows), pct in zip(grouped, group_pcts):
             segment = {
                 "group_id": int(group_id),
-                "size": len(group_data),
-                "size_percentage": float(group_pcts[group_id]),
-                "characteristics": self._analyze_group_characteristics(group_data),
+                "size": len(rows),
+                "size_percentage": float(pct),
+                "characteristics": group_characteristics[group_id],
             }
             
             # Add PRIZM insights if available
@@ -268,13 +269,14 @@ Be conversational and confirm understanding at each step."""
             segments.append(segment)
         
         self.state.segments = segments
-        self.state.data = result
+        self.state.data = data
+        self.state.grouped = grouped
         self.state.current_step = 'complete'
         
         response = {
             "status": "complete",
             "segments": segments,
-            "total_records": len(result),
+            "total_records": len(data),
             "variables_used": self.state.confirmed_variables,
             "message": f"Successfully created {len(segments)} audience segments"
         }
@@ -289,32 +291,37 @@ Be conversational and confirm understanding at each step."""
         """
         Analyze characteristics of a group
         """
+        if group_data.empty:
+            return {}
+        grouped = GroupedFrame(group_data, [0] * len(group_data))
+        return self._analyze_groups_characteristics(grouped)[0]
+    
+    def _analyze_groups_characteristics(self, grouped: GroupedFrame) -> Dict[Any, Dict[str, Any]]:
+        """
+        Analyze characteristics of every group in one pass
+        """
         characteristics = {}
-        
-        for col in group_data.columns:
-            if col == 'Group':
-                continue
-                
-            if group_data[col].dtype == 'object' or group_data[col].dtype == 'category':
-                # Categorical variable
-                value_counts = group_data[col].value_counts()
-                mode_value = value_counts.index[0]
-                mode_pct = (value_counts.iloc[0] / len(group_data) * 100)
-                
-                characteristics[col] = {
-                    "type": "categorical",
-                    "dominant_value": mode_value,
-                    "dominant_percentage": round(mode_pct, 1),
-                    "distribution": value_counts.to_dict()
-                }
-            else:
-                # Numeric variable
-                characteristics[col] = {
-                    "type": "numeric",
-                    "mean": round(group_data[col].mean(), 2),
-                    "median": round(group_data[col].median(), 2),
-                    "std": round(group_data[col].std(), 2)
-                }
+        profiles = profile_groups(grouped, exclude=['Group'], top_k=None)
+        
+        for group_id, size in zip(grouped.group_ids, grouped.sizes.tolist()):
+            characteristics[group_id] = {}
+            for col, stats in profiles[group_id].items():
+                if stats['type'] == 'categorical':
+                    # Categorical variable
+                    characteristics[group_id][col] = {
+                        "type": "categorical",
+                        "dominant_value": stats['dominant_value'],
+                        "dominant_percentage": round(stats['dominant_count'] / size * 100, 1),
+                        "distribution": stats['distribution']
+                    }
+                else:
+                    # Numeric variable
+                    characteristics[group_id][col] = {
+                        "type": "numeric",
+                        "mean": round(stats['mean'], 2),
+                        "median": round(stats['median'], 2),
+                        "std": round(stats['std'], 2)
+                    }
         
         return characteristics
     
@@ -326,7 +333,12 @@ Be conversational and confirm understanding at each step."""
             return {"error": "No results to export"}
         
         if format == "csv":
-            return self.state.data.to_csv(index=False)
+            if self.state.grouped is None or self.state.grouped.data is not self.state.data:
+                return self.state.data.to_csv(index=False)
+            # Write in group order, one group at a time
+            output = io.StringIO()
+            self.state.grouped.to_csv(output, index=False)
+            return output.getvalue()
         elif format == "json":
             export_data = {
                 "segments": self.state.segments,
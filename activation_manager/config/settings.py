@@ -22,6 +22,8 @@ class Settings:
         # API Keys (from environment variables)
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
         self.anthropic_api_key = os.getenv('ANTHROPIC_API_KEY')
+        # Required in the X-Admin-Token header by admin endpoints; unset disables them
+        self.admin_token = os.getenv('ADMIN_TOKEN')
         
         # Database settings
         self.database_url = os.getenv('DATABASE_URL', 'sqlite:///activation_manager.db')
@@ -48,6 +50,16 @@ class Settings:
         self.min_cluster_size_pct = 0.05  # 5%
         self.max_cluster_size_pct = 0.10  # 10%
         
+        # Data storage: 'csv' keeps the full table in memory, 'parquet'/'feather' read columns on demand
+        self.data_storage = os.getenv('DATA_STORAGE', 'parquet')
+        self.data_downcast = os.getenv('DATA_DOWNCAST', 'true').lower() == 'true'
+        self.dataset_manifest_path = os.getenv('DATASET_MANIFEST_PATH', str(self.activation_manager_dir / "cache" / "dataset_manifest.json"))
+        
+        # Cluster model cache settings
+        self.cluster_cache_dir = os.getenv('CLUSTER_CACHE_DIR', str(self.activation_manager_dir / "cache" / "cluster_models"))
+        self.cluster_cache_max_entries = int(os.getenv('CLUSTER_CACHE_MAX_ENTRIES', 32))
+        self.cluster_cache_max_mb = int(os.getenv('CLUSTER_CACHE_MAX_MB', 256))
+        
         # Export settings
         self.export_chunk_size = 10000
         
@@ -123,5 +135,12 @@ API_PORT = settings.port
 API_DEBUG = settings.debug
 MIN_CLUSTER_SIZE_PCT = settings.min_cluster_size_pct
 MAX_CLUSTER_SIZE_PCT = settings.max_cluster_size_pct
+DATA_STORAGE = settings.data_storage
+DATA_DOWNCAST = settings.data_downcast
+DATASET_MANIFEST_PATH = settings.dataset_manifest_path
+ADMIN_TOKEN = settings.admin_token
+CLUSTER_CACHE_DIR = settings.cluster_cache_dir
+CLUSTER_CACHE_MAX_ENTRIES = settings.cluster_cache_max_entries
+CLUSTER_CACHE_MAX_MB = settings.cluster_cache_max_mb
 EXPORT_CHUNK_SIZE = settings.export_chunk_size
 SESSION_TIMEOUT_MINUTES = settings.session_timeout_minutes
\ No newline at end of file
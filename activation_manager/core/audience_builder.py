@@ -4,20 +4,58 @@ Natural language interface for audience segmentation using Claude
 """
 
 import json
+import hashlib
 import numpy as np
 import pandas as pd
 import os
+import shutil
 from typing import List, Dict, Any, Tuple, Optional
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from functools import lru_cache
+from sklearn.cluster import KMeans, kmeans_plusplus
+from scipy import sparse
+from scipy.optimize import linprog
+from scipy.spatial.distance import cdist
+import time
+import threading
+import tracemalloc
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from threadpoolctl import threadpool_limits
 warnings.filterwarnings('ignore')
 
+try:
+    from .cluster_quality import CRITERIA as QUALITY_CRITERIA, constraint_violations
+except ImportError:
+    from cluster_quality import CRITERIA as QUALITY_CRITERIA, constraint_violations
+
+try:
+    from .segment_profiler import GroupedFrame, profile_groups, partition_median, grouped_medians
+except ImportError:
+    from segment_profiler import GroupedFrame, profile_groups, partition_median, grouped_medians
+
 
 class VariableSelector:
     """
     Analyzes user requirements and selects relevant variables from available dataset
+    
+    Requests are scored against an index built at construction: postings
+    from every lower-cased description token to the variables using it,
+    with the vocabulary joined into one string so a request word is matched
+    against each distinct token once, plus the variables of each type for
+    the keyword boosts. Scoring a request only touches the postings of its
+    words and boosted types, so it does not scan the catalog.
     """
+    # Request keywords that boost every variable of a type
+    KEYWORD_MAPPINGS = {
+        "demographic": ["age", "gender", "location", "urban", "city", "rural", "postal", "geographic"],
+        "behavioral": ["purchase", "buy", "engage", "active", "frequent", "habit", "activity", "usage"],
+        "financial": ["income", "disposable", "spending", "affluent", "budget", "wealth", "money", "economic"],
+        "psychographic": ["lifestyle", "values", "interests", "conscious", "preference", "attitude", "opinion"]
+    }
+    MAX_SUGGESTIONS = 15
+    WORD_CACHE_SIZE = 4096
+    
     def __init__(self, variable_catalog: Dict[str, Dict[str, Any]]):
         """
         Initialize with a catalog of available variables
@@ -27,53 +65,78 @@ class VariableSelector:
         """
         self.catalog = variable_catalog
         self.selected_variables = []
+        self._build_index()
+    
+    def _build_index(self):
+        """
+        Precompute the token postings and type rows used by analyze_request
         
+        Call again after changing catalog.
+        """
+        self._codes = list(self.catalog)
+        types = [info.get("type", "") for info in self.catalog.values()]
+        self._types = types
+        postings = {}
+        for row, info in enumerate(self.catalog.values()):
+            for token in set(info.get("description", "").lower().split()):
+                postings.setdefault(token, []).append(row)
+        # Tokens never contain whitespace, so a newline separator never occurs inside one
+        self._vocabulary_text = '\n'.join(postings)
+        self._token_offsets = np.cumsum([0] + [len(token) + 1 for token in postings])
+        self._postings = [np.array(rows, dtype=np.intp) for rows in postings.values()]
+        self._type_rows = {category: np.array([row for row, var_type in enumerate(types) if var_type == category],
+                                              dtype=np.intp)
+                           for category in self.KEYWORD_MAPPINGS}
+        self._word_rows = {}
+    
     def analyze_request(self, user_request: str) -> List[Dict[str, Any]]:
         """
         Parse user request and identify relevant variables
-        """
-        # Keywords mapping to variable types
-        keyword_mappings = {
-            "demographic": ["age", "gender", "location", "urban", "city", "rural", "postal", "geographic"],
-            "behavioral": ["purchase", "buy", "engage", "active", "frequent", "habit", "activity", "usage"],
-            "financial": ["income", "disposable", "spending", "affluent", "budget", "wealth", "money", "economic"],
-            "psychographic": ["lifestyle", "values", "interests", "conscious", "preference", "attitude", "opinion"]
-        }
         
-        # Score each variable based on relevance
-        variable_scores = []
+        A variable scores 2 for every keyword of its type found in the
+        request, plus 1 for every request word longer than three characters
+        found in its description.
+        """
         request_lower = user_request.lower()
+        scores = np.zeros(len(self._codes), dtype=np.int64)
         
-        for var_code, var_info in self.catalog.items():
-            score = 0
-            var_type = var_info.get("type", "")
-            var_desc = var_info.get("description", "").lower()
-            
-            # Check if variable type matches request keywords
-            for category, keywords in keyword_mappings.items():
-                if var_type == category:
-                    for keyword in keywords:
-                        if keyword in request_lower:
-                            score += 2
-                            
-            # Check if variable description matches request
-            request_words = request_lower.split()
-            for word in request_words:
-                if len(word) > 3 and word in var_desc:
-                    score += 1
-                    
-            if score > 0:
-                variable_scores.append({
-                    "code": var_code,
-                    "type": var_type,
-                    "description": var_info["description"],
-                    "score": score
-                })
-        
-        # Sort by score and return top relevant variables
-        variable_scores.sort(key=lambda x: x["score"], reverse=True)
-        return variable_scores[:15]  # Return top 15 most relevant
+        # Check if variable type matches request keywords
+        for category, keywords in self.KEYWORD_MAPPINGS.items():
+            boost = 2 * sum(keyword in request_lower for keyword in keywords)
+            if boost:
+                scores[self._type_rows[category]] += boost
+        
+        # Check if variable description matches request
+        for word in request_lower.split():
+            if len(word) > 3:
+                scores[self._rows_containing(word)] += 1
+        
+        # Sort by score (ties keep catalog order) and return top relevant variables
+        candidates = np.flatnonzero(scores)
+        top = candidates[np.argsort(-scores[candidates], kind='stable')][:self.MAX_SUGGESTIONS]
+        return [{
+            "code": self._codes[row],
+            "type": self._types[row],
+            "description": self.catalog[self._codes[row]]["description"],
+            "score": int(scores[row])
+        } for row in top]
     
+    def _rows_containing(self, word: str) -> np.ndarray:
+        """Rows of the variables whose description contains word"""
+        rows = self._word_rows.get(word)
+        if rows is None:
+            # A word without whitespace is in a description only if it is inside one of its tokens
+            tokens = []
+            start = self._vocabulary_text.find(word)
+            while start != -1:
+                token = np.searchsorted(self._token_offsets, start, side='right') - 1
+                tokens.append(self._postings[token])
+                start = self._vocabulary_text.find(word, self._token_offsets[token + 1])
+            rows = np.unique(np.concatenate(tokens)) if tokens else np.empty(0, dtype=np.intp)
+            if len(self._word_rows) < self.WORD_CACHE_SIZE:
+                self._word_rows[word] = rows
+        return rows
+        
     def confirm_selection(self, selected_codes: List[str]) -> Dict[str, Any]:
         """Store confirmed variable selection"""
         self.selected_variables = selected_codes
@@ -83,65 +146,1007 @@ class VariableSelector:
 class DataRetriever:
     """
     Retrieves data values for selected variables
+    
+    With storage="parquet" or "feather" the CSV is converted once to a
+    columnar file next to it, and fetch_data reads only the requested
+    columns from that file instead of holding the whole table in memory.
+    storage="npy" instead writes one .npy file per column plus a manifest
+    and serves fetch_data from read-only memory maps, so selected columns
+    are not copied and worker processes share the OS page cache. Text
+    columns are stored as category codes. storage="csv" (or a missing
+    pyarrow) keeps the in-memory CSV path.
+    
+    fetch_data accepts filters, a list of (column, op, value) tuples that
+    are all required to hold (see FILTER_OPS and bounding_box). They are
+    evaluated on the filter columns first, skipping Parquet row groups and
+    npy blocks whose min/max statistics rule them out, and only matching
+    rows of the requested columns are materialised.
+    
+    sample_size draws sampling="random" rows by default. "stratified"
+    keeps the mix of stratify_by (PRIZM_SEGMENT or FSA) with proportional
+    quotas, "hash" keeps the rows whose PostalCode hashes lowest so the
+    same postal codes are picked on every run, and "reservoir" samples in a
+    single pass over chunk_size chunks, reading the CSV directly if it has
+    not been loaded.
+    
+    fetch_by_postal_codes looks rows up through a sorted PostalCode index
+    (row offsets per code and per FSA prefix) saved next to the data file
+    the first time it is needed.
+    
+    Derived files (the columnar copy and postal index) are named after the
+    data file plus version_tag when one is given, so a new version of a file
+    rewritten in place never overwrites files an older retriever is still
+    reading; close(remove_derived=True) deletes them.
+    
+    With downcast=True the CSV is read with a compact schema: postal codes
+    and PRIZM segments as category, coordinates as float32, index columns
+    (values inside the generator's INDEX_PARAMS range) as uint16 and other
+    integers as the smallest type that holds them.
     """
-    def __init__(self, data_path: Optional[str] = None):
+    STORAGE_FORMATS = ('csv', 'parquet', 'feather', 'npy')
+    MANIFEST_NAME = 'manifest.json'
+    CATEGORY_COLUMNS = ('PostalCode', 'PRIZM_SEGMENT', 'FSA')
+    FLOAT32_COLUMNS = ('LATITUDE', 'LONGITUDE')
+    FILTER_OPS = ('==', '!=', '<', '<=', '>', '>=', 'in', 'not in')
+    ROW_GROUP_SIZE = 16384
+    SAMPLING_MODES = ('random', 'stratified', 'hash', 'reservoir')
+    STRATIFY_COLUMNS = ('PRIZM_SEGMENT', 'FSA')
+    POSTAL_INDEX_SUFFIX = '_postal_index.npz'
+    
+    def __init__(self, data_path: Optional[str] = None, storage: str = 'csv',
+                 downcast: bool = False, index_range: Optional[Tuple[int, int]] = None,
+                 chunk_size: int = 10000, version_tag: Optional[str] = None):
+        if storage not in self.STORAGE_FORMATS:
+            raise ValueError(f"Unknown storage format: {storage}. Expected one of {self.STORAGE_FORMATS}")
         self.data_path = data_path
+        self.storage = storage
+        self.downcast = downcast
+        # The generator config is only needed to size index columns, so it is not read unless downcasting
+        self.index_range = index_range or (_load_index_range() if downcast else None)
+        self.chunk_size = chunk_size
+        self.version_tag = version_tag
+        self.derived_paths = []
         self.data = None
+        self.columnar_path = None
+        self.columns = None
+        self.n_rows = None
+        self.fingerprint = None
+        self._manifest = None
+        self._manifest_block_rows = None
+        self._column_views = {}
+        self._postal_index = None
+        
+    def load_data(self, path: str = None) -> Optional[pd.DataFrame]:
+        """
+        Load data from CSV file
         
-    def load_data(self, path: str = None) -> pd.DataFrame:
-        """Load data from CSV file"""
+        In columnar mode only the schema is read and None is returned; the
+        values stay on disk until fetch_data asks for specific columns.
+        """
         if path:
             self.data_path = path
         if not self.data_path:
             raise ValueError("No data path provided. Cannot load data.")
         if not os.path.exists(self.data_path):
             raise FileNotFoundError(f"Data file not found: {self.data_path}")
-        self.data = pd.read_csv(self.data_path)
+        self._postal_index = None
+        stat = os.stat(self.data_path)
+        self.fingerprint = hashlib.sha256(
+            f"{os.path.abspath(self.data_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8')
+        ).hexdigest()
+        
+        columnar_path = None
+        # Columnar files and column store directories are used directly whatever the storage setting
+        if (self.storage != 'csv' or os.path.isdir(self.data_path)
+                or self.data_path.lower().endswith(('.parquet', '.feather'))):
+            columnar_path = self._prepare_columnar(self.data_path)
+        if columnar_path:
+            self.columnar_path = columnar_path
+            self.data = None
+            self.columns, self.n_rows = self._read_schema(columnar_path)
+            return None
+        
+        self.columnar_path = None
+        self.data = self._read_csv(self.data_path)
+        self.columns = list(self.data.columns)
+        self.n_rows = len(self.data)
         return self.data
+    
+    def is_loaded(self) -> bool:
+        """Whether data is available in memory or as a columnar file"""
+        return self.data is not None or self.columnar_path is not None
+
+    def close(self, remove_derived: bool = False):
+        """
+        Drop the in-memory frame, memory maps and postal index; load_data() reopens the data
         
-    def fetch_data(self, variable_codes: List[str], sample_size: int = None, include_special_columns: bool = True) -> pd.DataFrame:
+        With remove_derived the columnar copy and postal index built from the
+        data file are deleted as well.
+        """
+        self.data = None
+        self.columnar_path = None
+        self._manifest = None
+        self._column_views = {}
+        self._postal_index = None
+        if remove_derived:
+            for path in self.derived_paths:
+                try:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    elif os.path.exists(path):
+                        os.remove(path)
+                except OSError as e:
+                    print(f"Warning: Could not remove {path}: {e}")
+            self.derived_paths = []
+    
+    def _derived_path(self, suffix: str) -> str:
+        """Path of a file derived from the data file, tagged with version_tag; recorded for close()"""
+        base = os.path.splitext(self.data_path.rstrip(os.sep))[0]
+        if self.version_tag:
+            base = f"{base}.{self.version_tag}"
+        path = base + suffix
+        if path not in self.derived_paths:
+            self.derived_paths.append(path)
+        return path
+
+    def get_fingerprint(self) -> Optional[str]:
+        """
+        Identify the loaded dataset for caching
+        
+        Uses the file's path, size and modification time when loaded from disk,
+        otherwise hashes the in-memory frame.
+        """
+        if self.fingerprint is not None or self.data is None:
+            return self.fingerprint
+        row_hashes = pd.util.hash_pandas_object(self.data, index=False).to_numpy()
+        digest = hashlib.sha256(row_hashes.tobytes())
+        digest.update(','.join(map(str, self.data.columns)).encode('utf-8'))
+        self.fingerprint = digest.hexdigest()
+        return self.fingerprint
+        
+    def fetch_data(self, variable_codes: List[str], sample_size: int = None, include_special_columns: bool = True,
+                   filters: Optional[List[Tuple[str, str, Any]]] = None, sampling: str = 'random',
+                   stratify_by: str = 'PRIZM_SEGMENT') -> pd.DataFrame:
         """
         Fetch data for selected variables
+        
+        With filters only matching rows are returned (re-indexed from 0),
+        and sampling applies to the matching rows. Stratified, hash and
+        reservoir samples are returned in file order, re-indexed from 0.
         """
-        if self.data is None:
+        if sampling not in self.SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode: {sampling}. Expected one of {self.SAMPLING_MODES}")
+        if sampling == 'stratified' and stratify_by not in self.STRATIFY_COLUMNS:
+            raise ValueError(f"Cannot stratify by {stratify_by}. Expected one of {self.STRATIFY_COLUMNS}")
+        streaming = bool(sample_size) and sampling == 'reservoir'
+        
+        if not self.is_loaded():
             if not self.data_path:
                 raise AttributeError("No data loaded. Call load_data() first.")
-            self.load_data()
+            if not (streaming and self.storage == 'csv'):
+                self.load_data()
+        
+        if self.is_loaded():
+            data_columns = set(self.data.columns if self.data is not None else self.columns)
+        else:
+            # Reservoir sampling streams the CSV without loading it; only the header is needed
+            data_columns = set(pd.read_csv(self.data_path, nrows=0).columns)
+            
+        available_columns = self._resolve_columns(variable_codes, data_columns, include_special_columns)
+        
+        # If no columns found, return empty DataFrame
+        if not available_columns:
+            return pd.DataFrame()
+        
+        if filters:
+            self._validate_filters(filters, data_columns)
+        
+        if sample_size and sampling == 'reservoir':
+            return self._reservoir_sample(available_columns, sample_size, filters)
+        
+        if sample_size and sampling in ('stratified', 'hash'):
+            rows = self._matching_rows(filters) if filters else None
+            if sampling == 'stratified':
+                keys = self._stratum_keys(stratify_by, data_columns, rows)
+                chosen = self._stratified_positions(keys, sample_size)
+            else:
+                if 'PostalCode' not in data_columns:
+                    raise ValueError("Hash sampling needs a PostalCode column")
+                chosen = self._hash_positions(self._take_rows(['PostalCode'], rows)['PostalCode'], sample_size)
+            return self._take_rows(available_columns, chosen if rows is None else rows[chosen])
+        
+        if filters:
+            selected = self._read_filtered(available_columns, filters)
+        elif self.data is not None:
+            selected = self.data[available_columns]
+        else:
+            selected = self._read_columns(available_columns)
+        
+        # Sample data if requested
+        if sample_size and sample_size < len(selected):
+            sampled_data = selected.sample(n=sample_size, random_state=42)
+        else:
+            sampled_data = selected
             
+        return sampled_data
+    
+    def fetch_by_postal_codes(self, postal_codes, variable_codes: Optional[List[str]] = None,
+                              include_special_columns: bool = True) -> pd.DataFrame:
+        """
+        Fetch the rows for a list of postal codes or FSAs through the postal index
+        
+        Codes are matched ignoring case and spaces; three-character entries
+        match every postal code in that FSA. All codes are looked up at once
+        with a binary search over the sorted index, so the cost grows with
+        the number of matches rather than the size of the data. Matching rows
+        are returned once each, in file order, re-indexed from 0.
+        """
+        if not self.is_loaded():
+            self.load_data()
+        data_columns = set(self.data.columns if self.data is not None else self.columns)
+        if 'PostalCode' not in data_columns:
+            raise ValueError("Postal code lookups need a PostalCode column")
+        available_columns = self._resolve_columns(variable_codes or [], data_columns, include_special_columns)
+        if not available_columns:
+            return pd.DataFrame()
+        
+        index = self._get_postal_index()
+        queries = self._normalize_postal_codes(postal_codes)
+        queries = queries[queries.str.len() > 0]
+        is_fsa = queries.str.len().to_numpy() == 3
+        rows = [self._index_lookup(index['postal_keys'], index['postal_starts'], index['rows'],
+                                   queries[~is_fsa].to_numpy(dtype=str)),
+                self._index_lookup(index['fsa_keys'], index['fsa_starts'], index['rows'],
+                                   queries[is_fsa].to_numpy(dtype=str))]
+        return self._take_rows(available_columns, np.unique(np.concatenate(rows)))
+    
+    @staticmethod
+    def _normalize_postal_codes(codes) -> pd.Series:
+        """Upper-case postal codes with whitespace removed (missing codes become empty)"""
+        codes = pd.Series(codes, dtype=object).fillna('').astype(str)
+        return codes.str.upper().str.replace(r'\s+', '', regex=True)
+    
+    @staticmethod
+    def _index_lookup(keys: np.ndarray, starts: np.ndarray, rows: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """Row offsets for every query found in a sorted key array with run starts"""
+        if len(queries) == 0 or len(keys) == 0:
+            return np.array([], dtype=rows.dtype)
+        positions = np.searchsorted(keys, queries)
+        found = positions < len(keys)
+        found[found] = keys[positions[found]] == queries[found]
+        positions = np.unique(positions[found])
+        begins, ends = starts[positions], starts[positions + 1]
+        lengths = ends - begins
+        # Expand each [begin, end) run into its offsets without a Python loop
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return rows[np.repeat(begins, lengths) + offsets]
+    
+    def _get_postal_index(self) -> Dict[str, np.ndarray]:
+        """
+        Load the postal index, building and saving it next to the data file if missing or stale
+        
+        Row offsets are sorted by normalised postal code; postal_starts and
+        fsa_starts mark where each code and each FSA prefix begins, so both
+        share one offsets array.
+        """
+        if self._postal_index is not None:
+            return self._postal_index
+        target = self._derived_path(self.POSTAL_INDEX_SUFFIX) if self.data_path else None
+        if target and os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(self.data_path):
+            with np.load(target) as stored:
+                self._postal_index = {name: stored[name] for name in stored.files}
+            return self._postal_index
+        
+        codes = self._normalize_postal_codes(self._take_rows(['PostalCode'])['PostalCode'].to_numpy(dtype=object))
+        codes = codes.to_numpy(dtype=str)
+        rows = np.argsort(codes, kind='stable')
+        sorted_codes = codes[rows]
+        postal_keys, postal_starts = np.unique(sorted_codes, return_index=True)
+        # Sorting by full code also sorts by FSA prefix, so FSA runs are unions of postal code runs
+        fsa_keys, fsa_starts = np.unique(sorted_codes.astype('<U3'), return_index=True)
+        index = {
+            'rows': rows.astype(np.min_scalar_type(max(len(rows) - 1, 0))),
+            'postal_keys': postal_keys,
+            'postal_starts': np.r_[postal_starts, len(rows)],
+            'fsa_keys': fsa_keys,
+            'fsa_starts': np.r_[fsa_starts, len(rows)]
+        }
+        if target:
+            tmp_path = f"{target}.{os.getpid()}.tmp.npz"
+            try:
+                np.savez(tmp_path, **index)
+                os.replace(tmp_path, target)
+            except OSError as e:
+                print(f"Warning: Could not write postal index {target}: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        self._postal_index = index
+        return index
+    
+    def iter_chunks(self, variable_codes: List[str], filters: Optional[List[Tuple[str, str, Any]]] = None,
+                    include_special_columns: bool = True):
+        """
+        Stream the selected variables as a generator of column-projected frames
+        
+        CSV files are read chunk_size rows at a time without loading them,
+        Parquet stores one row group at a time (skipping row groups whose
+        statistics rule out the filters), and other stores are sliced into
+        chunk_size-row frames. Filters are applied to each chunk; chunks
+        keep their file-order row positions as the index.
+        """
+        if not self.is_loaded() and not self.data_path:
+            raise AttributeError("No data loaded. Call load_data() first.")
+        if not self.is_loaded() and self.storage != 'csv':
+            self.load_data()
+        
+        if self.is_loaded():
+            data_columns = set(self.data.columns if self.data is not None else self.columns)
+        else:
+            data_columns = set(pd.read_csv(self.data_path, nrows=0).columns)
+        columns = self._resolve_columns(variable_codes, data_columns, include_special_columns)
+        if not columns:
+            return
+        if filters:
+            self._validate_filters(filters, data_columns)
+        
+        for chunk in self._iter_chunks(columns, filters):
+            yield chunk
+    
+    @staticmethod
+    def _resolve_columns(variable_codes: List[str], data_columns, include_special_columns: bool) -> List[str]:
+        """Requested columns present in the data, or the special columns when none are"""
         # Select columns that exist in the data
         available_columns = []
         for code in variable_codes:
-            if code in self.data.columns:
+            if code in data_columns:
                 available_columns.append(code)
         
         # Include special columns only if requested and no specific variables were provided
         if include_special_columns and (not variable_codes or len(available_columns) == 0):
             for col in ['PostalCode', 'PRIZM_SEGMENT', 'LATITUDE', 'LONGITUDE']:
-                if col in self.data.columns and col not in available_columns:
+                if col in data_columns and col not in available_columns:
                     available_columns.append(col)
+        return available_columns
+    
+    @staticmethod
+    def bounding_box(lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> List[Tuple[str, str, float]]:
+        """Filters selecting rows whose LATITUDE/LONGITUDE fall inside the box (inclusive)"""
+        return [('LATITUDE', '>=', lat_min), ('LATITUDE', '<=', lat_max),
+                ('LONGITUDE', '>=', lon_min), ('LONGITUDE', '<=', lon_max)]
+    
+    def _validate_filters(self, filters, data_columns):
+        """Reject malformed filters before any data is read"""
+        for condition in filters:
+            if len(condition) != 3:
+                raise ValueError(f"Filters must be (column, op, value) tuples, got {condition}")
+            column, op, value = condition
+            if op not in self.FILTER_OPS:
+                raise ValueError(f"Unknown filter operator: {op}. Expected one of {self.FILTER_OPS}")
+            if column not in data_columns:
+                raise ValueError(f"Filter column not found in data: {column}")
+            if op in ('in', 'not in') and isinstance(value, str):
+                raise ValueError(f"Filter '{op}' on {column} needs a list of values")
+    
+    @staticmethod
+    def _filter_mask(values: pd.Series, op: str, value) -> np.ndarray:
+        """Boolean mask of rows in values satisfying one filter"""
+        if op == 'in':
+            return values.isin(list(value)).to_numpy()
+        if op == 'not in':
+            return ~values.isin(list(value)).to_numpy()
+        if op == '==':
+            return (values == value).to_numpy()
+        if op == '!=':
+            return (values != value).to_numpy()
+        if op == '<':
+            return (values < value).to_numpy()
+        if op == '<=':
+            return (values <= value).to_numpy()
+        if op == '>':
+            return (values > value).to_numpy()
+        return (values >= value).to_numpy()
+    
+    def _read_filtered(self, columns: List[str], filters) -> pd.DataFrame:
+        """
+        Evaluate filters on their own columns, then materialise only matching rows
+        """
+        if self.data is None and self.storage == 'parquet':
+            # Row groups are pruned with their statistics, but rows are kept with the same pandas
+            # masks as the other stores (pyarrow filters drop nulls from != and not in)
+            chunks = list(self._iter_chunks(columns, filters))
+            if not chunks:
+                import pyarrow.parquet as pq
+                return pq.read_schema(self.columnar_path).empty_table().select(columns).to_pandas()
+            return pd.concat(chunks, ignore_index=True)
+        return self._take_rows(columns, self._matching_rows(filters))
+    
+    def _matching_rows(self, filters) -> np.ndarray:
+        """Positions of the rows matching every filter"""
+        if self.data is None and self.storage == 'npy':
+            return self._matching_rows_npy(filters)
+        source = self._take_rows(list(dict.fromkeys(col for col, _, _ in filters)))
+        mask = np.ones(len(source), dtype=bool)
+        for col, op, value in filters:
+            mask &= self._filter_mask(source[col], op, value)
+        return np.flatnonzero(mask)
+    
+    def _take_rows(self, columns: List[str], rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """
+        Columns for the given row positions (all rows when None) from whichever store holds the data
         
-        # If no columns found, return empty DataFrame
-        if not available_columns:
-            return pd.DataFrame()
+        Selected rows are re-indexed from 0; only those rows of the columns
+        are materialised for the in-memory, npy and feather stores.
+        """
+        if self.data is not None:
+            if rows is None:
+                return self.data[columns]
+            return self.data.iloc[rows, self.data.columns.get_indexer(columns)].reset_index(drop=True)
+        if rows is None:
+            return self._read_columns(columns)
+        if self.storage == 'npy':
+            return pd.DataFrame({col: self.column_view(col)[rows] for col in columns})
+        if self.storage == 'feather':
+            import pyarrow as pa
+            table = pa.ipc.open_file(pa.memory_map(self.columnar_path)).read_all()
+            return table.select(columns).take(pa.array(rows)).to_pandas()
+        return self._read_columns(columns).iloc[rows].reset_index(drop=True)
+    
+    def _stratum_keys(self, stratify_by: str, data_columns, rows: Optional[np.ndarray]) -> pd.Series:
+        """Stratum of each row; FSA falls back to the first three characters of PostalCode"""
+        if stratify_by in data_columns:
+            return self._take_rows([stratify_by], rows)[stratify_by]
+        if stratify_by == 'FSA' and 'PostalCode' in data_columns:
+            return self._take_rows(['PostalCode'], rows)['PostalCode'].astype(str).str[:3]
+        raise ValueError(f"Cannot stratify by {stratify_by}: column not found in data")
+    
+    @staticmethod
+    def _stratified_positions(strata: pd.Series, sample_size: int) -> np.ndarray:
+        """
+        Positions of a proportional stratified sample of sample_size rows
         
-        # Sample data if requested
-        if sample_size and sample_size < len(self.data):
-            sampled_data = self.data[available_columns].sample(n=sample_size, random_state=42)
+        Quotas are rounded with the largest remainder method so they sum to
+        exactly sample_size; rows within a stratum are chosen at random.
+        """
+        n_rows = len(strata)
+        if sample_size >= n_rows:
+            return np.arange(n_rows)
+        codes = pd.factorize(strata, use_na_sentinel=False)[0]
+        counts = np.bincount(codes)
+        exact = sample_size * counts / n_rows
+        quotas = np.floor(exact).astype(int)
+        shortfall = sample_size - quotas.sum()
+        quotas[np.argsort(quotas - exact, kind='stable')[:shortfall]] += 1
+        
+        rng = np.random.default_rng(42)
+        shuffled = rng.permutation(n_rows)
+        order = shuffled[np.argsort(codes[shuffled], kind='stable')]
+        sorted_codes = codes[order]
+        rank = np.arange(n_rows) - np.searchsorted(sorted_codes, sorted_codes, side='left')
+        return np.sort(order[rank < quotas[sorted_codes]])
+    
+    @staticmethod
+    def _hash_positions(postal_codes: pd.Series, sample_size: int) -> np.ndarray:
+        """Positions of the sample_size rows whose postal code hashes lowest (stable across runs)"""
+        if sample_size >= len(postal_codes):
+            return np.arange(len(postal_codes))
+        hashes = pd.util.hash_array(postal_codes.astype(str).to_numpy(dtype=object))
+        return np.sort(np.argpartition(hashes, sample_size - 1)[:sample_size])
+    
+    def _iter_chunks(self, columns: List[str], filters=None):
+        """
+        Yield frames of the given columns in file order, keeping only rows matching filters
+        
+        Reads straight from the CSV when nothing is loaded, one row group at
+        a time from Parquet, and chunk_size-row slices of the memory maps or
+        the in-memory frame otherwise. Each frame is indexed by row position.
+        """
+        filter_columns = [col for col, _, _ in filters or [] if col not in columns]
+        read_columns = columns + list(dict.fromkeys(filter_columns))
+        
+        if not self.is_loaded():
+            text_columns = {col: str for col in self.CATEGORY_COLUMNS if col in read_columns}
+            reader = pd.read_csv(self.data_path, usecols=read_columns, dtype=text_columns or None,
+                                 chunksize=self.chunk_size)
+            chunks = ((self._downcast_chunk(chunk) if self.downcast else chunk) for chunk in reader)
+        elif self.data is None and self.storage == 'parquet':
+            chunks = self._iter_row_groups(read_columns, filters)
         else:
-            sampled_data = self.data[available_columns]
+            n_rows = len(self.data) if self.data is not None else self.n_rows
+            bounds = ((start, min(start + self.chunk_size, n_rows)) for start in range(0, n_rows, self.chunk_size))
+            chunks = (self._take_rows(read_columns, np.arange(start, stop)).set_axis(pd.RangeIndex(start, stop))
+                      for start, stop in bounds)
+        
+        for chunk in chunks:
+            if filters:
+                mask = np.ones(len(chunk), dtype=bool)
+                for col, op, value in filters:
+                    mask &= self._filter_mask(chunk[col], op, value)
+                chunk = chunk[mask]
+            yield chunk[columns]
+    
+    def _iter_row_groups(self, columns: List[str], filters=None):
+        """Yield Parquet row groups as frames, skipping groups whose min/max statistics exclude a filter"""
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(self.columnar_path)
+        metadata = parquet_file.metadata
+        schema_names = [metadata.schema.column(i).path for i in range(metadata.num_columns)]
+        offset = 0
+        for group in range(metadata.num_row_groups):
+            row_group = metadata.row_group(group)
+            n_group = row_group.num_rows
+            candidate = True
+            for col, op, value in filters or []:
+                statistics = row_group.column(schema_names.index(col)).statistics
+                if statistics is None or not statistics.has_min_max:
+                    continue
+                targets = value if op in ('in', 'not in') else [value]
+                bounds = (statistics.min, statistics.max)
+                if not all(isinstance(v, (int, float, np.number)) for v in list(bounds) + list(targets)):
+                    continue
+                candidate &= bool(self._blocks_may_match(np.array([bounds[0]], dtype=float),
+                                                         np.array([bounds[1]], dtype=float), op, targets)[0])
+            if candidate:
+                chunk = parquet_file.read_row_group(group, columns=columns).to_pandas()
+                yield chunk.set_axis(np.arange(offset, offset + n_group))[columns]
+            offset += n_group
+    
+    def _reservoir_sample(self, columns: List[str], sample_size: int, filters=None) -> pd.DataFrame:
+        """
+        Uniform sample of sample_size matching rows in one pass over the chunks (Algorithm R)
+        
+        Each chunk is processed with vectorised draws; at most sample_size
+        rows are held at any time.
+        """
+        rng = np.random.default_rng(42)
+        slot_rows = np.full(sample_size, -1)
+        kept = None
+        seen = 0
+        
+        for chunk in self._iter_chunks(columns, filters):
+            n_chunk = len(chunk)
+            if n_chunk == 0:
+                continue
+            positions = seen + np.arange(n_chunk)
+            # Row i fills slot i until the reservoir is full, then replaces slot j ~ U[0, i] if j < sample_size
+            slots = np.where(positions < sample_size, positions,
+                             rng.integers(0, positions + 1))
+            accepted = np.flatnonzero(slots < sample_size)
+            # Later rows in the chunk overwrite earlier ones drawn for the same slot
+            _, last = np.unique(slots[accepted][::-1], return_index=True)
+            winners = accepted[::-1][last]
+            slot_rows[slots[winners]] = positions[winners]
             
-        return sampled_data
+            accepted_rows = chunk.iloc[winners].set_axis(positions[winners])
+            kept = accepted_rows if kept is None else pd.concat([kept, accepted_rows])
+            kept = kept[kept.index.isin(slot_rows)]
+            seen += n_chunk
+        
+        if kept is None:
+            return pd.DataFrame(columns=columns)
+        return kept.sort_index().reset_index(drop=True)
+    
+    def _matching_rows_npy(self, filters) -> np.ndarray:
+        """Row positions in the npy store matching every filter, skipping blocks by min/max"""
+        block_rows = self._manifest_block_rows
+        starts = np.arange(0, self.n_rows, block_rows) if block_rows else np.array([0])
+        candidate = np.ones(len(starts), dtype=bool)
+        
+        for col, op, value in filters:
+            entry = self._manifest[col]
+            if 'block_min' not in entry or op in ('!=', 'not in'):
+                continue
+            lows, highs = np.asarray(entry['block_min'], dtype=float), np.asarray(entry['block_max'], dtype=float)
+            targets = value if op in ('in', 'not in') else [value]
+            if 'categories' in entry:
+                if op not in ('==', 'in'):
+                    continue
+                # Compare category codes; values not in the store can never match
+                positions = {name: code for code, name in enumerate(entry['categories'])}
+                targets = [positions[str(v)] for v in targets if str(v) in positions]
+            candidate &= self._blocks_may_match(lows, highs, op, targets)
+        
+        matches = []
+        for start in starts[candidate]:
+            stop = min(start + (block_rows or self.n_rows), self.n_rows)
+            mask = np.ones(stop - start, dtype=bool)
+            for col, op, value in filters:
+                mask &= self._filter_mask(pd.Series(self.column_view(col)[start:stop]), op, value)
+            matches.append(start + np.flatnonzero(mask))
+        return np.concatenate(matches) if matches else np.array([], dtype=int)
+    
+    @staticmethod
+    def _blocks_may_match(lows: np.ndarray, highs: np.ndarray, op: str, targets) -> np.ndarray:
+        """Which blocks with the given min/max could hold a row matching one filter"""
+        targets = np.sort(np.asarray(targets, dtype=float))
+        if op in ('==', 'in'):
+            if len(targets) == 0:
+                return np.zeros(len(lows), dtype=bool)
+            first = np.searchsorted(targets, lows, side='left')
+            last = np.searchsorted(targets, highs, side='right')
+            return last > first
+        if op == '<':
+            return lows < targets[0]
+        if op == '<=':
+            return lows <= targets[0]
+        if op == '>':
+            return highs > targets[0]
+        if op == '>=':
+            return highs >= targets[0]
+        return np.ones(len(lows), dtype=bool)
+    
+    def _read_csv(self, path: str) -> pd.DataFrame:
+        """
+        Read the CSV, applying the compact schema when downcast is enabled
+        
+        Rows are read in chunks and each chunk's integer columns are
+        downcast after checking their range, so the full int64 frame never
+        exists at once. Chunks that need a wider type are widened again
+        when the chunks are concatenated.
+        """
+        if not self.downcast:
+            return pd.read_csv(path)
+        
+        header = pd.read_csv(path, nrows=0).columns
+        text_columns = {col: str for col in self.CATEGORY_COLUMNS if col in header}
+        chunks = [self._downcast_chunk(chunk)
+                  for chunk in pd.read_csv(path, dtype=text_columns, chunksize=self.chunk_size)]
+        if not chunks:
+            return pd.read_csv(path)
+        data = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+        for col in text_columns:
+            data[col] = data[col].astype('category')
+        return data
+    
+    def _downcast_chunk(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Shrink one chunk's numeric columns to the compact schema"""
+        columns = chunk.columns
+        parts = {}
+        for col in self.FLOAT32_COLUMNS:
+            if col in columns and pd.api.types.is_float_dtype(chunk[col]):
+                parts[col] = chunk[col].astype(np.float32)
+        
+        integers = chunk.select_dtypes(include=['integer'])
+        if len(integers.columns) > 0:
+            lows, highs = integers.min(), integers.max()
+            targets = pd.Series(
+                [_smallest_integer_dtype(low, high) for low, high in zip(lows, highs)],
+                index=integers.columns, dtype=object
+            )
+            if self.index_range:
+                # Index variables share one dtype sized for the whole configured range
+                index_low, index_high = self.index_range
+                in_range = (lows >= index_low) & (highs <= index_high)
+                targets[in_range] = _smallest_integer_dtype(index_low, index_high)
+            for dtype, group in targets.groupby(targets.map(str)).groups.items():
+                parts.update(integers[list(group)].astype(dtype).items())
+        
+        if not parts:
+            return chunk
+        untouched = [col for col in columns if col not in parts]
+        parts.update(chunk[untouched].items())
+        return pd.DataFrame(parts, columns=columns)
+    
+    def _prepare_columnar(self, path: str) -> Optional[str]:
+        """
+        Return a columnar copy of path, converting the CSV on first use
+        
+        The copy is rebuilt when the CSV is newer. Returns None (CSV fallback)
+        when pyarrow is not installed or the file cannot be written.
+        """
+        if os.path.isdir(path) and os.path.exists(os.path.join(path, self.MANIFEST_NAME)):
+            self.storage = 'npy'
+            return path
+        extension = os.path.splitext(path)[1].lower().lstrip('.')
+        if extension in ('parquet', 'feather'):
+            self.storage = extension
+            return path
+        
+        if self.storage == 'npy':
+            target = self._derived_path('_columns')
+            manifest_path = os.path.join(target, self.MANIFEST_NAME)
+            if os.path.exists(manifest_path) and os.path.getmtime(manifest_path) >= os.path.getmtime(path):
+                return target
+            return self._write_column_store(path, target)
+        
+        target = self._derived_path(f".{self.storage}")
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+            return target
+        
+        try:
+            import pyarrow  # noqa: F401 - required by pandas for both formats
+        except ImportError:
+            print("Warning: pyarrow is not installed, falling back to CSV storage")
+            return None
+        
+        print(f"Converting {path} to {self.storage} (one-time)...")
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        try:
+            data = self._read_csv(path)
+            if self.storage == 'parquet':
+                # Small row groups so filters can skip most of the file using the statistics
+                data.to_parquet(tmp_path, index=False, row_group_size=self.ROW_GROUP_SIZE)
+            else:
+                # Uncompressed so reads can be memory-mapped without decoding
+                data.reset_index(drop=True).to_feather(tmp_path, compression='uncompressed')
+            os.replace(tmp_path, target)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not write {target}, falling back to CSV storage: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        return target
+    
+    def column_view(self, code: str):
+        """
+        Read-only memory-mapped view of one column of the npy store
+        
+        Numeric columns come back as NumPy views; text columns as a
+        Categorical whose codes are the mapped array.
+        """
+        if self._manifest is None:
+            raise AttributeError("No column store loaded. Use storage='npy' and call load_data() first.")
+        if code not in self._column_views:
+            entry = self._manifest[code]
+            values = np.load(os.path.join(self.columnar_path, entry['file']), mmap_mode='r')
+            if 'categories' in entry:
+                values = pd.Categorical.from_codes(values, categories=entry['categories'])
+            self._column_views[code] = values
+        return self._column_views[code]
+    
+    def _write_column_store(self, path: str, target: str) -> Optional[str]:
+        """
+        Convert the CSV to one .npy file per column plus a JSON manifest
+        
+        Numeric and boolean columns keep their dtype; everything else is
+        stored as the smallest integer category codes, with the categories
+        in the manifest. The directory is built beside the target and
+        renamed into place.
+        """
+        print(f"Converting {path} to a memory-mapped column store (one-time)...")
+        tmp_dir = f"{target}.{os.getpid()}.tmp"
+        try:
+            data = self._read_csv(path)
+            os.makedirs(tmp_dir, exist_ok=True)
+            columns = []
+            for i, col in enumerate(data.columns):
+                entry = {'name': str(col), 'file': f"{i:05d}.npy"}
+                series = data[col]
+                if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+                    values = series.to_numpy()
+                else:
+                    categorical = pd.Categorical(series)
+                    values = categorical.codes
+                    entry['categories'] = [str(c) for c in categorical.categories]
+                np.save(os.path.join(tmp_dir, entry['file']), np.ascontiguousarray(values))
+                entry['dtype'] = str(values.dtype)
+                if len(values) > 0 and values.dtype.kind in 'iuf':
+                    # Per-block min/max (ignoring NaN) used to skip blocks when filtering
+                    starts = np.arange(0, len(values), self.ROW_GROUP_SIZE)
+                    entry['block_min'] = np.fmin.reduceat(values, starts).tolist()
+                    entry['block_max'] = np.fmax.reduceat(values, starts).tolist()
+                columns.append(entry)
+            with open(os.path.join(tmp_dir, self.MANIFEST_NAME), 'w') as f:
+                json.dump({'n_rows': len(data), 'block_rows': self.ROW_GROUP_SIZE, 'columns': columns}, f)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            os.rename(tmp_dir, target)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not write {target}, falling back to CSV storage: {e}")
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir)
+            return None
+        return target
+    
+    def _read_schema(self, path: str) -> Tuple[List[str], int]:
+        """Column names and row count of a columnar file without reading its values"""
+        if self.storage == 'npy':
+            with open(os.path.join(path, self.MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+            self._manifest = {entry['name']: entry for entry in manifest['columns']}
+            self._manifest_block_rows = manifest.get('block_rows')
+            self._column_views = {}
+            return [entry['name'] for entry in manifest['columns']], manifest['n_rows']
+        if self.storage == 'parquet':
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(path)
+            return parquet_file.schema_arrow.names, parquet_file.metadata.num_rows
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+            return table.column_names, table.num_rows
+    
+    def _read_columns(self, columns: List[str]) -> pd.DataFrame:
+        """Read only the given columns from the columnar file, in the requested order"""
+        if self.storage == 'npy':
+            # Built without copying, so every column stays backed by its memory map
+            return pd.DataFrame({col: self.column_view(col) for col in columns}, copy=False)
+        if self.storage == 'parquet':
+            data = pd.read_parquet(self.columnar_path, columns=columns)
+        else:
+            data = pd.read_feather(self.columnar_path, columns=columns)
+        return data[columns]
+
+
+@lru_cache(maxsize=1)
+def _load_index_range() -> Optional[Tuple[int, int]]:
+    """
+    (min_value, max_value) of generated index variables from Synthetic_Data/config.py
+    
+    Loaded by file path because the activation_manager package has its own
+    config module, and only once per process. None when the generator config
+    is not available.
+    """
+    config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                               'Synthetic_Data', 'config.py')
+    if not os.path.exists(config_path):
+        return None
+    import importlib.util
+    try:
+        spec = importlib.util.spec_from_file_location('synthetic_data_config', config_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.INDEX_PARAMS['min_value'], module.INDEX_PARAMS['max_value']
+    except Exception as e:
+        print(f"Warning: Could not read INDEX_PARAMS from {config_path}: {e}")
+        return None
+
+
+def _smallest_integer_dtype(low, high) -> np.dtype:
+    """Smallest NumPy integer dtype holding every value in [low, high]"""
+    candidates = (np.uint8, np.uint16, np.uint32) if low >= 0 else (np.int8, np.int16, np.int32)
+    for dtype in candidates:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+_TRACE_LOCK = threading.Lock()
+
+
+def _traced_peak_mb(func, *args):
+    """
+    Run func(*args) under tracemalloc and return (result, peak MB allocated during the call)
+    
+    NumPy buffers are traced too. Tracing is process-wide, so allocations by
+    other threads during the call are counted as well. The peak is None when
+    tracemalloc is already in use, e.g. by another measured call or a profiler.
+    """
+    if tracemalloc.is_tracing() or not _TRACE_LOCK.acquire(blocking=False):
+        return func(*args), None
+    try:
+        tracemalloc.start()
+        try:
+            result = func(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    finally:
+        _TRACE_LOCK.release()
+    return result, round(peak / 1024 ** 2, 2)
+
+
+def summarize_chunks(chunks) -> Dict[str, Dict[str, Any]]:
+    """
+    Column statistics over a stream of frames, such as DataRetriever.iter_chunks()
+    
+    Numeric columns report count, mean, std (ddof=1), min and max, merged
+    chunk by chunk with the pairwise update of Chan et al.; other columns
+    report the dominant value and its percentage from running value
+    counts. Only one chunk is held at a time. NaN is ignored.
+    """
+    moments, counts = {}, {}
+    for chunk in chunks:
+        for col in chunk.columns:
+            values = chunk[col]
+            if pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+                block = values.to_numpy(dtype=np.float64, na_value=np.nan)
+                block = block[~np.isnan(block)]
+                if col not in moments:
+                    moments[col] = [0, 0.0, 0.0, np.inf, -np.inf]
+                if len(block) == 0:
+                    continue
+                n, mean, m2, low, high = moments[col]
+                n_block, mean_block = len(block), block.mean()
+                m2_block = ((block - mean_block) ** 2).sum()
+                total = n + n_block
+                delta = mean_block - mean
+                moments[col] = [total, mean + delta * n_block / total,
+                                m2 + m2_block + delta ** 2 * n * n_block / total,
+                                min(low, block.min()), max(high, block.max())]
+            else:
+                block_counts = values.value_counts()
+                counts[col] = block_counts if col not in counts else counts[col].add(block_counts, fill_value=0)
+    
+    summary = {}
+    for col, (n, mean, m2, low, high) in moments.items():
+        summary[col] = {
+            'type': 'numeric',
+            'count': int(n),
+            'mean': float(mean) if n else np.nan,
+            'std': float(np.sqrt(m2 / (n - 1))) if n > 1 else np.nan,
+            'min': float(low) if n else np.nan,
+            'max': float(high) if n else np.nan
+        }
+    for col, value_counts in counts.items():
+        total = value_counts.sum()
+        summary[col] = {
+            'type': 'categorical',
+            'count': int(total),
+            'dominant_value': value_counts.idxmax() if total else None,
+            'dominant_percentage': float(value_counts.max() / total * 100) if total else 0.0
+        }
+    return summary
 
 
 class ConstrainedKMedians:
     """
     K-Medians clustering with size constraints (5-10% per cluster)
+    
+    By default clusters are seeded with KMeans and only summarised by their
+    medians. engine="kmedians" optimises the L1 objective directly, so the
+    clustering and _calculate_score agree; flow assignment then also uses
+    L1 point-to-median costs.
+    
+    Size constraints are enforced either by greedy bulk reassignment
+    (assignment="greedy") or by solving the capacity-constrained assignment
+    exactly as a transportation problem (assignment="flow"). Above
+    flow_max_points rows the flow solve runs on micro-clusters of points
+    that share their two nearest centroids and a similar distance margin.
+    
+    Candidate numbers of clusters are evaluated serially by default, or
+    concurrently on a process pool of n_jobs workers (-1 uses every core).
+    With search="warm" each k+1 run is instead seeded from the k solution by
+    splitting its worst cluster, and the sweep stops as soon as the score
+    improves by less than min_improvement (relative). The per-k timings and
+    the stopping reason are kept in search_report_.
+    
+    Above sample_size rows the k search runs on a uniform sample only, and
+    all rows are then assigned to the sample's centers in chunks of
+    chunk_size with the size constraints enforced.
+    
+    Each k is scored by criterion: "l1" (mean absolute deviation from the
+    cluster medians on all rows), or "silhouette" / "davies_bouldin"
+    computed on a fixed sample of quality_sample_size rows (see
+    cluster_quality). Constraint violations are recorded per candidate.
     """
-    def __init__(self, min_size_pct: float = 0.05, max_size_pct: float = 0.10):
+    ASSIGNMENT_MODES = ('greedy', 'flow')
+    SEARCH_STRATEGIES = ('full', 'warm')
+    ENGINES = ('kmeans', 'kmedians')
+    CRITERIA = ('l1',) + tuple(QUALITY_CRITERIA)
+    
+    def __init__(self, min_size_pct: float = 0.05, max_size_pct: float = 0.10,
+                 assignment: str = 'greedy', flow_max_points: int = 2000,
+                 n_jobs: Optional[int] = None, search: str = 'full',
+                 min_improvement: float = 0.01, sample_size: Optional[int] = None,
+                 chunk_size: int = 100000, engine: str = 'kmeans',
+                 criterion: str = 'l1', quality_sample_size: int = 2000):
+        if assignment not in self.ASSIGNMENT_MODES:
+            raise ValueError(f"Unknown assignment mode: {assignment}. Expected one of {self.ASSIGNMENT_MODES}")
+        if search not in self.SEARCH_STRATEGIES:
+            raise ValueError(f"Unknown search strategy: {search}. Expected one of {self.SEARCH_STRATEGIES}")
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine: {engine}. Expected one of {self.ENGINES}")
+        if criterion not in self.CRITERIA:
+            raise ValueError(f"Unknown criterion: {criterion}. Expected one of {self.CRITERIA}")
         self.min_size_pct = min_size_pct
         self.max_size_pct = max_size_pct
+        self.assignment = assignment
+        self.flow_max_points = flow_max_points
+        self.n_jobs = n_jobs
+        self.search = search
+        self.min_improvement = min_improvement
+        self.sample_size = sample_size
+        self.chunk_size = chunk_size
+        self.engine = engine
+        self.criterion = criterion
+        self.quality_sample_size = quality_sample_size
         self.labels_ = None
         self.cluster_centers_ = None
+        self.search_report_ = None
+        self.feature_layout_ = None
+        self.feature_report_ = None
+        self._encode_peak_mb = None
         
     def fit_predict(self, data: pd.DataFrame) -> np.ndarray:
         """
@@ -149,6 +1154,14 @@ class ConstrainedKMedians:
         """
         n_samples = len(data)
         
+        # Forget the previous fit so the early returns below never leave a stale model behind
+        self.labels_ = None
+        self.cluster_centers_ = None
+        self.search_report_ = None
+        self.feature_layout_ = None
+        self.feature_report_ = None
+        self._encode_peak_mb = None
+        
         # Handle empty data
         if n_samples == 0:
             return np.array([])
@@ -170,69 +1183,32 @@ class ConstrainedKMedians:
         min_clusters = max(1, int(np.ceil(n_samples / max_cluster_size)))
         max_clusters = max(1, int(np.floor(n_samples / min_cluster_size)))
         
-        # Handle both numeric and categorical data
-        # First, get numeric columns
-        numeric_columns = data.select_dtypes(include=[np.number]).columns
-        categorical_columns = data.select_dtypes(include=['object', 'category']).columns
-        
-        # Start with numeric data
-        data_for_clustering = []
-        
-        if len(numeric_columns) > 0:
-            data_for_clustering.append(data[numeric_columns])
+        # Encode numeric and categorical data into a single float32 feature layout
+        layout = self._fit_feature_layout(data)
+        self.feature_layout_ = layout
         
-        # Convert categorical to numeric using get_dummies
-        if len(categorical_columns) > 0:
-            categorical_dummies = pd.get_dummies(data[categorical_columns], drop_first=True)
-            if len(categorical_dummies.columns) > 0:
-                data_for_clustering.append(categorical_dummies)
-        
-        # Combine all data
-        if len(data_for_clustering) == 0:
+        # Handle case where no features exist after processing
+        if layout['n_features'] == 0:
             # No valid data for clustering - return single cluster
             return np.zeros(n_samples, dtype=int)
-        elif len(data_for_clustering) == 1:
-            data_numeric = data_for_clustering[0]
-        else:
-            data_numeric = pd.concat(data_for_clustering, axis=1)
         
-        # Handle case where no features exist after processing
-        if data_numeric.shape[1] == 0:
-            return np.zeros(n_samples, dtype=int)
+        candidate_ks = list(range(min_clusters, min(max_clusters + 1, 20)))
         
-        # Handle missing values
-        if data_numeric.isnull().any().any():
-            # Simple imputation - fill with median for numeric, mode for categorical
-            data_numeric = data_numeric.fillna(data_numeric.median())
-            # If still NaN (all NaN column), fill with 0
-            data_numeric = data_numeric.fillna(0)
+        # Large inputs: fit on a sample, then assign every row in one streaming pass
+        if self.sample_size and n_samples > self.sample_size:
+            best_labels = self._fit_predict_sampled(data, layout, candidate_ks,
+                                                    min_cluster_size, max_cluster_size)
+            self.feature_report_ = self._feature_report(n_samples, layout, self.sample_size)
+            self.labels_ = best_labels
+            return best_labels
         
-        # Standardize features
-        scaler = StandardScaler()
-        data_scaled = scaler.fit_transform(data_numeric)
+        # Impute, one-hot encode and standardize straight into one float32 matrix
+        data_scaled = self._encode_tracked(data, layout)
         
-        best_score = float('inf')
-        best_labels = None
+        best_labels = self._select_k(data_scaled, candidate_ks, min_cluster_size, max_cluster_size)
         
-        # Try different numbers of clusters
-        for n_clusters in range(min_clusters, min(max_clusters + 1, 20)):
-            # Initial clustering with K-Means (as approximation to K-Medians)
-            kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-            initial_labels = kmeans.fit_predict(data_scaled)
-            
-            # Apply size constraints through iterative reassignment
-            labels = self._apply_size_constraints(
-                data_scaled, initial_labels, n_clusters, 
-                min_cluster_size, max_cluster_size
-            )
-            
-            # Calculate clustering quality score
-            score = self._calculate_score(data_scaled, labels)
-            
-            if score < best_score:
-                best_score = score
-                best_labels = labels
-                self.cluster_centers_ = self._calculate_medians(data_scaled, labels)
+        if best_labels is not None:
+            self.cluster_centers_ = self._calculate_medians(data_scaled, best_labels)
                 
         # Ensure we always return valid labels
         if best_labels is None:
@@ -240,102 +1216,746 @@ class ConstrainedKMedians:
             best_labels = np.zeros(n_samples, dtype=int)
             self.cluster_centers_ = np.mean(data_scaled, axis=0).reshape(1, -1)
         
+        self.feature_report_ = self._feature_report(n_samples, layout, n_samples)
         self.labels_ = best_labels
         return best_labels
+
+    def transform(self, data: pd.DataFrame) -> np.ndarray:
+        """
+        Encode new rows with the fitted feature layout
+
+        Missing numeric values take the fitted medians, unseen categories
+        encode as the dropped baseline, and absent columns are treated as
+        entirely missing.
+        """
+        if self.feature_layout_ is None or self.cluster_centers_ is None:
+            raise AttributeError("Model is not fitted. Call fit_predict() first.")
+        layout = self.feature_layout_
+        missing = [col for col in list(layout['numeric_columns']) + list(layout['categories'])
+                   if col not in data.columns]
+        if missing:
+            data = data.assign(**{col: np.nan for col in missing})
+        return self._encode_features(data, layout)
+
+    def predict(self, data: pd.DataFrame, chunk_size: Optional[int] = None,
+                respect_capacity: bool = False) -> np.ndarray:
+        """
+        Assign new rows to the fitted clusters by L1 distance to their median centers
+
+        Rows are encoded and assigned chunk_size at a time (default
+        self.chunk_size). With respect_capacity=True each cluster only
+        accepts new rows up to max_size_pct of the fitted plus new rows, less
+        its fitted size; rows that fit nowhere go to their nearest cluster.
+        """
+        n_rows = len(data)
+        chunk_size = chunk_size or self.chunk_size
+        chunks = (data.iloc[start:start + chunk_size] for start in range(0, n_rows, chunk_size))
+        labels = list(self.predict_chunks(chunks, respect_capacity, total_rows=n_rows))
+        return np.concatenate(labels) if labels else np.array([], dtype=int)
+
+    def predict_chunks(self, chunks, respect_capacity: bool = False,
+                       total_rows: Optional[int] = None):
+        """
+        Assign a stream of frames to the fitted clusters, yielding one label array per chunk
+
+        Consumes any iterable of frames, such as DataRetriever.iter_chunks(),
+        encoding only one chunk at a time. respect_capacity works as in
+        predict() and needs total_rows, the number of rows the stream holds;
+        remaining capacity carries over from chunk to chunk.
+        """
+        if self.feature_layout_ is None or self.cluster_centers_ is None:
+            raise AttributeError("Model is not fitted. Call fit_predict() first.")
+        if respect_capacity and total_rows is None:
+            raise ValueError("respect_capacity needs total_rows for a stream of chunks")
+        centers = np.asarray(self.cluster_centers_, dtype=np.float32)
+
+        cluster_ids = np.arange(len(centers))
+        if self.labels_ is not None:
+            fitted_ids = np.unique(self.labels_)
+            if len(fitted_ids) == len(centers):
+                cluster_ids = fitted_ids
+
+        capacity = None
+        if respect_capacity and self.labels_ is not None:
+            fitted_sizes = np.array([np.sum(self.labels_ == cid) for cid in cluster_ids])
+            total = len(self.labels_) + total_rows
+            capacity = np.maximum(int(total * self.max_size_pct) - fitted_sizes, 0)
+
+        for chunk in chunks:
+            if len(chunk) == 0:
+                yield np.array([], dtype=cluster_ids.dtype)
+                continue
+            distances = self._l1_distances(self.transform(chunk), centers)
+            nearest = np.argmin(distances, axis=1)
+            if capacity is not None:
+                targets = self._assign_with_capacity(distances, capacity)
+                unplaced = targets < 0
+                targets[unplaced] = nearest[unplaced]
+                capacity -= np.bincount(targets[~unplaced], minlength=len(capacity))
+                nearest = targets
+            yield cluster_ids[nearest]
+
+    def _fit_feature_layout(self, data):
+        """
+        Learn the feature layout: numeric fill values, one-hot categories and scaling
+        
+        Numeric columns are imputed with their median (0 if entirely
+        missing); categorical columns are one-hot encoded with the first
+        category dropped, matching pd.get_dummies(drop_first=True). Means
+        and standard deviations are taken after imputation, one column at a
+        time, so no full-width copy of the frame is made.
+        """
+        numeric_columns = list(data.select_dtypes(include=[np.number]).columns)
+        categorical_columns = list(data.select_dtypes(include=['object', 'category']).columns)
+        
+        fill_values, centers, scales = [], [], []
+        for col in numeric_columns:
+            values = data[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            missing = np.isnan(values)
+            fill = 0.0
+            if missing.any():
+                fill = float(np.median(values[~missing])) if not missing.all() else 0.0
+                values = np.where(missing, fill, values)
+            fill_values.append(fill)
+            centers.append(values.mean())
+            scales.append(values.std())
+        
+        categories = {}
+        for col in categorical_columns:
+            column = pd.Categorical(data[col])
+            kept = list(column.categories[1:])
+            if not kept:
+                continue
+            categories[col] = kept
+            shares = np.bincount(column.codes[column.codes >= 1], minlength=len(column.categories))[1:] / len(data)
+            centers.extend(shares)
+            scales.extend(np.sqrt(shares * (1 - shares)))
+        
+        scales = np.asarray(scales, dtype=np.float64)
+        # Constant columns are left unscaled, as StandardScaler does
+        scales[scales == 0] = 1.0
+        return {
+            'numeric_columns': numeric_columns,
+            'fill_values': np.asarray(fill_values, dtype=np.float32),
+            'categories': categories,
+            'center': np.asarray(centers, dtype=np.float32),
+            'scale': scales.astype(np.float32),
+            'n_features': len(centers)
+        }
     
-    def _apply_size_constraints(self, data, labels, n_clusters, min_size, max_size):
+    @staticmethod
+    def _encode_features(data, layout):
         """
-        Iteratively reassign points to satisfy size constraints
+        Build the standardized float32 feature matrix for data in a single allocation
+        
+        Numeric values are copied into their columns, dummies are set directly
+        in preallocated columns, and imputation and scaling happen in place.
+        """
+        n_rows = len(data)
+        n_numeric = len(layout['numeric_columns'])
+        matrix = np.zeros((n_rows, layout['n_features']), dtype=np.float32)
+        
+        for j, col in enumerate(layout['numeric_columns']):
+            column = matrix[:, j]
+            column[:] = data[col].to_numpy(dtype=np.float32, na_value=np.nan)
+            column[np.isnan(column)] = layout['fill_values'][j]
+        
+        offset = n_numeric
+        rows = np.arange(n_rows)
+        for col, kept in layout['categories'].items():
+            # Code 0 is the dropped first category; unseen values and NaN stay all-zero
+            codes = pd.Categorical(data[col], categories=kept).codes
+            hits = codes >= 0
+            matrix[rows[hits], offset + codes[hits]] = 1.0
+            offset += len(kept)
+        
+        matrix -= layout['center']
+        matrix /= layout['scale']
+        return matrix
+    
+    def _encode_tracked(self, data, layout):
+        """_encode_features, keeping the largest allocation peak of any encode in this fit"""
+        matrix, peak = _traced_peak_mb(self._encode_features, data, layout)
+        if peak is not None:
+            self._encode_peak_mb = max(self._encode_peak_mb or 0.0, peak)
+        return matrix
+    
+    def _feature_report(self, n_rows, layout, encoded_rows):
+        """Size of the encoded feature matrix and the most memory one encode allocated at once"""
+        itemsize = np.dtype(np.float32).itemsize
+        return {
+            'rows': n_rows,
+            'features': layout['n_features'],
+            'dtype': 'float32',
+            'matrix_mb': round(encoded_rows * layout['n_features'] * itemsize / 1024 ** 2, 2),
+            'encode_peak_mb': self._encode_peak_mb
+        }
+    
+    def _select_k(self, data, candidate_ks, min_size, max_size):
+        """
+        Run the k search and return the best constrained labels (None if no k was tried)
+        
+        Records the per-k scores, timings and stopping reason in search_report_.
+        """
+        best_score = float('inf')
+        best_labels = None
+        report = {'search': self.search, 'criterion': self.criterion, 'candidates': [],
+                  'best_k': None, 'stop_reason': 'exhausted'}
+        
+        if self.search == 'warm':
+            sweep = self._warm_sweep_k(data, candidate_ks, min_size, max_size)
+        else:
+            sweep = self._sweep_k(data, candidate_ks, min_size, max_size)
+        
+        for n_clusters, score, labels, seconds in sweep:
+            report['candidates'].append({
+                'n_clusters': n_clusters,
+                'score': float(score),
+                'seconds': round(seconds, 4),
+                'violations': constraint_violations(labels, min_size, max_size)
+            })
+            improved = best_labels is None or score < best_score * (1 - self.min_improvement)
+            if score < best_score:
+                best_score = score
+                best_labels = labels
+                report['best_k'] = n_clusters
+            if self.search == 'warm' and not improved:
+                report['stop_reason'] = 'no_improvement'
+                break
+        
+        if not candidate_ks:
+            report['stop_reason'] = 'no_candidates'
+        self.search_report_ = report
+        return best_labels
+    
+    def _fit_predict_sampled(self, data, layout, candidate_ks, min_size, max_size):
+        """
+        Fit centers on a uniform sample of sample_size rows, then stream every row through them
+        
+        The sample is a uniformly weighted coreset (each row stands for
+        n / sample_size rows), so the size percentages carry over unchanged.
+        The full feature matrix is never materialised: only the sample and
+        one chunk at a time are encoded.
+        """
+        n_samples = len(data)
+        rng = np.random.default_rng(42)
+        sample_rows = np.sort(rng.choice(n_samples, self.sample_size, replace=False))
+        sample_scaled = self._encode_tracked(data.iloc[sample_rows], layout)
+        
+        sample_labels = self._select_k(sample_scaled, candidate_ks,
+                                       max(1, int(self.sample_size * self.min_size_pct)),
+                                       max(1, int(self.sample_size * self.max_size_pct)))
+        if sample_labels is None:
+            self.cluster_centers_ = sample_scaled.mean(axis=0).reshape(1, -1)
+            return np.zeros(n_samples, dtype=int)
+        
+        n_clusters = sample_labels.max() + 1
+        self.cluster_centers_ = self._calculate_medians(sample_scaled, sample_labels)
+        if self.engine == 'kmedians':
+            centers = self.cluster_centers_
+        else:
+            centers = self._cluster_means(sample_scaled, sample_labels, n_clusters)
+        self.search_report_['sample_size'] = self.sample_size
+        
+        return self._stream_assign(data, layout, centers, min_size, max_size, rng)
+    
+    def _stream_assign(self, data, layout, centers, min_size, max_size, rng):
+        """
+        Assign all rows to fixed centers in chunks while enforcing the size constraints
+        
+        Rows are visited in a random order so every chunk is representative.
+        After t rows, cluster c must hold between
+        floor((min_size * t * k + c * n) / (n * k)) and the matching staggered
+        ceiling of max_size * t / n. The staggered floors of all clusters sum
+        to floor(k * min_size * t / n), so as long as k * min_size <= n <= k *
+        max_size every chunk, however short, can meet its bounds, and after
+        the last chunk every cluster is inside [min_size, max_size]. Each
+        chunk is solved with the flow assignment, falling back to a greedy
+        placement that fills the lower bounds first.
         """
-        labels = labels.copy()
         n_samples = len(data)
+        n_clusters = len(centers)
+        labels = np.empty(n_samples, dtype=int)
+        assigned = np.zeros(n_clusters, dtype=int)
+        order = rng.permutation(n_samples)
+        offsets = np.arange(n_clusters) * n_samples
+        scale = n_samples * n_clusters
         
-        for iteration in range(10):  # Maximum iterations
-            cluster_sizes = np.bincount(labels, minlength=n_clusters)
+        for start in range(0, n_samples, self.chunk_size):
+            rows = order[start:start + self.chunk_size]
+            seen = start + len(rows)
+            chunk = self._encode_tracked(data.iloc[rows], layout)
             
+            lower = np.maximum((min_size * seen * n_clusters + offsets) // scale - assigned, 0)
+            upper = np.maximum(-((offsets - max_size * seen * n_clusters) // scale) - assigned, 0)
+            chunk_labels = self._flow_assignment(chunk, centers, lower, upper)
+            if chunk_labels is None:
+                chunk_labels = self._assign_with_bounds(self._center_distances(chunk, centers), lower, upper)
+            
+            labels[rows] = chunk_labels
+            assigned += np.bincount(chunk_labels, minlength=n_clusters)
+        
+        return labels
+    
+    def _assign_with_bounds(self, distances, lower, upper):
+        """
+        Greedily place every row, filling each column to lower before using capacity up to upper
+        
+        When the bounds cannot all be met, rows that fit nowhere go to their
+        nearest column, so no row is left unassigned.
+        """
+        targets = self._assign_with_capacity(distances, lower)
+        pending = np.flatnonzero(targets < 0)
+        if len(pending) > 0:
+            filled = np.bincount(targets[targets >= 0], minlength=len(lower))
+            targets[pending] = self._assign_with_capacity(distances[pending], upper - filled)
+            pending = np.flatnonzero(targets < 0)
+            targets[pending] = np.argmin(distances[pending], axis=1)
+        return targets
+    
+    def _evaluate_k(self, data, n_clusters, min_size, max_size, init=None):
+        """
+        Cluster into n_clusters, enforce size constraints and score the result
+        
+        When init centers are given KMeans runs once from them instead of
+        from 10 random initialisations. The kmedians engine always runs once,
+        from k-means++ seeds when no init is given.
+        """
+        if self.engine == 'kmedians':
+            initial_labels, centers = self._kmedians(data, n_clusters, init)
+        else:
+            # Initial clustering with K-Means (as approximation to K-Medians)
+            if init is None:
+                kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+            else:
+                kmeans = KMeans(n_clusters=n_clusters, init=init, random_state=42, n_init=1)
+            initial_labels = kmeans.fit_predict(data)
+            centers = kmeans.cluster_centers_
+        
+        # Apply size constraints, either exactly or through bulk reassignment
+        labels = None
+        if self.assignment == 'flow':
+            labels = self._flow_assignment(
+                data, centers,
+                min_size, max_size
+            )
+        if labels is None:
+            labels = self._apply_size_constraints(
+                data, initial_labels, n_clusters, 
+                min_size, max_size
+            )
+        
+        # Calculate clustering quality score
+        return self._calculate_score(data, labels), labels
+    
+    def _kmedians(self, data, n_clusters, init=None, n_init=3, max_iter=50):
+        """
+        Lloyd-style k-medians: alternate L1 assignment and coordinate-wise median updates
+        
+        Without init centers, runs n_init times from k-means++ seeds and keeps
+        the run with the lowest L1 objective. Returns (labels, centers).
+        """
+        if init is not None:
+            return self._kmedians_single(data, np.array(init, dtype=float), max_iter)
+        
+        best = None
+        for seed in range(n_init):
+            seeds, _ = kmeans_plusplus(data, n_clusters, random_state=42 + seed)
+            labels, centers, objective = self._kmedians_single(data, seeds, max_iter, return_objective=True)
+            if best is None or objective < best[2]:
+                best = (labels, centers, objective)
+        return best[0], best[1]
+    
+    def _kmedians_single(self, data, centers, max_iter, tol=1e-3, return_objective=False):
+        """One k-medians run from the given centers, stopping once at most tol of the labels change"""
+        labels = np.full(len(data), -1)
+        for iteration in range(max_iter):
+            distances = self._l1_distances(data, centers)
+            new_labels = np.argmin(distances, axis=1)
+            n_changed = np.count_nonzero(new_labels != labels)
+            labels = new_labels
+            if n_changed <= tol * len(data):
+                break
+            occupied, medians = grouped_medians(data, labels)
+            centers[occupied] = medians
+        
+        if return_objective:
+            objective = distances[np.arange(len(data)), labels].sum()
+            return labels, centers, objective
+        return labels, centers
+    
+    @staticmethod
+    def _l1_distances(data, centers):
+        """Manhattan distances from every point to every center"""
+        return cdist(data, centers, metric='cityblock')
+    
+    _partition_median = staticmethod(partition_median)
+    
+    def _center_distances(self, data, centers):
+        """Point-to-center costs in the engine's metric: L1 for kmedians, squared L2 for kmeans"""
+        if self.engine == 'kmedians':
+            return self._l1_distances(data, centers)
+        return self._squared_distances(data, centers)
+    
+    def _sweep_k(self, data, candidate_ks, min_size, max_size):
+        """
+        Evaluate every candidate k, yielding (k, score, labels, seconds) in k order
+        
+        With n_jobs > 1 the candidates run on a process pool. The scaled
+        matrix is placed in shared memory once and workers attach to it
+        instead of receiving a pickled copy per task.
+        """
+        n_jobs = self._effective_n_jobs(len(candidate_ks))
+        if n_jobs <= 1:
+            for n_clusters in candidate_ks:
+                start = time.perf_counter()
+                score, labels = self._evaluate_k(data, n_clusters, min_size, max_size)
+                yield n_clusters, score, labels, time.perf_counter() - start
+            return
+        
+        data = np.ascontiguousarray(data)
+        shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+        try:
+            np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[...] = data
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [
+                    executor.submit(_evaluate_k_shared, shm.name, data.shape, data.dtype.str,
+                                    self.get_params(), n_clusters, min_size, max_size)
+                    for n_clusters in candidate_ks
+                ]
+                for n_clusters, future in zip(candidate_ks, futures):
+                    score, labels, seconds = future.result()
+                    yield n_clusters, score, labels, seconds
+        finally:
+            shm.close()
+            shm.unlink()
+    
+    def _warm_sweep_k(self, data, candidate_ks, min_size, max_size):
+        """
+        Evaluate consecutive candidate k values, seeding each from the previous solution
+        
+        Only the first k is clustered from random initialisations; every
+        following k starts from the previous centers with the worst cluster
+        split in two. Runs serially since each k depends on the last.
+        """
+        centers = None
+        labels = None
+        for n_clusters in candidate_ks:
+            start = time.perf_counter()
+            init = None if centers is None else self._split_worst_cluster(data, labels, centers)
+            score, labels = self._evaluate_k(data, n_clusters, min_size, max_size, init=init)
+            centers = self._cluster_means(data, labels, n_clusters)
+            yield n_clusters, score, labels, time.perf_counter() - start
+    
+    @staticmethod
+    def _cluster_means(data, labels, n_clusters):
+        """Mean of each cluster, zero for empty clusters"""
+        sums = np.zeros((n_clusters, data.shape[1]))
+        np.add.at(sums, labels, data)
+        sizes = np.bincount(labels, minlength=n_clusters)
+        return sums / np.maximum(sizes, 1)[:, None]
+    
+    @staticmethod
+    def _split_worst_cluster(data, labels, centers):
+        """Replace the cluster with the largest squared error by a 2-means split of its points"""
+        errors = np.einsum('ij,ij->i', data - centers[labels], data - centers[labels])
+        worst = np.argmax(np.bincount(labels, weights=errors, minlength=len(centers)))
+        members = data[labels == worst]
+        if len(members) >= 2:
+            halves = KMeans(n_clusters=2, random_state=42, n_init=1).fit(members).cluster_centers_
+        else:
+            halves = np.vstack([centers[worst], data[np.argmax(errors)]])
+        return np.vstack([np.delete(centers, worst, axis=0), halves])
+    
+    def _effective_n_jobs(self, n_tasks):
+        """Resolve n_jobs (None, 1, -1 or a positive count) to a worker count"""
+        if self.n_jobs is None or n_tasks <= 1:
+            return 1
+        n_jobs = self.n_jobs if self.n_jobs > 0 else (os.cpu_count() or 1) + 1 + self.n_jobs
+        return max(1, min(n_jobs, n_tasks))
+    
+    def get_params(self) -> Dict[str, Any]:
+        """
+        Constructor arguments, used to rebuild the clusterer in worker
+        processes and to key cached models by their settings
+        """
+        return {
+            'min_size_pct': self.min_size_pct,
+            'max_size_pct': self.max_size_pct,
+            'assignment': self.assignment,
+            'flow_max_points': self.flow_max_points,
+            'search': self.search,
+            'min_improvement': self.min_improvement,
+            'sample_size': self.sample_size,
+            'chunk_size': self.chunk_size,
+            'engine': self.engine,
+            'criterion': self.criterion,
+            'quality_sample_size': self.quality_sample_size
+        }
+    
+    def _apply_size_constraints(self, data, labels, n_clusters, min_size, max_size):
+        """
+        Reassign points in bulk until cluster sizes satisfy the constraints
+
+        Keeps a running centroid/size table and computes one point-to-centroid
+        distance matrix per pass, so a pass costs O(n x k) instead of
+        O(excess x k x n). The kmedians engine measures L1 distances to the
+        cluster medians, recomputed at the start of each pass.
+        """
+        labels = labels.copy()
+        data = np.asarray(data)
+        sums = np.zeros((n_clusters, data.shape[1]))
+        np.add.at(sums, labels, data)
+        sizes = np.bincount(labels, minlength=n_clusters)
+        centers = sums / np.maximum(sizes, 1)[:, None]
+        point_norms = np.einsum('ij,ij->i', data, data)
+        
+        for iteration in range(10):  # Maximum passes
             # Check if all constraints are satisfied
-            if np.all(cluster_sizes >= min_size) and np.all(cluster_sizes <= max_size):
+            if np.all(sizes >= min_size) and np.all(sizes <= max_size):
                 break
+            
+            # Empty clusters keep their last known center
+            occupied = sizes > 0
+            if self.engine == 'kmedians':
+                occupied_ids, medians = grouped_medians(data, labels)
+                centers[occupied_ids] = medians
+                distances = self._l1_distances(data, centers)
+            else:
+                centers[occupied] = sums[occupied] / sizes[occupied, None]
+                distances = self._squared_distances(data, centers, point_norms)
+            
+            # Handle undersized clusters: pull the closest points from donors,
+            # never taking a donor below the minimum size
+            for cluster_id in np.where(sizes < min_size)[0]:
+                donors = sizes > max_size
+                if not donors.any():
+                    donors = sizes > min_size
+                donors[cluster_id] = False
                 
-            # Handle undersized clusters
-            for cluster_id in np.where(cluster_sizes < min_size)[0]:
-                # Find nearest points from oversized clusters
-                oversized = np.where(cluster_sizes > max_size)[0]
-                if len(oversized) == 0:
-                    oversized = np.where(cluster_sizes > min_size)[0]
-                    
-                if len(oversized) > 0:
-                    # Calculate distances to cluster center
-                    center = data[labels == cluster_id].mean(axis=0)
-                    
-                    # Find points in oversized clusters
-                    candidates = np.where(np.isin(labels, oversized))[0]
-                    if len(candidates) > 0:
-                        distances = np.linalg.norm(data[candidates] - center, axis=1)
-                        
-                        # Move closest points
-                        n_needed = min_size - cluster_sizes[cluster_id]
-                        closest_indices = candidates[np.argsort(distances)[:n_needed]]
-                        labels[closest_indices] = cluster_id
-                        
-            # Handle oversized clusters
-            for cluster_id in np.where(cluster_sizes > max_size)[0]:
-                # Find farthest points and reassign
-                center = data[labels == cluster_id].mean(axis=0)
-                cluster_points = np.where(labels == cluster_id)[0]
-                
-                distances = np.linalg.norm(data[cluster_points] - center, axis=1)
-                n_excess = cluster_sizes[cluster_id] - max_size
-                
-                # Reassign farthest points to nearest other cluster
-                farthest_indices = cluster_points[np.argsort(distances)[-n_excess:]]
+                candidates = np.flatnonzero(donors[labels])
+                if len(candidates) == 0:
+                    continue
                 
-                for idx in farthest_indices:
-                    # Find nearest cluster that can accept the point
-                    point = data[idx].reshape(1, -1)
-                    min_dist = float('inf')
-                    best_cluster = None
-                    
-                    for other_cluster in range(n_clusters):
-                        if other_cluster != cluster_id and cluster_sizes[other_cluster] < max_size:
-                            other_center = data[labels == other_cluster].mean(axis=0)
-                            dist = np.linalg.norm(point - other_center)
-                            if dist < min_dist:
-                                min_dist = dist
-                                best_cluster = other_cluster
-                                
-                    if best_cluster is not None:
-                        labels[idx] = best_cluster
-                        cluster_sizes[cluster_id] -= 1
-                        cluster_sizes[best_cluster] += 1
+                candidates = candidates[np.argsort(distances[candidates, cluster_id], kind='stable')]
+                surplus = sizes - min_size
+                within_surplus = self._rank_within_groups(labels[candidates]) < surplus[labels[candidates]]
+                chosen = candidates[within_surplus][:min_size - sizes[cluster_id]]
+                self._move_points(data, labels, sums, sizes, chosen, np.full(len(chosen), cluster_id))
+            
+            # Handle oversized clusters: shed the farthest points, then place
+            # them all at once into the nearest clusters with spare capacity
+            oversized = np.where(sizes > max_size)[0]
+            if len(oversized) == 0:
+                continue
+            
+            movers = []
+            for cluster_id in oversized:
+                members = np.flatnonzero(labels == cluster_id)
+                n_excess = sizes[cluster_id] - max_size
+                cut = len(members) - n_excess
+                movers.append(members[np.argpartition(distances[members, cluster_id], cut)[cut:]])
+            movers = np.concatenate(movers)
+            
+            capacity = np.maximum(max_size - sizes, 0)
+            capacity[oversized] = 0
+            targets = self._assign_with_capacity(distances[movers], capacity)
+            placed = targets >= 0
+            self._move_points(data, labels, sums, sizes, movers[placed], targets[placed])
                         
         return labels
     
+    def _flow_assignment(self, data, centers, min_size, max_size):
+        """
+        Assign points to centers with sizes in [min_size, max_size] at minimum total cost
+        
+        Solves one transportation problem over point-to-centroid distances,
+        aggregating points into micro-clusters when n exceeds
+        flow_max_points. The bounds may be scalars or per-cluster arrays.
+        Returns None when the constraints are infeasible.
+        """
+        distances = self._center_distances(np.asarray(data), centers)
+        n_samples, n_clusters = distances.shape
+        min_size = np.broadcast_to(min_size, (n_clusters,))
+        max_size = np.broadcast_to(max_size, (n_clusters,))
+        if min_size.sum() > n_samples or max_size.sum() < n_samples:
+            return None
+        if n_clusters == 1:
+            return np.zeros(n_samples, dtype=int)
+        
+        if n_samples <= self.flow_max_points:
+            groups = np.arange(n_samples)
+        else:
+            groups = self._micro_clusters(distances, self.flow_max_points)
+        n_groups = groups.max() + 1
+        
+        supply = np.bincount(groups, minlength=n_groups)
+        costs = np.column_stack([
+            np.bincount(groups, weights=distances[:, j], minlength=n_groups)
+            for j in range(n_clusters)
+        ]) / supply[:, None]
+        
+        flow = self._solve_transportation(costs, supply, min_size, max_size)
+        if flow is None:
+            return None
+        
+        # Groups routed to a single cluster move as a whole; split groups
+        # hand out their quotas to their own points, nearest first
+        labels = np.argmax(flow, axis=1)[groups]
+        for group_id in np.flatnonzero((flow > 0).sum(axis=1) > 1):
+            members = np.flatnonzero(groups == group_id)
+            labels[members] = self._assign_with_capacity(distances[members], flow[group_id])
+        
+        return labels
+    
+    @staticmethod
+    def _micro_clusters(distances, max_groups):
+        """
+        Group points by nearest centroid, second-nearest centroid and a
+        quantile bucket of the margin between the two
+        """
+        n_clusters = distances.shape[1]
+        nearest = np.argpartition(distances, (0, 1), axis=1)[:, :2]
+        rows = np.arange(len(distances))
+        margin = distances[rows, nearest[:, 1]] - distances[rows, nearest[:, 0]]
+        
+        n_buckets = max(1, max_groups // (n_clusters * (n_clusters - 1)))
+        edges = np.quantile(margin, np.linspace(0, 1, n_buckets + 1)[1:-1])
+        buckets = np.searchsorted(edges, margin)
+        
+        keys = (nearest[:, 0] * n_clusters + nearest[:, 1]) * n_buckets + buckets
+        return np.unique(keys, return_inverse=True)[1].ravel()
+    
+    @staticmethod
+    def _solve_transportation(costs, supply, min_size, max_size):
+        """
+        Solve the capacity-constrained transportation problem as a linear program
+        
+        Every group ships all of its supply, and every cluster receives between
+        min_size and max_size points. The constraint matrix is totally
+        unimodular, so the simplex vertex solution is integral.
+        """
+        n_groups, n_clusters = costs.shape
+        n_vars = n_groups * n_clusters
+        var_ids = np.arange(n_vars)
+        ones = np.ones(n_vars)
+        
+        ships_all = sparse.csr_matrix((ones, (np.repeat(np.arange(n_groups), n_clusters), var_ids)),
+                                      shape=(n_groups, n_vars))
+        receives = sparse.csr_matrix((ones, (np.tile(np.arange(n_clusters), n_groups), var_ids)),
+                                     shape=(n_clusters, n_vars))
+        
+        result = linprog(
+            costs.ravel(),
+            A_ub=sparse.vstack([receives, -receives]),
+            b_ub=np.r_[max_size, -min_size],
+            A_eq=ships_all,
+            b_eq=supply,
+            bounds=(0, None),
+            method='highs-ds'
+        )
+        if result.status != 0:
+            return None
+        
+        flow = np.rint(result.x).astype(int).reshape(n_groups, n_clusters)
+        # Guard against rounding drift so every group ships exactly its supply
+        rows = np.arange(n_groups)
+        flow[rows, np.argmax(flow, axis=1)] += supply - flow.sum(axis=1)
+        return flow
+    
+    @staticmethod
+    def _squared_distances(data, centers, point_norms=None):
+        """Squared Euclidean distances from every point to every center"""
+        if point_norms is None:
+            point_norms = np.einsum('ij,ij->i', data, data)
+        distances = point_norms[:, None] - 2 * (data @ centers.T) + np.einsum('ij,ij->i', centers, centers)
+        return np.maximum(distances, 0)
+    
+    @staticmethod
+    def _rank_within_groups(groups):
+        """Position of each element among the elements sharing its group, in input order"""
+        order = np.argsort(groups, kind='stable')
+        sorted_groups = groups[order]
+        starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+        counts = np.diff(np.r_[starts, len(groups)])
+        ranks = np.empty(len(groups), dtype=int)
+        ranks[order] = np.arange(len(groups)) - np.repeat(starts, counts)
+        return ranks
+    
+    def _assign_with_capacity(self, distances, capacity):
+        """
+        Greedily assign each row to its nearest column with remaining capacity
+        
+        Every round each pending point proposes its nearest open cluster and
+        each cluster accepts its closest proposals up to capacity. A round
+        either places every pending point or fills a cluster, so this takes
+        at most k + 1 rounds. Points that cannot be placed get -1.
+        """
+        capacity = capacity.copy()
+        cost = distances.astype(float, copy=True)
+        cost[:, capacity <= 0] = np.inf
+        targets = np.full(len(cost), -1)
+        pending = np.arange(len(cost))
+        
+        while len(pending) > 0:
+            choice = np.argmin(cost[pending], axis=1)
+            best = cost[pending, choice]
+            reachable = np.isfinite(best)
+            if not reachable.any():
+                break
+            pending, choice, best = pending[reachable], choice[reachable], best[reachable]
+            
+            order = np.argsort(best, kind='stable')
+            pending, choice = pending[order], choice[order]
+            accepted = self._rank_within_groups(choice) < capacity[choice]
+            
+            targets[pending[accepted]] = choice[accepted]
+            capacity -= np.bincount(choice[accepted], minlength=len(capacity))
+            cost[:, capacity <= 0] = np.inf
+            pending = pending[~accepted]
+        
+        return targets
+    
+    @staticmethod
+    def _move_points(data, labels, sums, sizes, indices, targets):
+        """Relabel points and update the running centroid/size table in place"""
+        if len(indices) == 0:
+            return
+        sources = labels[indices]
+        np.add.at(sums, sources, -data[indices])
+        np.add.at(sums, targets, data[indices])
+        sizes -= np.bincount(sources, minlength=len(sizes))
+        sizes += np.bincount(targets, minlength=len(sizes))
+        labels[indices] = targets
+    
     def _calculate_score(self, data, labels):
         """Calculate clustering quality score (lower is better)"""
-        score = 0
-        unique_labels = np.unique(labels)
-        
-        for label in unique_labels:
-            cluster_data = data[labels == label]
-            if len(cluster_data) > 0:
-                # Use median absolute deviation as score
-                median = np.median(cluster_data, axis=0)
-                score += np.sum(np.abs(cluster_data - median))
-                
-        return score / len(data)
+        if self.criterion != 'l1':
+            metric = 'cityblock' if self.engine == 'kmedians' else 'euclidean'
+            return QUALITY_CRITERIA[self.criterion](data, labels, sample_size=self.quality_sample_size, metric=metric)
+        # Use total absolute deviation from each cluster's median as score
+        _, _, l1 = grouped_medians(data, labels, return_l1=True)
+        return l1.sum() / len(data)
     
     def _calculate_medians(self, data, labels):
         """Calculate median centers for each cluster"""
-        unique_labels = np.unique(labels)
-        centers = []
-        
-        for label in unique_labels:
-            cluster_data = data[labels == label]
-            if len(cluster_data) > 0:
-                centers.append(np.median(cluster_data, axis=0))
-                
-        return np.array(centers)
+        _, centers = grouped_medians(data, labels)
+        return centers
+
+
+def _evaluate_k_shared(shm_name, shape, dtype, params, n_clusters, min_size, max_size):
+    """Process pool entry point: evaluate one k against the shared scaled matrix"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        data = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        # One BLAS/OpenMP thread per worker so the pool does not oversubscribe cores
+        start = time.perf_counter()
+        with threadpool_limits(limits=1):
+            score, labels = ConstrainedKMedians(**params)._evaluate_k(data, n_clusters, min_size, max_size)
+        del data
+    finally:
+        shm.close()
+    return score, labels, time.perf_counter() - start
 
 
 class AudienceBuilder:
@@ -347,11 +1967,16 @@ class AudienceBuilder:
         self.data_retriever = DataRetriever(data_path)
         self.clusterer = ConstrainedKMedians()
         self.results = None
+        self.grouped = None
         self.data_path = data_path
         
     def build_audience(self, user_request: str, confirmed_variables: List[str]) -> pd.DataFrame:
         """
         Execute the full audience building pipeline
+        
+        Rows keep their fetch order; self.grouped holds each group's row
+        offsets so groups are read (or exported in group order with
+        self.grouped.to_csv) without sorting a copy of the frame.
         """
         # Fetch data for confirmed variables
         data = self.data_retriever.fetch_data(confirmed_variables)
@@ -362,56 +1987,57 @@ class AudienceBuilder:
         # Add cluster labels to data
         data['Group'] = cluster_labels
         
-        # Sort by group and create final output
-        result = data.sort_values('Group').reset_index(drop=True)
+        # Group rows by label with a counting sort instead of sorting the frame
+        self.grouped = GroupedFrame(data, cluster_labels)
         
         # Calculate group statistics
-        group_stats = result.groupby('Group').size()
-        group_pcts = (group_stats / len(result) * 100).round(2)
+        group_pcts = (self.grouped.sizes / len(data) * 100).round(2)
         
         print("\nGroup Size Distribution:")
-        for group, pct in group_pcts.items():
-            print(f"Group {group}: {pct}% ({group_stats[group]} records)")
+        for group, size, pct in zip(self.grouped.group_ids, self.grouped.sizes, group_pcts):
+            print(f"Group {group}: {pct}% ({size} records)")
             
-        self.results = result
-        return result
+        self.results = data
+        return data
     
     def get_group_profiles(self) -> Dict[int, Dict[str, Any]]:
         """
         Generate descriptive profiles for each group
+        
+        All groups are profiled in one pass over the results (see
+        profile_groups) rather than masking the frame once per group.
         """
         if self.results is None:
             return {}
-            
-        profiles = {}
+        if self.grouped is None or self.grouped.data is not self.results:
+            self.grouped = GroupedFrame(self.results)
         
-        for group_id in self.results['Group'].unique():
-            group_data = self.results[self.results['Group'] == group_id]
+        profiles = {}
+        column_profiles = profile_groups(self.grouped, exclude=['Group', 'PostalCode', 'LATITUDE', 'LONGITUDE'],
+                                         top_k=1)
+        for group_id, size in zip(self.grouped.group_ids, self.grouped.sizes.tolist()):
             profile = {
-                "size": len(group_data),
-                "percentage": round(len(group_data) / len(self.results) * 100, 2),
+                "size": size,
+                "percentage": round(size / len(self.results) * 100, 2),
                 "characteristics": {}
             }
             
             # Analyze each variable
-            for col in group_data.columns:
-                if col not in ['Group', 'PostalCode', 'LATITUDE', 'LONGITUDE']:
-                    if group_data[col].dtype == 'object':
-                        # Categorical variable - get mode
-                        mode_value = group_data[col].mode()[0]
-                        mode_pct = (group_data[col] == mode_value).sum() / len(group_data) * 100
-                        profile["characteristics"][col] = {
-                            "dominant_value": mode_value,
-                            "percentage": round(mode_pct, 1)
-                        }
-                    else:
-                        # Numeric variable - get statistics
-                        profile["characteristics"][col] = {
-                            "median": round(group_data[col].median(), 2),
-                            "mean": round(group_data[col].mean(), 2),
-                            "std": round(group_data[col].std(), 2)
-                        }
+            for col, stats in column_profiles[group_id].items():
+                if stats['type'] == 'categorical':
+                    # Categorical variable - get mode
+                    profile["characteristics"][col] = {
+                        "dominant_value": stats['dominant_value'],
+                        "percentage": round(stats['dominant_count'] / size * 100, 1)
+                    }
+                else:
+                    # Numeric variable - get statistics
+                    profile["characteristics"][col] = {
+                        "median": round(stats['median'], 2),
+                        "mean": round(stats['mean'], 2),
+                        "std": round(stats['std'], 2)
+                    }
                         
             profiles[group_id] = profile
             
-        return profiles
\ No newline at end of file
+        return profiles
@@ -0,0 +1,238 @@
+"""
+Cache for fitted cluster models
+Stores labels, centers and feature scaling for a variable set on a given
+dataset so repeated audience builds skip re-clustering
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+
+class ClusterModelCache:
+    """
+    LRU cache of fitted ConstrainedKMedians results, bounded by entry count
+    and bytes, with an optional on-disk copy that survives restarts (memory
+    only when cache_dir cannot be created, e.g. on a read-only filesystem)
+
+    Entries are keyed by the sorted variable codes, the clusterer settings and
+    a fingerprint of the dataset, so a new dataset or different constraints
+    never reuse a stale model. On disk each entry is an .npz file of plain
+    arrays with the layout's other fields as JSON, read with
+    allow_pickle=False so a cache file can never run code.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 32,
+                 max_bytes: int = 256 * 1024 ** 2):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be positive")
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+            except OSError as e:
+                # Read-only deploys still get the in-memory cache
+                print(f"Warning: Could not create cluster cache directory {cache_dir}, caching in memory only: {e}")
+                self.cache_dir = None
+
+    @staticmethod
+    def make_key(variable_codes: List[str], settings: Dict[str, Any], fingerprint: str) -> str:
+        """Build a cache key from the variable set, clusterer settings and dataset fingerprint"""
+        payload = json.dumps({
+            'variables': sorted(variable_codes),
+            'settings': settings,
+            'dataset': fingerprint
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for key, loading it from disk if needed"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._load(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(key, entry)
+        return entry
+
+    def put(self, key: str, labels, centers, feature_layout: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Store a fitted model and persist it to the cache directory"""
+        labels = np.asarray(labels)
+        entry = {
+            'labels': labels.astype(np.int32 if labels.size == 0 or labels.max() < 2 ** 31 else np.int64),
+            'centers': None if centers is None else np.asarray(centers),
+            'feature_layout': feature_layout
+        }
+        entry['nbytes'] = self._entry_bytes(entry)
+
+        with self._lock:
+            self._insert(key, entry)
+        self._save(key, entry)
+        return entry
+
+    def clear(self):
+        """Drop every entry from memory and disk"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        for path in self._disk_files():
+            os.remove(path)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current memory footprint"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _insert(self, key: str, entry: Dict[str, Any]):
+        """Add entry as most recently used and evict until within both limits (lock held)"""
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)['nbytes']
+        self._entries[key] = entry
+        self._bytes += entry['nbytes']
+        # Always keep the newest entry, even if it alone exceeds max_bytes
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted['nbytes']
+
+    @staticmethod
+    def _entry_bytes(entry: Dict[str, Any]) -> int:
+        """Approximate memory held by an entry's arrays"""
+        total = entry['labels'].nbytes
+        if entry['centers'] is not None:
+            total += entry['centers'].nbytes
+        for value in (entry['feature_layout'] or {}).values():
+            if isinstance(value, np.ndarray):
+                total += value.nbytes
+        return total
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _disk_files(self) -> List[str]:
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return []
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                if name.endswith('.npz')]
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Read an entry from disk, treating unreadable files as misses"""
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                entry = self._from_arrays(stored)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Warning: Could not read cached cluster model {path}: {e}")
+            return None
+        try:
+            # Refresh the access time so disk pruning stays least-recently-used
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def _save(self, key: str, entry: Dict[str, Any]):
+        """Write an entry atomically, then prune the directory to max_bytes"""
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **self._to_arrays(entry))
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Warning: Could not persist cluster model {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._prune_disk()
+
+    @staticmethod
+    def _to_arrays(entry: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        """Split an entry into plain arrays, with the layout's non-array fields as a JSON string"""
+        arrays = {'labels': entry['labels']}
+        if entry['centers'] is not None:
+            arrays['centers'] = entry['centers']
+        layout = entry['feature_layout']
+        if layout is not None:
+            fields = {}
+            for name, value in layout.items():
+                if isinstance(value, np.ndarray):
+                    arrays[f'layout_{name}'] = value
+                elif isinstance(value, dict):
+                    # Pairs keep non-string column names, which JSON object keys would not
+                    fields[name] = {'pairs': [[k, v] for k, v in value.items()]}
+                else:
+                    fields[name] = value
+            arrays['layout_json'] = np.array(json.dumps(
+                fields, default=lambda value: value.item() if isinstance(value, np.generic) else str(value)))
+        return arrays
+
+    @classmethod
+    def _from_arrays(cls, stored) -> Dict[str, Any]:
+        """Rebuild an entry from the arrays written by _to_arrays"""
+        layout = None
+        if 'layout_json' in stored.files:
+            layout = {}
+            for name, value in json.loads(str(stored['layout_json'])).items():
+                layout[name] = {k: v for k, v in value['pairs']} if isinstance(value, dict) else value
+            for name in stored.files:
+                if name.startswith('layout_') and name != 'layout_json':
+                    layout[name[len('layout_'):]] = stored[name]
+        entry = {
+            'labels': stored['labels'],
+            'centers': stored['centers'] if 'centers' in stored.files else None,
+            'feature_layout': layout
+        }
+        entry['nbytes'] = cls._entry_bytes(entry)
+        return entry
+
+    def _prune_disk(self):
+        """Remove the least recently used files until the directory fits max_bytes and max_entries"""
+        files = []
+        for path in self._disk_files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        while len(files) > 1 and (len(files) > self.max_entries or total > self.max_bytes):
+            _, size, path = files.pop(0)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,91 @@
+"""
+Cluster quality metrics for choosing the number of clusters
+All metrics run on a fixed-size sample so their cost does not grow with the audience
+"""
+
+import numpy as np
+from typing import Dict, Any, Optional
+from sklearn.metrics import silhouette_score
+from scipy.spatial.distance import cdist
+
+
+def sample_indices(n_rows: int, sample_size: Optional[int], random_state: int = 42) -> np.ndarray:
+    """
+    Fixed row sample shared by every candidate k
+
+    The same seed and row count always give the same rows, so scores for
+    different k are computed on identical points.
+    """
+    if not sample_size or n_rows <= sample_size:
+        return np.arange(n_rows)
+    rng = np.random.default_rng(random_state)
+    return np.sort(rng.choice(n_rows, sample_size, replace=False))
+
+
+def sampled_silhouette(data, labels, sample_size: Optional[int] = 2000,
+                       metric: str = 'euclidean', random_state: int = 42) -> float:
+    """Mean silhouette on a sample of rows (0 when fewer than two clusters are present)"""
+    rows = sample_indices(len(data), sample_size, random_state)
+    sample_labels = np.asarray(labels)[rows]
+    n_labels = len(np.unique(sample_labels))
+    if n_labels < 2 or n_labels >= len(rows):
+        return 0.0
+    return float(silhouette_score(data[rows], sample_labels, metric=metric))
+
+
+def centroid_davies_bouldin(data, labels, sample_size: Optional[int] = 2000,
+                            metric: str = 'euclidean', random_state: int = 42) -> float:
+    """
+    Davies-Bouldin index from cluster centroids and sampled within-cluster scatter
+
+    Centroids are the per-cluster means of the sampled rows. Lower is better;
+    0 when fewer than two clusters are present.
+    """
+    rows = sample_indices(len(data), sample_size, random_state)
+    sample = np.asarray(data[rows], dtype=np.float64)
+    cluster_ids, inverse = np.unique(np.asarray(labels)[rows], return_inverse=True)
+    n_clusters = len(cluster_ids)
+    if n_clusters < 2:
+        return 0.0
+
+    counts = np.bincount(inverse, minlength=n_clusters)
+    centroids = np.zeros((n_clusters, sample.shape[1]))
+    np.add.at(centroids, inverse, sample)
+    centroids /= counts[:, None]
+
+    point_distances = cdist(sample, centroids, metric=metric)[np.arange(len(sample)), inverse]
+    scatter = np.bincount(inverse, weights=point_distances, minlength=n_clusters) / counts
+
+    separation = cdist(centroids, centroids, metric=metric)
+    np.fill_diagonal(separation, np.inf)
+    ratios = (scatter[:, None] + scatter[None, :]) / np.where(separation > 0, separation, np.finfo(float).eps)
+    return float(ratios.max(axis=1).mean())
+
+
+def constraint_violations(labels, min_size: int, max_size: int) -> Dict[str, int]:
+    """Clusters and rows outside the [min_size, max_size] bounds"""
+    sizes = np.unique(np.asarray(labels), return_counts=True)[1]
+    undersized = sizes < min_size
+    oversized = sizes > max_size
+    return {
+        'clusters': int(undersized.sum() + oversized.sum()),
+        'rows': int((min_size - sizes[undersized]).sum() + (sizes[oversized] - max_size).sum())
+    }
+
+
+# Selection criteria expressed as "lower is better" scores so they can be
+# compared and used for relative early stopping interchangeably
+CRITERIA = {
+    'silhouette': lambda data, labels, **kwargs: 1.0 - sampled_silhouette(data, labels, **kwargs),
+    'davies_bouldin': centroid_davies_bouldin
+}
+
+
+def quality_report(data, labels, min_size: int, max_size: int, sample_size: Optional[int] = 2000,
+                   metric: str = 'euclidean', random_state: int = 42) -> Dict[str, Any]:
+    """All quality metrics for one labelling"""
+    return {
+        'silhouette': sampled_silhouette(data, labels, sample_size, metric, random_state),
+        'davies_bouldin': centroid_davies_bouldin(data, labels, sample_size, metric, random_state),
+        'violations': constraint_violations(labels, min_size, max_size)
+    }
@@ -0,0 +1,279 @@
+"""
+Versioned datasets with hot reload
+Loads a new data file next to the live one and swaps it in atomically, while
+requests already running finish on the version they started with
+"""
+
+import os
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+try:
+    from .audience_builder import DataRetriever
+except ImportError:
+    from audience_builder import DataRetriever
+
+
+class DatasetVersion:
+    """One loaded dataset and the number of requests currently using it"""
+
+    def __init__(self, version: int, path: str, content_hash: str, retriever: DataRetriever):
+        self.version = version
+        self.path = path
+        self.content_hash = content_hash
+        self.retriever = retriever
+        self.loaded_at = datetime.now().isoformat()
+        self.refcount = 0
+        self.retired = False
+        self.hash_thread = None
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'version': self.version,
+            'path': self.path,
+            'content_hash': self.content_hash,
+            'loaded_at': self.loaded_at,
+            'n_rows': self.retriever.n_rows
+        }
+
+
+class DatasetRegistry:
+    """
+    Serves the current DataRetriever and hot-swaps it when new data is loaded
+
+    Each load records the version in a JSON manifest (written atomically).
+    A reload hashes the new file's contents and is a no-op when they match
+    the current version. Requests take the current version with acquire();
+    a reload builds the new retriever first, then swaps it in under a lock,
+    and the old version is released once its last request finishes. Each
+    version converts the data into its own columnar copy, which is deleted
+    when the version is released.
+
+    Hashes are reused from the manifest while a file's size and mtime are
+    unchanged. The first load has nothing to compare against, so when the
+    manifest does not know the file it serves the data straight away and
+    hashes it on a background thread; startup never waits on reading the
+    whole file, even where the manifest cannot be written.
+    """
+
+    HASH_BLOCK_SIZE = 1024 ** 2
+
+    def __init__(self, manifest_path: Optional[str] = None, **retriever_kwargs):
+        self.manifest_path = manifest_path
+        self.retriever_kwargs = retriever_kwargs
+        self._current = None
+        self._retired = []
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._manifest_lock = threading.Lock()
+        self._reload_thread = None
+        self.last_error = None
+        self._manifest = self._read_manifest()
+
+    def load(self, path: str) -> Dict[str, Any]:
+        """
+        Load path as a new version and make it current
+
+        Returns the info of the version now being served. Only one load runs
+        at a time; requests keep using the previous version until the swap.
+        """
+        with self._reload_lock:
+            current = self._current
+            if current is None:
+                content_hash = self._known_hash(path)
+            else:
+                self.wait_for_hash()
+                content_hash = self._content_hash(path)
+                if current.content_hash == content_hash:
+                    return current.info()
+
+            # Derived columnar files are tagged with the file's size and mtime, so rewriting the data in
+            # place gives the new version its own copy and never touches the one older requests read
+            _, stamp = self._file_stamp(path)
+            version_tag = hashlib.sha256(json.dumps(stamp).encode('utf-8')).hexdigest()[:12]
+            retriever = DataRetriever(path, version_tag=version_tag, **self.retriever_kwargs)
+            retriever.load_data()
+            new_version = DatasetVersion(self._manifest.get('latest_version', 0) + 1,
+                                         os.path.abspath(path), content_hash, retriever)
+
+            with self._lock:
+                previous = self._current
+                self._current = new_version
+                if previous is not None:
+                    previous.retired = True
+                    self._retired.append(previous)
+                self._release_retired()
+
+            with self._manifest_lock:
+                self._manifest['latest_version'] = new_version.version
+                self._manifest['current'] = new_version.info()
+                self._write_manifest()
+            self.last_error = None
+            if content_hash is None:
+                self._hash_in_background(new_version, stamp)
+            print(f"Dataset version {new_version.version} loaded from {path} ({(content_hash or 'hashing')[:12]})")
+            return new_version.info()
+
+    def reload_async(self, path: str) -> threading.Thread:
+        """Load path on a background thread; failures are kept in last_error and the current version stays"""
+        def run():
+            try:
+                self.load(path)
+            except Exception as e:
+                print(f"Warning: Dataset reload from {path} failed: {e}")
+                self.last_error = str(e)
+
+        thread = threading.Thread(target=run, name='dataset-reload', daemon=True)
+        self._reload_thread = thread
+        thread.start()
+        return thread
+
+    @contextmanager
+    def acquire(self):
+        """Yield the current DataRetriever, keeping its version alive until the block exits"""
+        with self._lock:
+            version = self._current
+            if version is None:
+                raise AttributeError("No dataset loaded. Call load() first.")
+            version.refcount += 1
+        try:
+            yield version.retriever
+        finally:
+            with self._lock:
+                version.refcount -= 1
+                self._release_retired()
+
+    def wait_for_hash(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the current version's background hash; True once it is known"""
+        current = self._current
+        if current is None:
+            return False
+        if current.hash_thread is not None:
+            current.hash_thread.join(timeout)
+        return current.content_hash is not None
+
+    def current_version(self) -> Optional[Dict[str, Any]]:
+        """Info for the version new requests are served from"""
+        current = self._current
+        return current.info() if current is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        """Version, in-flight and reload state for health checks"""
+        with self._lock:
+            current = self._current
+            return {
+                'version': current.version if current else None,
+                'content_hash': current.content_hash if current else None,
+                'loaded_at': current.loaded_at if current else None,
+                'hashing': bool(current and current.hash_thread is not None and current.hash_thread.is_alive()),
+                'in_flight': current.refcount if current else 0,
+                'retired_in_flight': sum(version.refcount for version in self._retired),
+                'reloading': self._reload_thread is not None and self._reload_thread.is_alive(),
+                'last_error': self.last_error
+            }
+
+    def _release_retired(self):
+        """Drop retired versions no request is using (call with the lock held)"""
+        still_used = []
+        live_paths = set(self._current.retriever.derived_paths) if self._current else set()
+        for version in self._retired:
+            if version.refcount > 0:
+                still_used.append(version)
+                live_paths.update(version.retriever.derived_paths)
+        for version in self._retired:
+            if version.refcount == 0:
+                # Derived files still shared with a live version (same file contents) are kept
+                version.retriever.derived_paths = [path for path in version.retriever.derived_paths
+                                                   if path not in live_paths]
+                version.retriever.close(remove_derived=True)
+        self._retired = still_used
+
+    def _hash_in_background(self, version: DatasetVersion, stamp: list):
+        """Hash a version's file on a thread, then record the hash on the version and in the manifest"""
+        def run():
+            try:
+                content_hash = self._content_hash(version.path)
+                changed = self._file_stamp(version.path)[1] != stamp
+            except OSError as e:
+                print(f"Warning: Could not hash dataset {version.path}: {e}")
+                return
+            if changed:
+                # The file was rewritten after this version loaded it; the hash is not this version's
+                print(f"Warning: Dataset {version.path} changed before it was hashed; version {version.version} keeps no hash")
+                return
+            version.content_hash = content_hash
+            with self._manifest_lock:
+                if self._manifest.get('current', {}).get('version') == version.version:
+                    self._manifest['current']['content_hash'] = content_hash
+                self._write_manifest()
+
+        version.hash_thread = threading.Thread(target=run, name='dataset-hash', daemon=True)
+        version.hash_thread.start()
+
+    @staticmethod
+    def _file_stamp(path: str):
+        """The files making up path and their [relative name, size, mtime] stamp"""
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Data file not found: {path}")
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        else:
+            files = [path]
+        stamp = [[os.path.relpath(f, path) if f != path else '', os.path.getsize(f), os.stat(f).st_mtime_ns]
+                 for f in files]
+        return files, stamp
+
+    def _known_hash(self, path: str) -> Optional[str]:
+        """The manifest's hash for path if its size and mtime are unchanged, without reading the data"""
+        _, stamp = self._file_stamp(path)
+        with self._manifest_lock:
+            known = self._manifest.get('hashes', {}).get(os.path.abspath(path))
+        return known['content_hash'] if known and known['stamp'] == stamp else None
+
+    def _content_hash(self, path: str) -> str:
+        """sha256 of the file (or of every file under a directory), reused while size and mtime match"""
+        files, stamp = self._file_stamp(path)
+        with self._manifest_lock:
+            known = self._manifest.get('hashes', {}).get(os.path.abspath(path))
+        if known and known['stamp'] == stamp:
+            return known['content_hash']
+
+        digest = hashlib.sha256()
+        for file_path, entry in zip(files, stamp):
+            digest.update(entry[0].encode('utf-8'))
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(self.HASH_BLOCK_SIZE), b''):
+                    digest.update(block)
+        content_hash = digest.hexdigest()
+        with self._manifest_lock:
+            self._manifest.setdefault('hashes', {})[os.path.abspath(path)] = {'stamp': stamp,
+                                                                              'content_hash': content_hash}
+        return content_hash
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read dataset manifest {self.manifest_path}: {e}")
+            return {}
+
+    def _write_manifest(self):
+        if not self.manifest_path:
+            return
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(self._manifest, f, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError as e:
+            print(f"Warning: Could not write dataset manifest {self.manifest_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,177 @@
+"""
+Cache for query embeddings
+Keeps recently embedded search queries in memory and in a SQLite file so
+repeated queries skip the embeddings API, across requests and restarts
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Sequence
+
+import numpy as np
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               'cache', 'query_embeddings.sqlite')
+
+
+class QueryEmbeddingCache:
+    """
+    Two-tier cache of query embeddings: an in-process LRU in front of a
+    SQLite table shared by every process using the same db_path
+
+    Entries are keyed by a hash of the model name and the normalized query
+    (case-folded, whitespace collapsed), so trivially different spellings of
+    the same query share an embedding and a model change never reuses one.
+    Vectors are stored as float32. The SQLite table keeps at most
+    max_disk_entries rows, dropping the oldest first; db_path=None keeps
+    the cache in memory only.
+    """
+
+    def __init__(self, db_path: Optional[str] = DEFAULT_DB_PATH, max_entries: int = 1024,
+                 max_disk_entries: int = 100000):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if max_disk_entries < 1:
+            raise ValueError("max_disk_entries must be at least 1")
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if db_path:
+            self._connection = self._connect(db_path)
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Case-fold the query and collapse runs of whitespace"""
+        return ' '.join(query.casefold().split())
+
+    @classmethod
+    def make_key(cls, query: str, model: str) -> str:
+        """Build a cache key from the model name and normalized query"""
+        payload = f"{model}\0{cls.normalize_query(query)}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, query: str, model: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for query, loading it from disk if needed"""
+        key = self.make_key(query, model)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+            embedding = self._load(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, embedding)
+        return embedding
+
+    def put(self, query: str, model: str, embedding: Sequence[float]) -> np.ndarray:
+        """Store an embedding in memory and on disk, returning it as float32"""
+        key = self.make_key(query, model)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        with self._lock:
+            self._insert(key, embedding)
+            self._save(key, model, embedding)
+        return embedding
+
+    def get_or_create(self, query: str, model: str,
+                      embed: Callable[[str], Sequence[float]]) -> np.ndarray:
+        """Return the cached embedding, calling embed(query) only on a miss"""
+        embedding = self.get(query, model)
+        if embedding is None:
+            embedding = self.put(query, model, embed(query))
+        return embedding
+
+    def clear(self):
+        """Drop every entry from memory and disk"""
+        with self._lock:
+            self._entries.clear()
+            if self._connection is not None:
+                self._execute("DELETE FROM embeddings")
+
+    def close(self):
+        """Close the SQLite connection; the memory tier keeps working"""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters per tier and the number of entries in memory"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses
+            }
+
+    def _insert(self, key: str, embedding: np.ndarray):
+        """Add embedding as most recently used and evict beyond max_entries (lock held)"""
+        self._entries.pop(key, None)
+        self._entries[key] = embedding
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _connect(self, db_path: str) -> Optional[sqlite3.Connection]:
+        """Open the database, creating the table; failures leave the cache memory-only"""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            connection = sqlite3.connect(db_path, timeout=5, check_same_thread=False, isolation_level=None)
+            # WAL lets worker processes read while another one writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS embeddings_created ON embeddings (created)")
+            return connection
+        except (sqlite3.Error, OSError) as e:
+            print(f"Warning: Could not open query embedding cache {db_path}, caching in memory only: {e}")
+            return None
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> Optional[list]:
+        """Run a statement, treating database errors as a miss (lock held)"""
+        try:
+            return self._connection.execute(sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            print(f"Warning: Query embedding cache error in {self.db_path}: {e}")
+            return None
+
+    def _load(self, key: str) -> Optional[np.ndarray]:
+        """Read an embedding from disk (lock held)"""
+        if self._connection is None:
+            return None
+        rows = self._execute("SELECT vector FROM embeddings WHERE key = ?", (key,))
+        if not rows:
+            return None
+        return np.frombuffer(rows[0][0], dtype=np.float32)
+
+    def _save(self, key: str, model: str, embedding: np.ndarray):
+        """Write an embedding to disk and drop the oldest rows beyond max_disk_entries (lock held)"""
+        if self._connection is None:
+            return
+        self._execute("INSERT OR REPLACE INTO embeddings (key, model, vector, created) VALUES (?, ?, ?, ?)",
+                      (key, model, embedding.tobytes(), time.time()))
+        self._execute("DELETE FROM embeddings WHERE key IN "
+                      "(SELECT key FROM embeddings ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                      (self.max_disk_entries,))
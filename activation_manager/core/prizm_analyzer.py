@@ -3,25 +3,75 @@ PRIZM Segment Analyzer
 Analyzes and describes audience segments using PRIZM methodology
 """
 
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+from scipy import sparse
 import json
 
+try:
+    from .prizm_reference import load_prizm_reference, DEFAULT_WORKBOOK_PATH, DEFAULT_CACHE_DIR
+except ImportError:
+    from prizm_reference import load_prizm_reference, DEFAULT_WORKBOOK_PATH, DEFAULT_CACHE_DIR
+
 
 class PRIZMAnalyzer:
     """
     Analyzes segments using PRIZM segment definitions
     Provides rich descriptions of audience characteristics
+    
+    Segment profiles come from the PRIZM 2024 Quick Reference Guide, which
+    is parsed once and then served from a pickle cache (see
+    prizm_reference); without the workbook, or with reference_path=None,
+    a small built-in set of profiles is used.
+    
+    Segment compatibility is scored from an index built at construction:
+    the lower-cased profile text of every segment joined into one string
+    with row offsets, plus a segment x rule matrix for the partial-match
+    rules. rank_segments scores all segments against a list of attributes
+    as one sparse matrix-vector product.
     """
     
-    def __init__(self):
-        # PRIZM segment definitions (based on typical PRIZM segments)
-        # In production, this would be extracted from the PDF
-        self.segment_profiles = self._load_segment_profiles()
+    # Partial matches: (attribute terms, segment text terms, score) tried in order
+    COMPATIBILITY_RULES = (
+        (('high income', 'affluent'), ('150,000+', '100,000', 'wealthy'), 0.7),
+        (('millennial',), ('25-34', 'young'), 0.8),
+        (('urban',), ('urban',), 1.0),
+        (('environmental',), ('conscious',), 0.6)
+    )
+    ATTRIBUTE_CACHE_SIZE = 1024
+    
+    def __init__(self, reference_path: Optional[str] = DEFAULT_WORKBOOK_PATH,
+                 cache_dir: Optional[str] = DEFAULT_CACHE_DIR):
+        self.segment_profiles = self._load_segment_profiles(reference_path, cache_dir)
         self.prizm_segments = self.segment_profiles  # Alias for backward compatibility
+        self._build_segment_index()
+    
+    def _build_segment_index(self):
+        """
+        Precompute the text and rule index used for compatibility scoring
+        
+        Call again after changing prizm_segments.
+        """
+        self._segment_codes = list(self.prizm_segments)
+        self._segment_rows = {code: row for row, code in enumerate(self._segment_codes)}
+        texts = [json.dumps(self.prizm_segments[code]).lower() for code in self._segment_codes]
+        # json.dumps escapes newlines, so a separator newline never occurs inside a segment's text
+        self._segment_text = '\n'.join(texts)
+        self._segment_offsets = np.cumsum([0] + [len(text) + 1 for text in texts])
+        self._rule_flags = np.array([[any(term in text for term in segment_terms)
+                                      for _, segment_terms, _ in self.COMPATIBILITY_RULES]
+                                     for text in texts], dtype=bool).reshape(len(texts), len(self.COMPATIBILITY_RULES))
+        self._attribute_columns = {}
     
-    def _load_segment_profiles(self):
+    def _load_segment_profiles(self, reference_path: Optional[str] = None,
+                               cache_dir: Optional[str] = None):
         """Load PRIZM segment profiles"""
+        profiles = load_prizm_reference(reference_path, cache_dir) if reference_path else None
+        return profiles or self._builtin_segment_profiles()
+    
+    def _builtin_segment_profiles(self):
+        """Typical PRIZM segments used when the reference workbook is unavailable"""
         return {
             "01": {
                 "name": "Cosmopolitan Elite",
@@ -154,6 +204,9 @@ class PRIZMAnalyzer:
         """
         Analyze the distribution of PRIZM segments in clustered data
         
+        Every group is analysed from one (group, segment) count table, so
+        call it once per audience rather than once per group.
+        
         Args:
             segment_data: DataFrame with 'Group' and 'PRIZM_CLUSTER' columns
             
@@ -180,54 +233,32 @@ class PRIZMAnalyzer:
                 "error": "No PRIZM_SEGMENT column found in data"
             }
         
-        segment_profiles = {}
-        all_prizm_segments = []
+        # One (group, segment) contingency table replaces per-group masks and value_counts
+        group_codes, group_ids = pd.factorize(segment_data['Group'])
+        segment_codes, segment_values = pd.factorize(segment_data[prizm_col])
+        segment_values = np.asarray(segment_values)
+        valid = segment_codes >= 0
+        n_groups, n_values = len(group_ids), max(len(segment_values), 1)
+        table = np.bincount(group_codes[valid] * n_values + segment_codes[valid],
+                            minlength=n_groups * n_values).reshape(n_groups, n_values)
+        # Stable ranking keeps the order segments first appear in for ties, like value_counts
+        ranked = np.argsort(-table, axis=1, kind='stable')[:, :3]
         
-        for group_id in segment_data['Group'].unique():
-            group_data = segment_data[segment_data['Group'] == group_id]
-            
-            # Get PRIZM segment distribution
-            prizm_dist = group_data[prizm_col].value_counts()
-            all_prizm_segments.extend(group_data[prizm_col].tolist())
-            
-            # Create dominant segments list
-            dominant_segments = [str(seg) for seg in prizm_dist.index[:3]]
-            
-            # Get demographics and behaviors
-            demographics = "Mixed demographics"
-            key_behaviors = ["General behaviors"]
-            psychographics = ["Mainstream values"]
-            marketing_implications = "Standard marketing approach"
-            
-            # If we have a known segment, use its data
-            if len(dominant_segments) > 0:
-                first_segment = dominant_segments[0]
-                segment_key = first_segment if first_segment in self.prizm_segments else f"{int(first_segment):02d}" if first_segment.isdigit() else None
-                
-                if segment_key and segment_key in self.prizm_segments:
-                    segment_info = self.prizm_segments[segment_key]
-                    demographics = f"{segment_info['demographics']['age']}, {segment_info['demographics']['income']}"
-                    key_behaviors = segment_info['behaviors'][:3]
-                    psychographics = segment_info['psychographics'][:3]
-                    marketing_implications = "; ".join(self._get_marketing_implications(segment_info))
-            
-            segment_profiles[str(group_id)] = {
-                "dominant_segments": dominant_segments,
-                "demographics": demographics,
-                "key_behaviors": key_behaviors,
-                "psychographics": psychographics,
-                "marketing_implications": marketing_implications
-            }
+        segment_profiles = {}
+        for i, group_id in enumerate(group_ids):
+            top = ranked[i][table[i, ranked[i]] > 0]
+            dominant_segments = [str(seg) for seg in segment_values[top]]
+            segment_profiles[str(group_id)] = self._describe_group(dominant_segments)
         
         # Calculate overall summary
-        unique_segments = len(set(all_prizm_segments))
-        total_segments = len(all_prizm_segments)
+        totals = table.sum(axis=0)
+        unique_segments = int((totals > 0).sum())
+        total_segments = int(totals.sum())
         diversity_score = unique_segments / total_segments if total_segments > 0 else 0.0
         
         # Get top segments
-        from collections import Counter
-        segment_counts = Counter(all_prizm_segments)
-        top_segments = [seg for seg, count in segment_counts.most_common(5)]
+        top = np.argsort(-totals, kind='stable')[:5]
+        top_segments = segment_values[top[totals[top] > 0]].tolist()
         
         # Calculate market potential (simple heuristic)
         market_potential = min(10.0, diversity_score * 10 + len(segment_profiles))
@@ -244,6 +275,34 @@ class PRIZMAnalyzer:
             "overall_summary": overall_summary
         }
     
+    def _describe_group(self, dominant_segments: List[str]) -> Dict[str, Any]:
+        """Profile for a group from its dominant PRIZM segments"""
+        # Get demographics and behaviors
+        demographics = "Mixed demographics"
+        key_behaviors = ["General behaviors"]
+        psychographics = ["Mainstream values"]
+        marketing_implications = "Standard marketing approach"
+        
+        # If we have a known segment, use its data
+        if len(dominant_segments) > 0:
+            first_segment = dominant_segments[0]
+            segment_key = first_segment if first_segment in self.prizm_segments else f"{int(first_segment):02d}" if first_segment.isdigit() else None
+            
+            if segment_key and segment_key in self.prizm_segments:
+                segment_info = self.prizm_segments[segment_key]
+                demographics = f"{segment_info['demographics']['age']}, {segment_info['demographics']['income']}"
+                key_behaviors = segment_info['behaviors'][:3]
+                psychographics = segment_info['psychographics'][:3]
+                marketing_implications = "; ".join(self._get_marketing_implications(segment_info))
+        
+        return {
+            "dominant_segments": dominant_segments,
+            "demographics": demographics,
+            "key_behaviors": key_behaviors,
+            "psychographics": psychographics,
+            "marketing_implications": marketing_implications
+        }
+    
     def _get_segment_profile(self, segment_name: str) -> Dict[str, Any]:
         """
         Get profile for a specific segment by name
@@ -278,9 +337,10 @@ class PRIZMAnalyzer:
         implications = []
         
         # Based on income
-        if "$150,000+" in segment_info['demographics'].get('income', ''):
+        average_income = segment_info.get('reference', {}).get('average_income') or 0
+        if "$150,000+" in segment_info['demographics'].get('income', '') or average_income >= 150000:
             implications.append("Target with premium/luxury offerings")
-        elif "$100,000" in segment_info['demographics'].get('income', ''):
+        elif "$100,000" in segment_info['demographics'].get('income', '') or average_income >= 100000:
             implications.append("Focus on value-premium balance")
         else:
             implications.append("Emphasize value and practicality")
@@ -344,36 +404,85 @@ class PRIZMAnalyzer:
         Returns:
             Compatibility score (0-1)
         """
-        if segment_code not in self.prizm_segments:
+        if segment_code not in self._segment_rows:
             return 0.0
+        return float(self._score_segments(target_attributes)[self._segment_rows[segment_code]])
+    
+    def rank_segments(self, target_attributes: List[str], top_n: int = None) -> List[Dict[str, Any]]:
+        """
+        Rank every PRIZM segment by compatibility with the target attributes
+        
+        Args:
+            target_attributes: List of desired attributes
+            top_n: Number of segments to return (all when None)
             
-        segment = self.prizm_segments[segment_code]
-        matches = 0
-        total_checks = 0
+        Returns:
+            List of {'code', 'name', 'score'} sorted by descending score
+        """
+        scores = self._score_segments(target_attributes)
+        order = np.argsort(-scores, kind='stable')[:top_n]
+        return [{
+            'code': self._segment_codes[row],
+            'name': self.prizm_segments[self._segment_codes[row]].get('name', self._segment_codes[row]),
+            'score': float(scores[row])
+        } for row in order]
+    
+    def _score_segments(self, target_attributes: List[str]) -> np.ndarray:
+        """
+        Compatibility of every segment, as (segments x attributes) @ attribute weights
+        
+        A direct match scores 1; otherwise the first partial-match rule whose
+        terms appear in both the attribute and the segment gives its score.
+        """
+        if not target_attributes:
+            return np.zeros(len(self._segment_codes))
+        attributes, counts = np.unique([attribute.lower() for attribute in target_attributes], return_counts=True)
+        columns = [self._attribute_column(attribute) for attribute in attributes]
+        lengths = [len(rows) for rows, _ in columns]
+        matches = sparse.csc_matrix(
+            (np.concatenate([values for _, values in columns]), np.concatenate([rows for rows, _ in columns]),
+             np.concatenate([[0], np.cumsum(lengths)])),
+            shape=(len(self._segment_codes), len(columns))
+        )
+        return matches @ (counts / len(target_attributes))
+    
+    def _attribute_column(self, attribute: str):
+        """Nonzero (segment rows, scores) of one lower-cased attribute's sparse match column, cached"""
+        column = self._attribute_columns.get(attribute)
+        if column is not None:
+            return column
         
-        # Convert segment data to searchable text
-        segment_text = json.dumps(segment).lower()
+        values = np.zeros(len(self._segment_codes))
+        # Walk the rules backwards so the first applicable rule wins, as in an elif chain
+        for rule, (attribute_terms, _, score) in reversed(list(enumerate(self.COMPATIBILITY_RULES))):
+            if any(term in attribute for term in attribute_terms):
+                values[self._rule_flags[:, rule]] = score
+        values[self._segments_containing(attribute)] = 1.0
         
-        # Check each target attribute
-        for attribute in target_attributes:
-            attr_lower = attribute.lower()
-            total_checks += 1
-            
-            # Direct match
-            if attr_lower in segment_text:
-                matches += 1
-            # Partial matches for common terms
-            elif any(term in attr_lower for term in ['high income', 'affluent']) and \
-                 any(term in segment_text for term in ['150,000+', '100,000']):
-                matches += 0.7
-            elif 'millennial' in attr_lower and '25-34' in segment_text:
-                matches += 0.8
-            elif 'urban' in attr_lower and 'urban' in segment_text:
-                matches += 1
-            elif 'environmental' in attr_lower and 'conscious' in segment_text:
-                matches += 0.6
-                
-        return matches / total_checks if total_checks > 0 else 0.0
+        rows = np.flatnonzero(values)
+        column = (rows, values[rows])
+        if len(self._attribute_columns) >= self.ATTRIBUTE_CACHE_SIZE:
+            self._attribute_columns.pop(next(iter(self._attribute_columns)))
+        self._attribute_columns[attribute] = column
+        return column
+    
+    def _segments_containing(self, needle: str) -> np.ndarray:
+        """Rows of the segments whose profile text contains needle, from finds over the joined text"""
+        rows = np.zeros(len(self._segment_codes), dtype=bool)
+        if not needle:
+            rows[:] = True
+            return rows
+        offsets = self._segment_offsets
+        position = self._segment_text.find(needle)
+        while position >= 0:
+            row = np.searchsorted(offsets, position, side='right') - 1
+            if position + len(needle) < offsets[row + 1]:
+                rows[row] = True
+                # One hit per segment is enough: resume at the next segment
+                position = self._segment_text.find(needle, offsets[row + 1])
+            else:
+                position = self._segment_text.find(needle, position + 1)
+        return rows
 
 
 # Test the analyzer
@@ -0,0 +1,146 @@
+"""
+PRIZM 2024 reference table
+Parses the Quick Reference Guide workbook once and serves every segment from a
+compact pickle cached under a hash of the workbook's contents
+"""
+
+import os
+import glob
+import pickle
+import hashlib
+from typing import Dict, Any, Optional
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_WORKBOOK_PATH = os.path.join(BASE_DIR, 'Synthetic_Data', 'Variable Metadata',
+                                     'PRIZM 2024 Quick Reference Guide.xlsx')
+DEFAULT_CACHE_DIR = os.path.join(BASE_DIR, 'activation_manager', 'cache', 'prizm_reference')
+
+SEGMENT_SHEET = 'PRIZM 2024 QRG'
+WEALTH_SHEET = 'Wealth Detail'
+CACHE_VERSION = 1
+
+
+def load_prizm_reference(workbook_path: Optional[str] = DEFAULT_WORKBOOK_PATH,
+                         cache_dir: Optional[str] = DEFAULT_CACHE_DIR) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Every PRIZM segment from the workbook, keyed by two-digit segment code
+
+    The first call parses the workbook with openpyxl and pickles the raw
+    table to cache_dir as prizm_reference_<content hash>.pkl; later calls
+    only hash the workbook and unpickle. Returns None (with a warning) when
+    the workbook is missing or cannot be parsed.
+    """
+    if not workbook_path or not os.path.exists(workbook_path):
+        return None
+    with open(workbook_path, 'rb') as f:
+        content_hash = hashlib.sha256(f.read()).hexdigest()
+
+    cache_path = os.path.join(cache_dir, f"prizm_reference_{content_hash[:16]}.pkl") if cache_dir else None
+    table = None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.get('version') == CACHE_VERSION and cached.get('content_hash') == content_hash:
+                table = cached
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            print(f"Warning: Ignoring unreadable PRIZM cache {cache_path}: {e}")
+
+    if table is None:
+        try:
+            table = _parse_workbook(workbook_path)
+        except ImportError:
+            print("Warning: openpyxl is not installed, cannot read the PRIZM reference workbook")
+            return None
+        except Exception as e:
+            print(f"Warning: Could not parse PRIZM reference {workbook_path}: {e}")
+            return None
+        table['content_hash'] = content_hash
+        if cache_path:
+            _write_cache(table, cache_path)
+
+    return build_segment_profiles(table)
+
+
+def _parse_workbook(workbook_path: str) -> Dict[str, Any]:
+    """Read the segment and wealth sheets into a compact table of header plus row tuples"""
+    import openpyxl
+    workbook = openpyxl.load_workbook(workbook_path, read_only=True, data_only=True)
+    try:
+        rows = workbook[SEGMENT_SHEET].iter_rows(values_only=True)
+        columns = [str(name).strip() for name in next(rows)]
+        # Labels carry stray double and non-breaking spaces
+        segments = [tuple(' '.join(value.split()) if isinstance(value, str) else value for value in row)
+                    for row in rows if row and row[0] is not None]
+
+        wealth_detail = {}
+        if WEALTH_SHEET in workbook.sheetnames:
+            for level, bracket in workbook[WEALTH_SHEET].iter_rows(min_col=1, max_col=2, values_only=True):
+                if level:
+                    wealth_detail[' '.join(str(level).split())] = ' '.join(str(bracket).split())
+    finally:
+        workbook.close()
+    return {'version': CACHE_VERSION, 'columns': columns, 'rows': segments, 'wealth_detail': wealth_detail}
+
+
+def _write_cache(table: Dict[str, Any], cache_path: str):
+    """Pickle the table atomically and drop caches of older workbook versions"""
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+        for stale in glob.glob(os.path.join(os.path.dirname(cache_path), 'prizm_reference_*.pkl')):
+            if stale != cache_path:
+                os.remove(stale)
+    except OSError as e:
+        print(f"Warning: Could not write PRIZM cache {cache_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def build_segment_profiles(table: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Segment profiles in the PRIZMAnalyzer layout from the raw table
+
+    Workbook columns without a place in the analyzer layout (social group,
+    lifestage, households, language, ...) are kept under 'reference'.
+    """
+    wealth_detail = table.get('wealth_detail', {})
+    profiles = {}
+    for row in table['rows']:
+        record = {name: value for name, value in zip(table['columns'], row)}
+        income_level = str(record.get('Income Level') or 'Unknown').strip()
+        average_income = record.get('Average Income')
+        income = f"${average_income:,.0f} average" if isinstance(average_income, (int, float)) else 'Unknown'
+        if income_level in wealth_detail:
+            income += f" ({income_level}, {wealth_detail[income_level]})"
+
+        profiles[f"{int(record['Segment Number']):02d}"] = {
+            "name": record.get('PRIZM Name'),
+            "description": record.get('PRIZM Descriptor'),
+            "demographics": {
+                "age": record.get('Age of Maintainer'),
+                "income": income,
+                "education": record.get('Education'),
+                "location": record.get('Urbanity')
+            },
+            "behaviors": [value for value in (record.get('Job Type'), record.get('Dwelling Type'),
+                                              record.get('Residency')) if value],
+            "psychographics": [value for value in (record.get('Social Group'), record.get('Lifestage'),
+                                                   record.get('Family Status')) if value],
+            "reference": {
+                "social_group_code": record.get('Social Group Code'),
+                "lifestage_code": record.get('LS'),
+                "population": record.get('Population'),
+                "households": record.get('Households'),
+                "household_share": record.get('% of Total Households'),
+                "official_language": record.get('Official Language'),
+                "cultural_diversity": record.get('Cultural Diversity Index'),
+                "average_income": average_income,
+                "income_level": income_level,
+                "children_age": record.get('Age of Children')
+            }
+        }
+    return profiles
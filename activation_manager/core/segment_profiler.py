@@ -0,0 +1,217 @@
+"""
+Segment profiling for clustered audiences
+Groups result rows by cluster label with a counting sort and computes every
+group's statistics in one pass, without sorting or copying the result frame
+"""
+
+import warnings
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional, Tuple
+
+
+class GroupedFrame:
+    """
+    A result frame plus the rows of each group, found with a counting sort
+
+    Rows order[offsets[i]:offsets[i + 1]] of data belong to group_ids[i],
+    in their original order, and codes[row] is the position of the row's
+    group in group_ids. The frame itself is never reordered: profiling,
+    PRIZM analysis and export read each group through rows().
+    """
+
+    def __init__(self, data: pd.DataFrame, labels=None, group_column: str = 'Group'):
+        labels = np.asarray(data[group_column] if labels is None else labels)
+        if len(labels) != len(data):
+            raise ValueError(f"Got {len(labels)} labels for {len(data)} rows")
+        self.data = data
+
+        low = labels.min() if np.issubdtype(labels.dtype, np.integer) and len(labels) else None
+        if low is not None and labels.max() - low <= 4 * len(labels) + 1024:
+            # Cluster labels are small integers: count them directly instead of sorting
+            counts = np.bincount(labels - low)
+            present = np.flatnonzero(counts)
+            self.group_ids = (present + low).astype(labels.dtype)
+            lookup = np.zeros(len(counts), dtype=np.intp)
+            lookup[present] = np.arange(len(present))
+            self.codes = lookup[labels - low]
+            counts = counts[present]
+        else:
+            self.group_ids, self.codes = np.unique(labels, return_inverse=True)
+            counts = np.bincount(self.codes, minlength=len(self.group_ids))
+        self.offsets = np.r_[0, np.cumsum(counts)]
+        # A stable sort of codes narrowed to 8/16 bits is NumPy's radix (counting) sort
+        self.order = np.argsort(self.codes.astype(np.min_scalar_type(max(len(self.group_ids) - 1, 0))),
+                                kind='stable')
+
+    def __len__(self) -> int:
+        return len(self.group_ids)
+
+    def __iter__(self):
+        """Yield (group_id, row positions) for every group in ascending order"""
+        for i, group_id in enumerate(self.group_ids):
+            yield group_id, self.order[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def rows(self, group_id) -> np.ndarray:
+        """Row positions of one group"""
+        position = np.searchsorted(self.group_ids, group_id)
+        if position == len(self.group_ids) or self.group_ids[position] != group_id:
+            raise KeyError(group_id)
+        return self.order[self.offsets[position]:self.offsets[position + 1]]
+
+    def group(self, group_id, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """The rows of one group (only that group is copied)"""
+        data = self.data if columns is None else self.data[columns]
+        return data.iloc[self.rows(group_id)]
+
+    def to_csv(self, buffer, **kwargs):
+        """Write the frame ordered by group, one group at a time"""
+        header = kwargs.pop('header', True)
+        if len(self) == 0:
+            self.data.to_csv(buffer, header=header, **kwargs)
+        for i, (_, rows) in enumerate(self):
+            self.data.iloc[rows].to_csv(buffer, header=header if i == 0 else False, **kwargs)
+
+
+def partition_median(values):
+    """Column-wise median using np.partition instead of a full sort"""
+    n = len(values)
+    upper = n // 2
+    if n % 2 == 1:
+        return np.partition(values, upper, axis=0)[upper]
+    lower = upper - 1
+    parted = np.partition(values, (lower, upper), axis=0)
+    return (parted[lower] + parted[upper]) / 2
+
+
+def group_slices(labels) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sort rows by label once and locate each label's contiguous block
+
+    Returns (order, unique_labels, bounds): rows order[bounds[i]:bounds[i + 1]]
+    all carry unique_labels[i].
+    """
+    labels = np.asarray(labels)
+    order = np.argsort(labels, kind='stable')
+    sorted_labels = labels[order]
+    starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]]) if len(labels) else np.array([], dtype=int)
+    return order, sorted_labels[starts], np.r_[starts, len(labels)]
+
+
+def grouped_medians(values, labels, skipna: bool = False, return_l1: bool = False, slices=None):
+    """
+    Per-label column medians from one argsort of the labels
+
+    Each group is a contiguous slice of the label-sorted matrix, so no
+    boolean mask over the full data is built per group. With return_l1 the
+    total absolute deviation from the median is returned for each group.
+    skipna ignores NaN like pandas does. slices takes an existing
+    (order, unique_labels, bounds) grouping, such as a GroupedFrame's
+    order, group_ids and offsets, in place of sorting labels.
+
+    Returns (unique_labels, medians) or (unique_labels, medians, l1).
+    """
+    values = np.asarray(values)
+    if not np.issubdtype(values.dtype, np.floating):
+        values = values.astype(float)
+    if values.ndim == 1:
+        values = values[:, None]
+    order, unique_labels, bounds = group_slices(labels) if slices is None else slices
+    sorted_values = values[order]
+    medians = np.empty((len(unique_labels), values.shape[1]))
+    l1 = np.empty(len(unique_labels))
+
+    for i in range(len(unique_labels)):
+        block = sorted_values[bounds[i]:bounds[i + 1]]
+        if skipna and np.isnan(block).any():
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                medians[i] = np.nanmedian(block, axis=0)
+        else:
+            medians[i] = partition_median(block)
+        if return_l1:
+            deviations = np.abs(block - medians[i].astype(block.dtype))
+            l1[i] = np.nansum(deviations, dtype=np.float64) if skipna else deviations.sum(dtype=np.float64)
+
+    if return_l1:
+        return unique_labels, medians, l1
+    return unique_labels, medians
+
+
+def profile_groups(grouped: GroupedFrame, columns: Optional[List[str]] = None,
+                   exclude: Optional[List[str]] = None, top_k: Optional[int] = 5) -> Dict[Any, Dict[str, Dict[str, Any]]]:
+    """
+    Statistics for every column of every group in one pass
+
+    Numeric columns get count, mean, median, std (ddof=1), min and max,
+    ignoring NaN like pandas. Other columns get the top_k values by count
+    (all values when top_k is None) from one bincount over (group, value)
+    codes; ties keep the order values first appear in the data.
+
+    Returns {group_id: {column: stats}} with stats['type'] set to 'numeric'
+    or 'categorical'.
+    """
+    data = grouped.data
+    exclude = set(exclude or [])
+    columns = [col for col in (columns or data.columns) if col not in exclude]
+    numeric_columns = [col for col in columns if pd.api.types.is_numeric_dtype(data[col])
+                       and not isinstance(data[col].dtype, pd.CategoricalDtype)]
+    categorical_columns = [col for col in columns if col not in numeric_columns]
+    profiles = {group_id: {} for group_id in grouped.group_ids}
+
+    if numeric_columns:
+        # One contiguous row per column so each group's gather and reductions run along memory
+        values = np.vstack([data[col].to_numpy(dtype=np.float64, na_value=np.nan) for col in numeric_columns])
+        _, medians = grouped_medians(values.T, None, skipna=True,
+                                     slices=(grouped.order, grouped.group_ids, grouped.offsets))
+        for i, (group_id, rows) in enumerate(grouped):
+            block = values[:, rows]
+            missing = np.isnan(block)
+            if missing.any():
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', RuntimeWarning)
+                    stats = {
+                        'count': (~missing).sum(axis=1),
+                        'mean': np.nanmean(block, axis=1),
+                        'median': medians[i],
+                        'std': np.nanstd(block, axis=1, ddof=1),
+                        'min': np.nanmin(block, axis=1),
+                        'max': np.nanmax(block, axis=1)
+                    }
+            else:
+                stats = {
+                    'count': np.full(len(block), block.shape[1]),
+                    'mean': block.mean(axis=1),
+                    'median': medians[i],
+                    'std': block.std(axis=1, ddof=1) if block.shape[1] > 1 else np.full(len(block), np.nan),
+                    'min': block.min(axis=1),
+                    'max': block.max(axis=1)
+                }
+            for j, col in enumerate(numeric_columns):
+                profile = {'type': 'numeric'}
+                profile.update({name: stat[j].item() for name, stat in stats.items()})
+                profiles[group_id][col] = profile
+
+    n_groups = len(grouped)
+    for col in categorical_columns:
+        codes, uniques = pd.factorize(data[col])
+        valid = codes >= 0
+        n_values = max(len(uniques), 1)
+        table = np.bincount(grouped.codes[valid] * n_values + codes[valid],
+                            minlength=n_groups * n_values).reshape(n_groups, n_values)
+        ranked = np.argsort(-table, axis=1, kind='stable')
+        for i, group_id in enumerate(grouped.group_ids):
+            top = ranked[i] if top_k is None else ranked[i][:top_k]
+            top = top[table[i, top] > 0]
+            profiles[group_id][col] = {
+                'type': 'categorical',
+                'count': int(table[i].sum()),
+                'distribution': {uniques[k]: int(table[i, k]) for k in top},
+                'dominant_value': uniques[top[0]] if len(top) else None,
+                'dominant_count': int(table[i, top[0]]) if len(top) else 0
+            }
+    return {group_id: {col: profile[col] for col in columns} for group_id, profile in profiles.items()}
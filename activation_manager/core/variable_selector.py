@@ -13,13 +13,27 @@ from sklearn.metrics.pairwise import cosine_similarity
 import logging
 from openai import OpenAI
 
+try:
+    from .embedding_cache import QueryEmbeddingCache
+except ImportError:
+    from embedding_cache import QueryEmbeddingCache
+
 logger = logging.getLogger(__name__)
 
 class VariableSelector:
     """Enhanced variable selector with semantic search capabilities"""
     
-    def __init__(self, openai_api_key: Optional[str] = None):
-        """Initialize with full dataset and embeddings"""
+    EMBEDDING_MODEL = "text-embedding-ada-002"
+    
+    def __init__(self, openai_api_key: Optional[str] = None,
+                 embedding_cache: Optional[QueryEmbeddingCache] = None):
+        """
+        Initialize with full dataset and embeddings
+        
+        Query embeddings are cached in embedding_cache (by default memory
+        plus the shared SQLite file under cache/), so repeated searches skip
+        the OpenAI call.
+        """
         self.variables = {}
         self.variable_ids = []
         self.tfidf_vectorizer = None
@@ -27,6 +41,7 @@ class VariableSelector:
         self.embeddings = None
         self.faiss_index = None
         self.openai_client = None
+        self.embedding_cache = embedding_cache if embedding_cache is not None else QueryEmbeddingCache()
         
         if openai_api_key:
             self.openai_client = OpenAI(api_key=openai_api_key)
@@ -218,12 +233,8 @@ class VariableSelector:
             return []
             
         try:
-            # Get query embedding
-            response = self.openai_client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=query
-            )
-            query_embedding = np.array(response.data[0].embedding).astype('float32')
+            # Get query embedding, from the cache when this query was embedded before
+            query_embedding = self.embedding_cache.get_or_create(query, self.EMBEDDING_MODEL, self._embed_query)
             
             # Search in FAISS
             distances, indices = self.faiss_index.search(
@@ -248,6 +259,14 @@ class VariableSelector:
             logger.error(f"Semantic search error: {str(e)}")
             return []
             
+    def _embed_query(self, query: str) -> List[float]:
+        """Embed a query with the OpenAI embeddings API"""
+        response = self.openai_client.embeddings.create(
+            model=self.EMBEDDING_MODEL,
+            input=query
+        )
+        return response.data[0].embedding
+            
     def _merge_results(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Merge and deduplicate results from different search methods"""
         seen = {}
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark for ConstrainedKMedians clustering engines
+Compares the KMeans approximation with the native k-medians engine
+on synthetic data, reporting runtime and the L1 score used to pick k
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+# Add core directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core'))
+
+from audience_builder import ConstrainedKMedians
+
+
+def make_dataset(n_rows: int, n_features: int = 8, n_blobs: int = 12, seed: int = 42) -> pd.DataFrame:
+    """Create blob data with uneven spreads and a few heavy-tailed columns"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 4, (n_blobs, n_features))
+    blob = rng.integers(0, n_blobs, n_rows)
+    values = centers[blob] + rng.standard_t(3, (n_rows, n_features))
+    return pd.DataFrame(values, columns=[f'VAR_{i}' for i in range(n_features)])
+
+
+def run_benchmark(n_rows: int, configs: list) -> list:
+    """Fit each configuration on the same data and collect timings and scores"""
+    data = make_dataset(n_rows)
+    results = []
+
+    for name, params in configs:
+        clusterer = ConstrainedKMedians(**params)
+        start = time.perf_counter()
+        labels = clusterer.fit_predict(data)
+        elapsed = time.perf_counter() - start
+
+        report = clusterer.search_report_
+        best = next(c for c in report['candidates'] if c['n_clusters'] == report['best_k'])
+        sizes = np.bincount(labels)
+        results.append({
+            'name': name,
+            'seconds': round(elapsed, 2),
+            'best_k': report['best_k'],
+            'l1_score': round(best['score'], 4),
+            'min_size_pct': round(sizes.min() / n_rows * 100, 2),
+            'max_size_pct': round(sizes.max() / n_rows * 100, 2)
+        })
+        print(f"{name:<28} {results[-1]['seconds']:>8.2f}s  k={results[-1]['best_k']:<3} "
+              f"L1={results[-1]['l1_score']:<8} sizes {results[-1]['min_size_pct']}%-{results[-1]['max_size_pct']}%")
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark ConstrainedKMedians engines')
+    parser.add_argument('--rows', type=int, default=20000, help='Number of synthetic rows')
+    args = parser.parse_args()
+
+    print(f"Benchmarking on {args.rows} rows")
+    print("=" * 80)
+    run_benchmark(args.rows, [
+        ('kmeans (current path)', {'engine': 'kmeans'}),
+        ('kmedians', {'engine': 'kmedians'}),
+        ('kmeans + flow', {'engine': 'kmeans', 'assignment': 'flow'}),
+        ('kmedians + flow', {'engine': 'kmedians', 'assignment': 'flow'}),
+    ])
@@ -157,9 +157,9 @@ class TestEnhancedAudienceAPI(unittest.TestCase):
         self.assertIn('total_suggested', data)
         self.assertEqual(data['data_type'], 'first_party')
     
-    @patch('api.enhanced_audience_api.data_retriever')
-    @patch('api.enhanced_audience_api.clusterer')
-    def test_complete_workflow(self, mock_clusterer, mock_retriever):
+    @patch('api.enhanced_audience_api.dataset_registry.acquire')
+    @patch('api.enhanced_audience_api.ConstrainedKMedians.fit_predict')
+    def test_complete_workflow(self, mock_fit_predict, mock_acquire):
         """Test complete workflow from query to segments"""
         # Mock data
         mock_data = pd.DataFrame({
@@ -167,8 +167,10 @@ class TestEnhancedAudienceAPI(unittest.TestCase):
             'var2': ['A', 'B', 'A', 'B', 'A'],
             'Group': [0, 0, 1, 1, 0]
         })
+        mock_retriever = mock_acquire.return_value.__enter__.return_value
         mock_retriever.fetch_data.return_value = mock_data.drop('Group', axis=1)
-        mock_clusterer.fit_predict.return_value = mock_data['Group'].values
+        mock_retriever.get_fingerprint.return_value = None
+        mock_fit_predict.return_value = mock_data['Group'].values
         
         # Start session
         session_response = self.client.post('/api/nl/start_session')
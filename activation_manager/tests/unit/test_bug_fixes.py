@@ -40,7 +40,10 @@ class TestBugFixes(unittest.TestCase):
         session_id = session_data['session_id']
         
         # Mock the data retriever to return test data
-        with patch('api.enhanced_audience_api.data_retriever.fetch_data') as mock_fetch:
+        with patch('api.enhanced_audience_api.dataset_registry.acquire') as mock_acquire:
+            mock_retriever = mock_acquire.return_value.__enter__.return_value
+            mock_retriever.get_fingerprint.return_value = None
+            mock_fetch = mock_retriever.fetch_data
             # Create test data
             test_data = pd.DataFrame({
                 'VAR1': np.random.choice(['A', 'B', 'C'], 100),
@@ -98,7 +101,10 @@ class TestBugFixes(unittest.TestCase):
         session_id = session_data['session_id']
         
         # Mock the data retriever to return empty dataframe
-        with patch('api.enhanced_audience_api.data_retriever.fetch_data') as mock_fetch:
+        with patch('api.enhanced_audience_api.dataset_registry.acquire') as mock_acquire:
+            mock_retriever = mock_acquire.return_value.__enter__.return_value
+            mock_retriever.get_fingerprint.return_value = None
+            mock_fetch = mock_retriever.fetch_data
             mock_fetch.return_value = pd.DataFrame()
             
             # Test confirm action
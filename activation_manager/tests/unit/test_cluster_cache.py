@@ -0,0 +1,115 @@
+"""
+Unit tests for ClusterModelCache
+"""
+
+import unittest
+import tempfile
+import os
+import numpy as np
+from cluster_cache import ClusterModelCache
+
+
+class TestClusterModelCache(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = ClusterModelCache(self.temp_dir, max_entries=2)
+        self.settings = {'min_size_pct': 0.05, 'max_size_pct': 0.10}
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        import shutil
+        shutil.rmtree(self.temp_dir)
+
+    def test_key_ignores_variable_order(self):
+        """Test that the key uses the sorted variable codes"""
+        key_a = ClusterModelCache.make_key(['B', 'A'], self.settings, 'data-v1')
+        key_b = ClusterModelCache.make_key(['A', 'B'], self.settings, 'data-v1')
+        self.assertEqual(key_a, key_b)
+
+        # Different dataset or constraints must not collide
+        self.assertNotEqual(key_a, ClusterModelCache.make_key(['A', 'B'], self.settings, 'data-v2'))
+        self.assertNotEqual(key_a, ClusterModelCache.make_key(['A', 'B'], {'min_size_pct': 0.04}, 'data-v1'))
+
+    def test_put_and_get(self):
+        """Test round trip of labels, centers and feature layout"""
+        key = ClusterModelCache.make_key(['A'], self.settings, 'data-v1')
+        layout = {'center': np.zeros(2, dtype=np.float32), 'scale': np.ones(2, dtype=np.float32)}
+        self.cache.put(key, np.array([0, 1, 1, 0]), np.eye(2), layout)
+
+        entry = self.cache.get(key)
+        np.testing.assert_array_equal(entry['labels'], [0, 1, 1, 0])
+        np.testing.assert_array_equal(entry['centers'], np.eye(2))
+        np.testing.assert_array_equal(entry['feature_layout']['scale'], [1, 1])
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first"""
+        for name in ['a', 'b']:
+            self.cache.put(name, np.zeros(3), None)
+        self.cache.get('a')
+        self.cache.put('c', np.zeros(3), None)
+
+        self.assertEqual(set(self.cache._entries), {'a', 'c'})
+
+    def test_size_eviction(self):
+        """Test that entries are evicted to stay within the byte budget"""
+        cache = ClusterModelCache(max_entries=10, max_bytes=1000)
+        cache.put('a', np.zeros(200), None)
+        cache.put('b', np.zeros(200), None)
+
+        self.assertEqual(list(cache._entries), ['b'])
+        self.assertLessEqual(cache.stats()['bytes'], 1000)
+
+    def test_persists_to_disk(self):
+        """Test that a new cache instance reads entries written by another"""
+        self.cache.put('a', np.array([2, 0, 1]), np.ones((3, 2)))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'a.npz')))
+
+        reloaded = ClusterModelCache(self.temp_dir)
+        np.testing.assert_array_equal(reloaded.get('a')['labels'], [2, 0, 1])
+
+        reloaded.clear()
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_disk_layout_round_trip(self):
+        """Test a full feature layout survives the disk format and pickled files are refused"""
+        layout = {
+            'numeric_columns': ['INCOME', 7],
+            'fill_values': np.array([1.5, 0.0], dtype=np.float32),
+            'categories': {'REGION': ['east', 'west'], 3: [np.int64(2), np.int64(5)]},
+            'center': np.zeros(6, dtype=np.float32),
+            'scale': np.ones(6, dtype=np.float32),
+            'n_features': 6
+        }
+        self.cache.put('a', np.array([0, 1]), np.eye(2, 6), layout)
+
+        loaded = ClusterModelCache(self.temp_dir).get('a')['feature_layout']
+        self.assertEqual(loaded['numeric_columns'], ['INCOME', 7])
+        self.assertEqual(loaded['categories'], {'REGION': ['east', 'west'], 3: [2, 5]})
+        self.assertEqual(loaded['n_features'], 6)
+        self.assertEqual(loaded['fill_values'].dtype, np.float32)
+        np.testing.assert_array_equal(loaded['fill_values'], [1.5, 0.0])
+
+        # A file holding pickled objects is a miss, never unpickled
+        with open(os.path.join(self.temp_dir, 'b.npz'), 'wb') as f:
+            np.savez(f, labels=np.array([{'x': 1}], dtype=object))
+        self.assertIsNone(ClusterModelCache(self.temp_dir).get('b'))
+
+    def test_unwritable_directory_caches_in_memory(self):
+        """Test a cache directory that cannot be created falls back to memory only"""
+        blocker = os.path.join(self.temp_dir, 'not_a_directory')
+        open(blocker, 'w').close()
+        cache = ClusterModelCache(os.path.join(blocker, 'models'))
+
+        self.assertIsNone(cache.cache_dir)
+        cache.put('a', np.array([1, 0]), None)
+        np.testing.assert_array_equal(cache.get('a')['labels'], [1, 0])
+        cache.clear()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
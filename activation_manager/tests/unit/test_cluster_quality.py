@@ -0,0 +1,53 @@
+"""
+Unit tests for sampled cluster quality metrics
+"""
+
+import unittest
+import numpy as np
+from sklearn.metrics import silhouette_score
+from cluster_quality import (sample_indices, sampled_silhouette, centroid_davies_bouldin,
+                             constraint_violations, quality_report)
+
+
+class TestClusterQuality(unittest.TestCase):
+
+    def setUp(self):
+        """Three well separated blobs"""
+        rng = np.random.default_rng(42)
+        centers = np.array([[0, 0], [10, 0], [0, 10]])
+        self.labels = rng.integers(0, 3, 3000)
+        self.data = centers[self.labels] + rng.normal(size=(3000, 2))
+
+    def test_sample_is_fixed(self):
+        """Test the same sample is drawn for every call"""
+        np.testing.assert_array_equal(sample_indices(3000, 500), sample_indices(3000, 500))
+        self.assertEqual(len(sample_indices(3000, 500)), 500)
+        np.testing.assert_array_equal(sample_indices(100, 500), np.arange(100))
+
+    def test_sampled_silhouette(self):
+        """Test sampled silhouette is close to the exact value"""
+        exact = silhouette_score(self.data, self.labels)
+        self.assertAlmostEqual(sampled_silhouette(self.data, self.labels, sample_size=1000), exact, places=1)
+        self.assertEqual(sampled_silhouette(self.data, np.zeros(3000, dtype=int)), 0.0)
+
+    def test_davies_bouldin_prefers_true_clusters(self):
+        """Test Davies-Bouldin is lower for the true labels than for random ones"""
+        random_labels = np.random.default_rng(0).integers(0, 3, 3000)
+        self.assertLess(centroid_davies_bouldin(self.data, self.labels),
+                        centroid_davies_bouldin(self.data, random_labels))
+
+    def test_constraint_violations(self):
+        """Test counting clusters and rows outside the size bounds"""
+        labels = np.repeat([0, 1, 2], [5, 20, 75])
+        violations = constraint_violations(labels, min_size=10, max_size=50)
+        self.assertEqual(violations, {'clusters': 2, 'rows': 30})
+
+    def test_quality_report(self):
+        """Test all metrics are reported together"""
+        report = quality_report(self.data, self.labels, min_size=100, max_size=2000, sample_size=500)
+        self.assertEqual(set(report), {'silhouette', 'davies_bouldin', 'violations'})
+        self.assertEqual(report['violations']['clusters'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
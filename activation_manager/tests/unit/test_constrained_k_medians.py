@@ -5,7 +5,7 @@ Unit tests for ConstrainedKMedians clustering
 import unittest
 import pandas as pd
 import numpy as np
-from audience_builder import ConstrainedKMedians
+from audience_builder import ConstrainedKMedians, grouped_medians
 
 
 class TestConstrainedKMedians(unittest.TestCase):
@@ -35,6 +35,11 @@ class TestConstrainedKMedians(unittest.TestCase):
         self.assertIsNone(self.clusterer.labels_)
         self.assertIsNone(self.clusterer.cluster_centers_)
     
+    def test_get_params_round_trip(self):
+        """Test get_params rebuilds an identically configured clusterer"""
+        clusterer = ConstrainedKMedians(min_size_pct=0.1, max_size_pct=0.3, engine='kmedians', sample_size=500)
+        self.assertEqual(ConstrainedKMedians(**clusterer.get_params()).get_params(), clusterer.get_params())
+    
     def test_custom_constraints(self):
         """Test initialization with custom constraints"""
         custom_clusterer = ConstrainedKMedians(min_size_pct=0.08, max_size_pct=0.15)
@@ -190,6 +195,272 @@ class TestConstrainedKMedians(unittest.TestCase):
         # Check that number of clusters is the same
         self.assertEqual(len(np.unique(labels1)), len(np.unique(labels2)))
 
+    def test_size_constraint_repair(self):
+        """Test that bulk repair fixes heavily unbalanced labels"""
+        data = np.random.randn(1000, 3)
+        # One cluster holds half the points, others are tiny
+        labels = np.concatenate([np.zeros(500, dtype=int), np.repeat(np.arange(1, 11), 50)])
+        labels[:30] = 11
+
+        repaired = self.clusterer._apply_size_constraints(data, labels, 12, 50, 100)
+        sizes = np.bincount(repaired, minlength=12)
+
+        self.assertEqual(len(repaired), 1000)
+        self.assertTrue(np.all(sizes >= 50))
+        self.assertTrue(np.all(sizes <= 100))
+        # Input labels must not be modified
+        self.assertEqual(np.sum(labels == 0), 470)
+
+    def test_flow_assignment(self):
+        """Test that flow assignment satisfies size constraints exactly"""
+        clusterer = ConstrainedKMedians(assignment='flow')
+        labels = clusterer.fit_predict(self.test_data)
+        counts = np.bincount(labels)
+
+        self.assertEqual(len(labels), len(self.test_data))
+        self.assertTrue(np.all(counts >= 5))
+        self.assertTrue(np.all(counts <= 10))
+
+    def test_flow_assignment_micro_clusters(self):
+        """Test flow assignment on micro-clusters for larger data"""
+        data = np.random.randn(3000, 4)
+        centers = data[np.random.choice(3000, 15, replace=False)]
+        clusterer = ConstrainedKMedians(assignment='flow', flow_max_points=500)
+
+        labels = clusterer._flow_assignment(data, centers, 150, 300)
+        counts = np.bincount(labels, minlength=15)
+
+        self.assertEqual(len(labels), 3000)
+        self.assertTrue(np.all(counts >= 150))
+        self.assertTrue(np.all(counts <= 300))
+
+    def test_flow_assignment_infeasible(self):
+        """Test that infeasible flow constraints return None"""
+        clusterer = ConstrainedKMedians(assignment='flow')
+        data = np.random.randn(100, 2)
+        self.assertIsNone(clusterer._flow_assignment(data, data[:3], 40, 50))
+
+    def test_invalid_assignment_mode(self):
+        """Test that unknown assignment modes are rejected"""
+        with self.assertRaises(ValueError):
+            ConstrainedKMedians(assignment='hungarian')
+
+    def test_parallel_k_sweep(self):
+        """Test that the process pool sweep matches the serial sweep"""
+        serial = ConstrainedKMedians().fit_predict(self.test_data)
+        parallel_clusterer = ConstrainedKMedians(n_jobs=2)
+        parallel = parallel_clusterer.fit_predict(self.test_data)
+
+        np.testing.assert_array_equal(serial, parallel)
+        self.assertEqual(len(parallel_clusterer.cluster_centers_), len(np.unique(parallel)))
+
+    def test_warm_search(self):
+        """Test warm-started search with early stopping"""
+        data = pd.DataFrame({
+            'a': np.random.randn(1000),
+            'b': np.random.randn(1000)
+        })
+        clusterer = ConstrainedKMedians(search='warm', min_improvement=0.05)
+        labels = clusterer.fit_predict(data)
+        report = clusterer.search_report_
+
+        counts = np.bincount(labels)
+        self.assertTrue(np.all(counts >= 50))
+        self.assertTrue(np.all(counts <= 100))
+        self.assertIn(report['stop_reason'], ('no_improvement', 'exhausted'))
+        self.assertEqual(report['candidates'][0]['n_clusters'], 10)
+        self.assertEqual(len(np.unique(labels)), report['best_k'])
+        for candidate in report['candidates']:
+            self.assertGreaterEqual(candidate['seconds'], 0)
+
+    def test_full_search_report(self):
+        """Test that the full sweep reports every candidate"""
+        self.clusterer.fit_predict(self.test_data)
+        report = self.clusterer.search_report_
+
+        self.assertEqual(report['stop_reason'], 'exhausted')
+        self.assertEqual([c['n_clusters'] for c in report['candidates']], list(range(10, 20)))
+
+    def test_sampled_streaming_mode(self):
+        """Test fitting on a sample and streaming all rows through the centers"""
+        data = pd.DataFrame({
+            'a': np.random.randn(5000),
+            'b': np.random.randn(5000),
+            'c': np.random.choice(['X', 'Y', 'Z'], 5000)
+        })
+        clusterer = ConstrainedKMedians(sample_size=500, chunk_size=1200)
+        labels = clusterer.fit_predict(data)
+        counts = np.bincount(labels)
+
+        self.assertEqual(len(labels), 5000)
+        self.assertTrue(np.all(counts >= 250))
+        self.assertTrue(np.all(counts <= 500))
+        self.assertEqual(clusterer.search_report_['sample_size'], 500)
+        self.assertEqual(len(clusterer.cluster_centers_), len(counts))
+
+    def test_streaming_short_last_chunk(self):
+        """Test a final chunk of a few rows still leaves every cluster within bounds"""
+        rng = np.random.default_rng(0)
+        data = pd.DataFrame({'a': rng.normal(size=20000), 'b': rng.normal(size=20000),
+                             'c': rng.exponential(size=20000)})
+        clusterer = ConstrainedKMedians(sample_size=3000, chunk_size=3333, engine='kmedians')
+        labels = clusterer.fit_predict(data)
+        counts = np.bincount(labels)
+
+        self.assertEqual(20000 % 3333, 2)
+        self.assertTrue(np.all(labels >= 0))
+        self.assertTrue(np.all(counts >= int(20000 * clusterer.min_size_pct)))
+        self.assertTrue(np.all(counts <= int(20000 * clusterer.max_size_pct)))
+
+    def test_assign_with_bounds(self):
+        """Test the greedy fallback fills lower bounds first and never leaves a row unassigned"""
+        distances = np.array([[0.0, 5.0], [0.0, 5.0], [0.0, 5.0], [1.0, 2.0]])
+        targets = self.clusterer._assign_with_bounds(distances, np.array([0, 2]), np.array([4, 4]))
+        self.assertEqual(np.bincount(targets, minlength=2).tolist(), [2, 2])
+        self.assertEqual(targets[3], 1)
+
+        # Capacity short of the rows: the rest go to their nearest column
+        targets = self.clusterer._assign_with_bounds(distances, np.array([0, 0]), np.array([1, 1]))
+        self.assertTrue(np.all(targets >= 0))
+
+    def test_kmedians_engine(self):
+        """Test the native L1 k-medians engine"""
+        clusterer = ConstrainedKMedians(engine='kmedians')
+        labels = clusterer.fit_predict(self.test_data)
+        counts = np.bincount(labels)
+
+        self.assertEqual(len(labels), len(self.test_data))
+        self.assertTrue(np.all(counts >= 5))
+        self.assertTrue(np.all(counts <= 10))
+        self.assertEqual(len(clusterer.cluster_centers_), len(counts))
+
+    def test_partition_median(self):
+        """Test that the partition-based median matches np.median"""
+        for n_rows in (1, 2, 7, 10):
+            values = np.random.randn(n_rows, 4)
+            np.testing.assert_allclose(
+                ConstrainedKMedians._partition_median(values),
+                np.median(values, axis=0)
+            )
+
+    def test_grouped_medians(self):
+        """Test grouped medians and L1 deviations against per-group masking"""
+        data = np.random.randn(500, 3)
+        labels = np.random.randint(0, 7, 500)
+
+        group_ids, medians, l1 = grouped_medians(data, labels, return_l1=True)
+
+        np.testing.assert_array_equal(group_ids, np.unique(labels))
+        for i, label in enumerate(group_ids):
+            cluster_data = data[labels == label]
+            np.testing.assert_allclose(medians[i], np.median(cluster_data, axis=0))
+            self.assertAlmostEqual(l1[i], np.abs(cluster_data - np.median(cluster_data, axis=0)).sum())
+
+    def test_float32_feature_matrix(self):
+        """Test the in-place float32 encoding matches median fill, dummies and scaling"""
+        data = pd.DataFrame({
+            'num': [1.0, np.nan, 3.0, 5.0],
+            'cat': ['a', 'b', None, 'c']
+        })
+        clusterer = ConstrainedKMedians()
+        layout = clusterer._fit_feature_layout(data)
+        matrix = clusterer._encode_features(data, layout)
+
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertTrue(matrix.flags['C_CONTIGUOUS'])
+        self.assertEqual(matrix.shape, (4, 3))
+
+        expected = pd.concat([data[['num']].fillna(3.0),
+                              pd.get_dummies(data[['cat']], drop_first=True).astype(float)], axis=1)
+        expected = (expected - expected.mean()) / expected.std(ddof=0)
+        np.testing.assert_allclose(matrix, expected.to_numpy(), rtol=1e-5, atol=1e-6)
+
+        clusterer.fit_predict(pd.DataFrame({'x': np.random.randn(200), 'y': np.random.randn(200)}))
+        self.assertEqual(clusterer.feature_report_['dtype'], 'float32')
+        self.assertEqual(clusterer.feature_report_['features'], 2)
+
+        # The peak is measured around the encode, so it covers the matrix but not earlier allocations
+        wide = pd.DataFrame(np.random.randn(2000, 50), columns=[f'c{i}' for i in range(50)])
+        clusterer.fit_predict(wide)
+        report = clusterer.feature_report_
+        self.assertGreaterEqual(report['encode_peak_mb'], report['matrix_mb'])
+        self.assertLess(report['encode_peak_mb'], 10 * report['matrix_mb'])
+
+    def test_predict_new_rows(self):
+        """Test out-of-sample assignment reproduces nearest-median labels"""
+        clusterer = ConstrainedKMedians(engine='kmedians')
+        labels = clusterer.fit_predict(self.test_data)
+
+        # Rows from the fitted data land in a cluster whose median is nearest
+        new_rows = self.test_data.sample(200, replace=True, random_state=1)
+        predicted = clusterer.predict(new_rows, chunk_size=64)
+        self.assertEqual(len(predicted), 200)
+        self.assertTrue(set(predicted) <= set(labels))
+
+        encoded = clusterer.transform(new_rows)
+        self.assertEqual(encoded.dtype, np.float32)
+        expected = np.argmin(np.abs(encoded[:, None, :] - clusterer.cluster_centers_[None]).sum(axis=2), axis=1)
+        np.testing.assert_array_equal(predicted, np.unique(labels)[expected])
+
+    def test_predict_respects_capacity(self):
+        """Test capacity-aware predict keeps clusters within max_size_pct"""
+        clusterer = ConstrainedKMedians()
+        labels = clusterer.fit_predict(self.test_data)
+        new_rows = self.test_data.sample(300, replace=True, random_state=2)
+
+        predicted = clusterer.predict(new_rows, chunk_size=100, respect_capacity=True)
+        combined = np.bincount(np.concatenate([labels, predicted]))
+        self.assertLessEqual(combined.max(), int((len(labels) + 300) * clusterer.max_size_pct))
+
+    def test_predict_chunks(self):
+        """Test streamed assignment matches predict and carries capacity across chunks"""
+        clusterer = ConstrainedKMedians()
+        labels = clusterer.fit_predict(self.test_data)
+        new_rows = self.test_data.sample(300, replace=True, random_state=2)
+        chunks = [new_rows.iloc[start:start + 70] for start in range(0, 300, 70)]
+
+        streamed = list(clusterer.predict_chunks(chunks))
+        self.assertEqual([len(part) for part in streamed], [70, 70, 70, 70, 20])
+        np.testing.assert_array_equal(np.concatenate(streamed), clusterer.predict(new_rows))
+
+        capped = np.concatenate(list(clusterer.predict_chunks(chunks, respect_capacity=True, total_rows=300)))
+        combined = np.bincount(np.concatenate([labels, capped]))
+        self.assertLessEqual(combined.max(), int((len(labels) + 300) * clusterer.max_size_pct))
+        with self.assertRaises(ValueError):
+            list(clusterer.predict_chunks(chunks, respect_capacity=True))
+
+    def test_selection_criteria(self):
+        """Test k selection with sampled quality criteria"""
+        for criterion in ['silhouette', 'davies_bouldin']:
+            clusterer = ConstrainedKMedians(criterion=criterion, quality_sample_size=50)
+            labels = clusterer.fit_predict(self.test_data)
+
+            report = clusterer.search_report_
+            self.assertEqual(report['criterion'], criterion)
+            self.assertEqual(len(np.unique(labels)), report['best_k'])
+            for candidate in report['candidates']:
+                self.assertIn('violations', candidate)
+
+        with self.assertRaises(ValueError):
+            ConstrainedKMedians(criterion='unknown')
+
+    def test_predict_requires_fit(self):
+        """Test predict before fitting raises"""
+        with self.assertRaises(AttributeError):
+            ConstrainedKMedians().predict(self.test_data)
+
+    def test_refit_clears_previous_model(self):
+        """Test a refit that returns early leaves no stale model from the previous fit"""
+        clusterer = ConstrainedKMedians()
+        for degenerate in [self.test_data.head(1), pd.DataFrame(index=range(50))]:
+            clusterer.fit_predict(self.test_data)
+            clusterer.fit_predict(degenerate)
+            self.assertIsNone(clusterer.cluster_centers_)
+            self.assertIsNone(clusterer.labels_)
+            self.assertIsNone(clusterer.search_report_)
+            with self.assertRaises(AttributeError):
+                clusterer.predict(self.test_data)
+
 
 class TestConstrainedKMediansEdgeCases(unittest.TestCase):
     """Test edge cases and error conditions"""
@@ -7,7 +7,8 @@ import tempfile
 import os
 import pandas as pd
 import numpy as np
-from audience_builder import DataRetriever
+from unittest import mock
+from audience_builder import DataRetriever, summarize_chunks
 
 
 class TestDataRetriever(unittest.TestCase):
@@ -286,6 +287,301 @@ class TestDataRetrieverWithRealData(unittest.TestCase):
         self.assertGreater(len(result), 0)
 
 
+class TestDataRetrieverColumnar(unittest.TestCase):
+    """Test the Parquet/Feather storage backends"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.temp_dir, 'data.csv')
+        np.random.seed(42)
+        pd.DataFrame({
+            'TECH_SCORE': np.random.randint(1, 11, 500),
+            'INCOME': np.random.normal(60000, 15000, 500),
+            'PostalCode': ['K1A' + str(i).zfill(3) for i in range(500)],
+            'PRIZM_SEGMENT': np.random.choice(['Young Digerati', 'Money & Brains'], 500)
+        }).to_csv(self.csv_path, index=False)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir)
+
+    def test_columnar_matches_csv(self):
+        """Test that columnar fetches return the same frame as the CSV path"""
+        csv_retriever = DataRetriever(self.csv_path)
+        csv_retriever.load_data()
+        expected = csv_retriever.fetch_data(['INCOME', 'TECH_SCORE'], sample_size=100)
+
+        for storage in ['parquet', 'feather']:
+            retriever = DataRetriever(self.csv_path, storage=storage)
+            self.assertIsNone(retriever.load_data())
+            self.assertIsNone(retriever.data)
+            self.assertTrue(retriever.is_loaded())
+            self.assertTrue(os.path.exists(os.path.join(self.temp_dir, f'data.{storage}')))
+            self.assertEqual(retriever.n_rows, 500)
+
+            result = retriever.fetch_data(['INCOME', 'TECH_SCORE'], sample_size=100)
+            pd.testing.assert_frame_equal(result, expected)
+
+    def test_columnar_special_columns(self):
+        """Test special column fallback and missing variables in columnar mode"""
+        retriever = DataRetriever(self.csv_path, storage='parquet')
+        result = retriever.fetch_data(['MISSING'])
+        self.assertEqual(list(result.columns), ['PostalCode', 'PRIZM_SEGMENT'])
+        self.assertTrue(retriever.fetch_data(['MISSING'], include_special_columns=False).empty)
+
+    def test_reuses_existing_conversion(self):
+        """Test that an up-to-date columnar copy is not rewritten"""
+        DataRetriever(self.csv_path, storage='parquet').load_data()
+        parquet_path = os.path.join(self.temp_dir, 'data.parquet')
+        mtime = os.path.getmtime(parquet_path)
+
+        DataRetriever(self.csv_path, storage='parquet').load_data()
+        self.assertEqual(os.path.getmtime(parquet_path), mtime)
+
+    def test_memory_mapped_column_store(self):
+        """Test the npy column store serves zero-copy read-only views"""
+        retriever = DataRetriever(self.csv_path, storage='npy')
+        retriever.load_data()
+        store_dir = os.path.join(self.temp_dir, 'data_columns')
+        self.assertTrue(os.path.exists(os.path.join(store_dir, 'manifest.json')))
+        self.assertEqual(retriever.n_rows, 500)
+
+        result = retriever.fetch_data(['INCOME', 'PRIZM_SEGMENT'])
+        income_view = retriever.column_view('INCOME')
+        self.assertIsInstance(income_view, np.memmap)
+        self.assertFalse(income_view.flags.writeable)
+        self.assertTrue(np.shares_memory(result['INCOME'].to_numpy(), income_view))
+
+        # Values match the CSV, with text columns as categories
+        expected = pd.read_csv(self.csv_path)
+        np.testing.assert_array_equal(result['INCOME'].to_numpy(), expected['INCOME'].to_numpy())
+        self.assertEqual(result['PRIZM_SEGMENT'].dtype, 'category')
+        self.assertEqual(list(result['PRIZM_SEGMENT'].astype(str)), list(expected['PRIZM_SEGMENT']))
+
+        # The store directory can be loaded directly
+        direct = DataRetriever(store_dir)
+        direct.load_data()
+        self.assertEqual(direct.storage, 'npy')
+        self.assertEqual(len(direct.fetch_data(['TECH_SCORE'], sample_size=50)), 50)
+
+    def test_downcast_schema(self):
+        """Test compact dtypes at load time keep the same values"""
+        pd.DataFrame({
+            'PostalCode': ['K1A0B1', 'M5V2T6', 'K1A0B1'],
+            'PRIZM_SEGMENT': ['01', '12', '01'],
+            'LATITUDE': [45.42, 43.64, 45.42],
+            'INDEX_VAR': [6, 120, 1495],
+            'POPULATION': [500, 2500, 70000],
+            'NEGATIVE': [-5, 0, -1]
+        }).to_csv(self.csv_path, index=False)
+
+        plain = DataRetriever(self.csv_path).load_data()
+        retriever = DataRetriever(self.csv_path, downcast=True, index_range=(6, 1495), chunk_size=2)
+        compact = retriever.load_data()
+
+        self.assertEqual(compact['PostalCode'].dtype, 'category')
+        self.assertEqual(compact['PRIZM_SEGMENT'].dtype, 'category')
+        # Segment codes keep their leading zeros
+        self.assertEqual(list(compact['PRIZM_SEGMENT']), ['01', '12', '01'])
+        self.assertEqual(compact['LATITUDE'].dtype, np.float32)
+        self.assertEqual(compact['INDEX_VAR'].dtype, np.uint16)
+        self.assertEqual(compact['NEGATIVE'].dtype, np.int8)
+        # Widened again when a later chunk does not fit the first chunk's type
+        self.assertEqual(compact['POPULATION'].dtype, np.uint32)
+
+        for col in ['INDEX_VAR', 'POPULATION', 'NEGATIVE']:
+            np.testing.assert_array_equal(compact[col].to_numpy(), plain[col].to_numpy())
+        np.testing.assert_allclose(compact['LATITUDE'], plain['LATITUDE'], rtol=1e-6)
+
+        # The generator config is only read when downcasting needs it
+        with mock.patch('audience_builder._load_index_range', return_value=(1, 200)) as load_range:
+            self.assertIsNone(DataRetriever(self.csv_path).index_range)
+            load_range.assert_not_called()
+            self.assertEqual(DataRetriever(self.csv_path, downcast=True).index_range, (1, 200))
+
+    def test_filters_match_across_storage(self):
+        """Test filtered fetches agree with pandas on every storage backend"""
+        rng = np.random.default_rng(0)
+        n = 40000
+        data = pd.DataFrame({
+            'TECH_SCORE': np.sort(rng.integers(1, 1000, n)),
+            'INCOME': rng.normal(60000, 15000, n),
+            'PRIZM_SEGMENT': rng.choice(['Young Digerati', 'Money & Brains', 'Kids & Cul-de-Sacs'], n),
+            'LATITUDE': rng.uniform(42, 50, n),
+            'LONGITUDE': rng.uniform(-80, -70, n)
+        })
+        data.to_csv(self.csv_path, index=False)
+
+        filters = [('TECH_SCORE', '>=', 900), ('PRIZM_SEGMENT', 'in', ['Young Digerati', 'Kids & Cul-de-Sacs'])]
+        filters += DataRetriever.bounding_box(44.0, 46.0, -76.0, -74.0)
+        expected = data[(data['TECH_SCORE'] >= 900) & data['PRIZM_SEGMENT'].isin(['Young Digerati', 'Kids & Cul-de-Sacs'])
+                        & data['LATITUDE'].between(44.0, 46.0) & data['LONGITUDE'].between(-76.0, -74.0)]
+
+        for storage in ['csv', 'parquet', 'feather', 'npy']:
+            retriever = DataRetriever(self.csv_path, storage=storage)
+            retriever.load_data()
+            result = retriever.fetch_data(['INCOME', 'TECH_SCORE'], filters=filters)
+            self.assertEqual(list(result.columns), ['INCOME', 'TECH_SCORE'])
+            np.testing.assert_allclose(result['INCOME'].to_numpy(), expected['INCOME'].to_numpy())
+            self.assertEqual(len(retriever.fetch_data(['INCOME'], sample_size=10, filters=filters)), 10)
+
+    def test_filters_with_missing_values_match_across_storage(self):
+        """Test rows with missing values are kept by != and not in on every storage backend"""
+        pd.DataFrame({'ROW': [1, 2, 3, 4], 'V3': [1.0, np.nan, 2.0, np.nan]}).to_csv(self.csv_path, index=False)
+        cases = [(('V3', '!=', 1.0), [2, 3, 4]), (('V3', 'not in', [2.0]), [1, 2, 4]),
+                 (('V3', '>', 1.0), [3]), (('V3', '==', 5.0), [])]
+
+        for storage in ['csv', 'parquet', 'feather', 'npy']:
+            retriever = DataRetriever(self.csv_path, storage=storage)
+            retriever.load_data()
+            for filter_, expected in cases:
+                result = retriever.fetch_data(['ROW'], filters=[filter_])
+                self.assertEqual(result['ROW'].tolist(), expected, (storage, filter_))
+                self.assertEqual(list(result.columns), ['ROW'])
+                streamed = [row for chunk in retriever.iter_chunks(['ROW'], filters=[filter_]) for row in chunk['ROW']]
+                self.assertEqual(streamed, expected, (storage, filter_))
+
+    def test_npy_block_statistics(self):
+        """Test npy blocks outside a range filter are skipped"""
+        pd.DataFrame({'TECH_SCORE': np.arange(40000)}).to_csv(self.csv_path, index=False)
+        retriever = DataRetriever(self.csv_path, storage='npy')
+        retriever.load_data()
+
+        entry = retriever._manifest['TECH_SCORE']
+        self.assertEqual(len(entry['block_min']), 3)
+        self.assertEqual(entry['block_min'][1], DataRetriever.ROW_GROUP_SIZE)
+
+        rows = retriever._matching_rows_npy([('TECH_SCORE', '>', 39990)])
+        np.testing.assert_array_equal(rows, np.arange(39991, 40000))
+        self.assertEqual(len(retriever._matching_rows_npy([('TECH_SCORE', '==', -1)])), 0)
+
+    def test_stratified_sampling(self):
+        """Test stratified samples keep the PRIZM mix and FSA falls back to PostalCode"""
+        retriever = DataRetriever(self.csv_path)
+        retriever.load_data()
+        full_mix = retriever.data['PRIZM_SEGMENT'].value_counts(normalize=True)
+
+        sample = retriever.fetch_data(['INCOME', 'PRIZM_SEGMENT'], sample_size=101, sampling='stratified')
+        self.assertEqual(len(sample), 101)
+        sample_mix = sample['PRIZM_SEGMENT'].value_counts(normalize=True)
+        for segment, share in full_mix.items():
+            self.assertAlmostEqual(sample_mix[segment], share, delta=1 / 101)
+
+        by_fsa = retriever.fetch_data(['INCOME'], sample_size=50, sampling='stratified', stratify_by='FSA')
+        self.assertEqual(len(by_fsa), 50)
+
+        with self.assertRaises(ValueError):
+            retriever.fetch_data(['INCOME'], sample_size=50, sampling='stratified', stratify_by='INCOME')
+
+    def test_hash_sampling_is_stable(self):
+        """Test hash sampling picks the same postal codes across storage and row order"""
+        retriever = DataRetriever(self.csv_path)
+        retriever.load_data()
+        first = retriever.fetch_data(['PostalCode'], sample_size=50, sampling='hash')
+
+        shuffled_path = os.path.join(self.temp_dir, 'shuffled.csv')
+        retriever.data.sample(frac=1, random_state=7).to_csv(shuffled_path, index=False)
+        shuffled = DataRetriever(shuffled_path, storage='npy')
+        shuffled.load_data()
+        second = shuffled.fetch_data(['PostalCode'], sample_size=50, sampling='hash')
+
+        self.assertEqual(set(first['PostalCode']), set(second['PostalCode'].astype(str)))
+
+    def test_reservoir_sampling_streams_csv(self):
+        """Test reservoir sampling reads the CSV in chunks without loading it"""
+        retriever = DataRetriever(self.csv_path, chunk_size=64)
+        sample = retriever.fetch_data(['TECH_SCORE', 'INCOME'], sample_size=40, sampling='reservoir')
+
+        self.assertIsNone(retriever.data)
+        self.assertEqual(len(sample), 40)
+        self.assertEqual(list(sample.columns), ['TECH_SCORE', 'INCOME'])
+        expected = pd.read_csv(self.csv_path)
+        self.assertTrue(sample['INCOME'].isin(expected['INCOME']).all())
+        # Reservoir picks rows from the whole file, not just the first chunk
+        self.assertGreater(expected.index[expected['INCOME'].isin(sample['INCOME'])].max(), 64)
+
+        filtered = retriever.fetch_data(['TECH_SCORE'], sample_size=20, sampling='reservoir',
+                                        filters=[('TECH_SCORE', '>', 5)])
+        self.assertEqual(len(filtered), 20)
+        self.assertTrue((filtered['TECH_SCORE'] > 5).all())
+
+    def test_iter_chunks_streams_csv(self):
+        """Test streaming column-projected chunks straight from the CSV"""
+        retriever = DataRetriever(self.csv_path, chunk_size=128)
+        chunks = list(retriever.iter_chunks(['INCOME', 'PRIZM_SEGMENT'], filters=[('TECH_SCORE', '<=', 5)]))
+
+        self.assertIsNone(retriever.data)
+        self.assertEqual(len(chunks), 4)
+        expected = pd.read_csv(self.csv_path)
+        expected = expected[expected['TECH_SCORE'] <= 5]
+        streamed = pd.concat(chunks)
+        self.assertEqual(list(streamed.columns), ['INCOME', 'PRIZM_SEGMENT'])
+        np.testing.assert_array_equal(streamed.index, expected.index)
+        np.testing.assert_allclose(streamed['INCOME'], expected['INCOME'])
+
+    def test_iter_chunks_skips_parquet_row_groups(self):
+        """Test Parquet streams one row group per chunk and skips groups ruled out by statistics"""
+        sorted_path = os.path.join(self.temp_dir, 'sorted.csv')
+        pd.read_csv(self.csv_path).sort_values('TECH_SCORE').to_csv(sorted_path, index=False)
+        retriever = DataRetriever(sorted_path, storage='parquet')
+        retriever.ROW_GROUP_SIZE = 100
+        retriever.load_data()
+
+        self.assertEqual(len(list(retriever.iter_chunks(['INCOME']))), 5)
+        chunks = list(retriever.iter_chunks(['INCOME'], filters=[('TECH_SCORE', '>=', 9)]))
+        self.assertLess(len(chunks), 5)
+        expected = pd.read_csv(sorted_path)
+        expected = expected[expected['TECH_SCORE'] >= 9]
+        np.testing.assert_array_equal(pd.concat(chunks).index, expected.index)
+
+    def test_summarize_chunks(self):
+        """Test streamed statistics match whole-frame statistics"""
+        retriever = DataRetriever(self.csv_path, chunk_size=64)
+        summary = summarize_chunks(retriever.iter_chunks(['INCOME', 'TECH_SCORE', 'PRIZM_SEGMENT']))
+        expected = pd.read_csv(self.csv_path)
+
+        self.assertEqual(summary['INCOME']['count'], 500)
+        self.assertAlmostEqual(summary['INCOME']['mean'], expected['INCOME'].mean(), places=6)
+        self.assertAlmostEqual(summary['INCOME']['std'], expected['INCOME'].std(), places=6)
+        self.assertEqual(summary['TECH_SCORE']['max'], expected['TECH_SCORE'].max())
+        self.assertEqual(summary['PRIZM_SEGMENT']['dominant_value'], expected['PRIZM_SEGMENT'].mode()[0])
+
+    def test_fetch_by_postal_codes(self):
+        """Test postal code and FSA lookups through the persisted index"""
+        expected = pd.read_csv(self.csv_path)
+        for storage in ['csv', 'npy']:
+            retriever = DataRetriever(self.csv_path, storage=storage)
+            retriever.load_data()
+            matched = retriever.fetch_by_postal_codes(['k1a 042', 'K1A007', 'K1A007', 'X9X9X9', None],
+                                                      ['INCOME', 'PostalCode'])
+            self.assertEqual(list(matched['PostalCode'].astype(str)), ['K1A007', 'K1A042'])
+            np.testing.assert_allclose(matched['INCOME'], expected['INCOME'].iloc[[7, 42]])
+
+            fsa = retriever.fetch_by_postal_codes(['k1a'], ['TECH_SCORE'])
+            self.assertEqual(len(fsa), 500)
+            self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'data_postal_index.npz')))
+
+        # A fresh retriever reuses the saved index
+        retriever = DataRetriever(self.csv_path)
+        retriever.load_data()
+        self.assertEqual(len(retriever.fetch_by_postal_codes(['K1A499'], ['INCOME'])), 1)
+        self.assertEqual(len(retriever.fetch_by_postal_codes([], ['INCOME'])), 0)
+
+    def test_invalid_filters(self):
+        """Test malformed filters are rejected"""
+        retriever = DataRetriever(self.csv_path)
+        retriever.load_data()
+        with self.assertRaises(ValueError):
+            retriever.fetch_data(['INCOME'], filters=[('INCOME', 'like', 5)])
+        with self.assertRaises(ValueError):
+            retriever.fetch_data(['INCOME'], filters=[('MISSING', '==', 5)])
+
+    def test_invalid_storage(self):
+        """Test unknown storage formats are rejected"""
+        with self.assertRaises(ValueError):
+            DataRetriever(self.csv_path, storage='orc')
+
+
 class TestDataRetrieverEdgeCases(unittest.TestCase):
     """Test edge cases and error conditions"""
     
@@ -0,0 +1,151 @@
+"""
+Unit tests for versioned datasets and hot reload
+"""
+
+import unittest
+import tempfile
+import shutil
+import os
+import json
+import pandas as pd
+import numpy as np
+from unittest import mock
+from dataset_registry import DatasetRegistry
+
+
+class TestDatasetRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.manifest_path = os.path.join(self.temp_dir, 'manifest.json')
+        self.first_path = self._write_csv('first.csv', 100)
+        self.second_path = self._write_csv('second.csv', 150)
+        self.registries = []
+
+    def tearDown(self):
+        for registry in self.registries:
+            registry.wait_for_hash()
+        shutil.rmtree(self.temp_dir)
+
+    def _registry(self, manifest_path=None, **retriever_kwargs):
+        registry = DatasetRegistry(manifest_path, **retriever_kwargs)
+        self.registries.append(registry)
+        return registry
+
+    def _write_csv(self, name, n_rows):
+        path = os.path.join(self.temp_dir, name)
+        rng = np.random.default_rng(n_rows)
+        pd.DataFrame({
+            'INCOME': rng.normal(60000, 15000, n_rows),
+            'PostalCode': ['K1A' + str(i).zfill(3) for i in range(n_rows)]
+        }).to_csv(path, index=False)
+        return path
+
+    def test_load_and_swap(self):
+        """Test loading versions and skipping reloads of identical content"""
+        registry = self._registry(self.manifest_path)
+        first = registry.load(self.first_path)
+        self.assertEqual(first['version'], 1)
+        self.assertEqual(first['n_rows'], 100)
+
+        # Same contents under another name is the same version
+        copy_path = os.path.join(self.temp_dir, 'copy.csv')
+        shutil.copy(self.first_path, copy_path)
+        self.assertEqual(registry.load(copy_path)['version'], 1)
+
+        second = registry.load(self.second_path)
+        self.assertEqual(second['version'], 2)
+        self.assertNotEqual(second['content_hash'], first['content_hash'])
+        with registry.acquire() as retriever:
+            self.assertEqual(len(retriever.fetch_data(['INCOME'])), 150)
+
+    def test_in_flight_requests_keep_old_version(self):
+        """Test a request started before a swap finishes on the old data"""
+        registry = self._registry(self.manifest_path)
+        registry.load(self.first_path)
+
+        with registry.acquire() as old_retriever:
+            registry.load(self.second_path)
+            self.assertEqual(registry.stats()['retired_in_flight'], 1)
+            self.assertEqual(len(old_retriever.fetch_data(['INCOME'])), 100)
+            with registry.acquire() as new_retriever:
+                self.assertEqual(len(new_retriever.fetch_data(['INCOME'])), 150)
+
+        # The old version is released once its last request finishes
+        self.assertFalse(old_retriever.is_loaded())
+        self.assertEqual(registry.stats()['retired_in_flight'], 0)
+
+    def test_in_place_rewrite_keeps_old_columnar_copy(self):
+        """Test rewriting the same file and reloading leaves in-flight requests on their own columnar copy"""
+        for storage in ['parquet', 'npy']:
+            with self.subTest(storage=storage):
+                path = self._write_csv(f'live_{storage}.csv', 100)
+                registry = self._registry(storage=storage)
+                registry.load(path)
+
+                with registry.acquire() as old_retriever:
+                    old_income = old_retriever.fetch_data(['INCOME'])['INCOME'].to_numpy()
+                    old_paths = list(old_retriever.derived_paths)
+                    self._write_csv(f'live_{storage}.csv', 150)
+                    self.assertEqual(registry.load(path)['n_rows'], 150)
+
+                    np.testing.assert_array_equal(old_retriever.fetch_data(['INCOME'])['INCOME'], old_income)
+                    with registry.acquire() as new_retriever:
+                        self.assertEqual(len(new_retriever.fetch_data(['INCOME'])), 150)
+                        self.assertTrue(set(old_paths).isdisjoint(new_retriever.derived_paths))
+
+                # The old copy is deleted once its last request finishes; the new one stays
+                self.assertTrue(old_paths)
+                self.assertFalse(any(os.path.exists(p) for p in old_paths))
+                with registry.acquire() as new_retriever:
+                    self.assertTrue(all(os.path.exists(p) for p in new_retriever.derived_paths
+                                        if p.endswith(('.parquet', '_columns'))))
+
+    def test_manifest_persists_versions(self):
+        """Test the manifest records the current version and numbering continues after a restart"""
+        registry = self._registry(self.manifest_path)
+        registry.load(self.first_path)
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['current']['version'], 1)
+
+        restarted = self._registry(self.manifest_path)
+        self.assertEqual(restarted.load(self.second_path)['version'], 2)
+        self.assertEqual(restarted.stats()['version'], 2)
+
+    def test_reload_async(self):
+        """Test background reloads swap in new data and keep the current version on failure"""
+        registry = self._registry()
+        registry.load(self.first_path)
+
+        registry.reload_async(self.second_path).join()
+        self.assertEqual(registry.current_version()['n_rows'], 150)
+
+        registry.reload_async(os.path.join(self.temp_dir, 'missing.csv')).join()
+        self.assertEqual(registry.current_version()['n_rows'], 150)
+        self.assertIsNotNone(registry.stats()['last_error'])
+
+    def test_first_load_hashes_in_background(self):
+        """Test startup serves data before hashing and later starts reuse the recorded hash"""
+        registry = self._registry(self.manifest_path)
+        info = registry.load(self.first_path)
+        self.assertEqual(info['n_rows'], 100)
+        self.assertTrue(registry.wait_for_hash())
+        content_hash = registry.current_version()['content_hash']
+        with open(self.manifest_path) as f:
+            self.assertEqual(json.load(f)['current']['content_hash'], content_hash)
+
+        # A restart with an unchanged file knows the hash without reading the data
+        restarted = self._registry(self.manifest_path)
+        with mock.patch.object(DatasetRegistry, '_content_hash', side_effect=AssertionError):
+            self.assertEqual(restarted.load(self.first_path)['content_hash'], content_hash)
+
+    def test_acquire_requires_load(self):
+        """Test acquiring before any load fails"""
+        with self.assertRaises(AttributeError):
+            with DatasetRegistry().acquire():
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,91 @@
+"""
+Unit tests for the query embedding cache
+"""
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from embedding_cache import QueryEmbeddingCache
+
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'embeddings.sqlite')
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _embed(self, query):
+        self.calls.append(query)
+        return [len(query), 0.5, -1.25]
+
+    def test_repeated_queries_skip_embedding(self):
+        """Test normalized repeats of a query reuse the first embedding"""
+        cache = QueryEmbeddingCache(self.db_path)
+        first = cache.get_or_create('Eco conscious  millennials', 'model-a', self._embed)
+        again = cache.get_or_create('  eco CONSCIOUS millennials\n', 'model-a', self._embed)
+
+        self.assertEqual(self.calls, ['Eco conscious  millennials'])
+        self.assertEqual(first.dtype, np.float32)
+        np.testing.assert_array_equal(first, again)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+        # A different model never reuses the embedding
+        cache.get_or_create('eco conscious millennials', 'model-b', self._embed)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_disk_tier_survives_restart(self):
+        """Test a new cache on the same file serves earlier embeddings"""
+        cache = QueryEmbeddingCache(self.db_path)
+        stored = cache.put('urban renters', 'model-a', [0.1, 0.2, 0.3])
+        cache.close()
+
+        restarted = QueryEmbeddingCache(self.db_path)
+        np.testing.assert_array_equal(restarted.get('Urban Renters', 'model-a'), stored)
+        self.assertEqual(restarted.stats()['disk_hits'], 1)
+        self.assertIsNone(restarted.get('suburban owners', 'model-a'))
+        self.assertEqual(restarted.stats()['misses'], 1)
+
+    def test_bounded_tiers(self):
+        """Test the memory LRU and the disk table drop their oldest entries"""
+        cache = QueryEmbeddingCache(self.db_path, max_entries=2, max_disk_entries=3)
+        for i in range(5):
+            cache.put(f'query {i}', 'model-a', [i])
+        self.assertEqual(cache.stats()['entries'], 2)
+
+        restarted = QueryEmbeddingCache(self.db_path)
+        self.assertIsNone(restarted.get('query 1', 'model-a'))
+        self.assertEqual(restarted.get('query 2', 'model-a')[0], 2)
+
+        restarted.clear()
+        self.assertIsNone(restarted.get('query 4', 'model-a'))
+
+    def test_memory_only(self):
+        """Test the cache works without a database"""
+        cache = QueryEmbeddingCache(None)
+        cache.get_or_create('golf', 'model-a', self._embed)
+        cache.get_or_create('GOLF', 'model-a', self._embed)
+        self.assertEqual(self.calls, ['golf'])
+        with self.assertRaises(ValueError):
+            QueryEmbeddingCache(None, max_entries=0)
+
+    def test_unwritable_path_caches_in_memory(self):
+        """Test a database path that cannot be created leaves the cache memory-only"""
+        blocker = os.path.join(self.temp_dir, 'not_a_directory')
+        open(blocker, 'w').close()
+        for db_path in [os.path.join(blocker, 'cache', 'q.sqlite'), '/proc/nope/q.sqlite']:
+            cache = QueryEmbeddingCache(db_path)
+            cache.get_or_create('golf', 'model-a', self._embed)
+            cache.get_or_create('golf', 'model-a', self._embed)
+            self.assertEqual(cache.stats()['hits'], 1)
+            cache.clear()
+        self.assertEqual(self.calls, ['golf', 'golf'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
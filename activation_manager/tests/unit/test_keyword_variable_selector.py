@@ -0,0 +1,79 @@
+"""
+Unit tests for the keyword VariableSelector in audience_builder
+"""
+
+import unittest
+import numpy as np
+from audience_builder import VariableSelector
+
+
+def scan_catalog(catalog, user_request):
+    """Score every variable by scanning the catalog, as analyze_request is defined"""
+    request_lower = user_request.lower()
+    variable_scores = []
+    for var_code, var_info in catalog.items():
+        score = 0
+        for keyword in VariableSelector.KEYWORD_MAPPINGS.get(var_info.get("type", ""), []):
+            if keyword in request_lower:
+                score += 2
+        var_desc = var_info.get("description", "").lower()
+        for word in request_lower.split():
+            if len(word) > 3 and word in var_desc:
+                score += 1
+        if score > 0:
+            variable_scores.append((var_code, score))
+    variable_scores.sort(key=lambda x: x[1], reverse=True)
+    return variable_scores[:15]
+
+
+class TestKeywordVariableSelector(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        words = ['Household', 'income', 'spending', 'on', 'organic', 'food', 'urban', 'residents',
+                 'age', 'engagement', 'Online', 'purchases', 'eco-friendly', 'products', 'green', 'values']
+        types = ['demographic', 'behavioral', 'financial', 'psychographic', 'other']
+        self.catalog = {
+            f"VAR{i:05d}": {
+                'type': types[rng.integers(len(types))],
+                'description': ' '.join(rng.choice(words, rng.integers(2, 7)))
+            }
+            for i in range(2000)
+        }
+        self.selector = VariableSelector(self.catalog)
+
+    def test_matches_catalog_scan(self):
+        """Test indexed scores and order match scanning every variable"""
+        requests = [
+            "environmentally conscious millennials with high disposable income in urban areas",
+            "Frequent ONLINE buyers of eco-friendly products",
+            "spend spend SPENDING households",
+            "green",
+            "nothing matches zzzz"
+        ]
+        for request in requests:
+            expected = scan_catalog(self.catalog, request)
+            result = self.selector.analyze_request(request)
+            self.assertEqual([(var['code'], var['score']) for var in result], expected, request)
+            for var in result:
+                self.assertEqual(var['description'], self.catalog[var['code']]['description'])
+                self.assertIsInstance(var['score'], int)
+
+    def test_substring_matches_inside_tokens(self):
+        """Test request words still match inside longer description words"""
+        selector = VariableSelector({
+            'A': {'type': 'other', 'description': 'Eco-friendly purchases'},
+            'B': {'type': 'other', 'description': 'Purchase intent'}
+        })
+        self.assertEqual([var['code'] for var in selector.analyze_request('friend')], ['A'])
+        self.assertEqual([var['code'] for var in selector.analyze_request('chase')], ['A', 'B'])
+        self.assertEqual([(var['code'], var['score']) for var in selector.analyze_request('Purchases purchase')],
+                         [('A', 2), ('B', 1)])
+
+    def test_empty_catalog(self):
+        """Test an empty catalog suggests nothing"""
+        self.assertEqual(VariableSelector({}).analyze_request('urban income'), [])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
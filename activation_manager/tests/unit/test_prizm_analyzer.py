@@ -3,8 +3,13 @@ Unit tests for PRIZMAnalyzer
 """
 
 import unittest
+import tempfile
+import shutil
+import os
+from unittest import mock
 import pandas as pd
 import numpy as np
+import prizm_reference
 from prizm_analyzer import PRIZMAnalyzer
 
 
@@ -192,6 +197,84 @@ class TestPRIZMAnalyzer(unittest.TestCase):
                     self.assertIsInstance(behavior, str)
                     self.assertGreater(len(behavior), 0)
 
+    
+    def test_distribution_matches_per_group_counts(self):
+        """Test the single cross-tab agrees with per-group value counts"""
+        rng = np.random.default_rng(0)
+        data = pd.DataFrame({
+            'Group': rng.integers(0, 5, 2000),
+            'PRIZM_SEGMENT': rng.choice(['Young Digerati', 'Money & Brains', 'Golden Ponds', 'Heartlanders'],
+                                        2000, p=[0.4, 0.3, 0.2, 0.1])
+        })
+        result = self.analyzer.analyze_segment_distribution(data)
+        
+        self.assertEqual(list(result['segment_profiles']), [str(g) for g in data['Group'].unique()])
+        for group_id, group_data in data.groupby('Group'):
+            expected = list(group_data['PRIZM_SEGMENT'].value_counts().index[:3])
+            self.assertEqual(result['segment_profiles'][str(group_id)]['dominant_segments'], expected)
+        summary = result['overall_summary']
+        self.assertEqual(summary['top_segments'], list(data['PRIZM_SEGMENT'].value_counts().index))
+        self.assertEqual(summary['total_segments'], 4)
+        self.assertEqual(summary['diversity_score'], round(4 / 2000, 3))
+    
+    def test_compatibility_score(self):
+        """Test direct and partial attribute matches"""
+        self.analyzer = PRIZMAnalyzer(reference_path=None)
+        self.assertEqual(self.analyzer.get_segment_compatibility_score('01', ['luxury travel']), 1.0)
+        self.assertEqual(self.analyzer.get_segment_compatibility_score('02', ['affluent']), 0.7)
+        self.assertEqual(self.analyzer.get_segment_compatibility_score('03', ['millennial', 'truck']), 0.4)
+        self.assertEqual(self.analyzer.get_segment_compatibility_score('01', []), 0.0)
+        self.assertEqual(self.analyzer.get_segment_compatibility_score('99', ['urban']), 0.0)
+    
+    def test_rank_segments(self):
+        """Test ranking all segments agrees with per-segment scores"""
+        self.analyzer = PRIZMAnalyzer(reference_path=None)
+        attributes = ['Urban', 'tech', 'environmental', 'urban']
+        ranking = self.analyzer.rank_segments(attributes)
+        
+        self.assertEqual(len(ranking), len(self.analyzer.prizm_segments))
+        scores = [entry['score'] for entry in ranking]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        for entry in ranking:
+            expected = self.analyzer.get_segment_compatibility_score(entry['code'], attributes)
+            self.assertAlmostEqual(entry['score'], expected)
+        self.assertEqual(ranking[0]['code'], '01')
+        self.assertEqual(len(self.analyzer.rank_segments(attributes, top_n=2)), 2)
+
+
+@unittest.skipUnless(os.path.exists(prizm_reference.DEFAULT_WORKBOOK_PATH), "PRIZM workbook not available")
+class TestPRIZMReference(unittest.TestCase):
+    """Loading segments from the PRIZM 2024 workbook"""
+    
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+    
+    def test_loads_every_segment(self):
+        """Test all 67 segments are loaded in the analyzer layout"""
+        analyzer = PRIZMAnalyzer(cache_dir=self.cache_dir)
+        self.assertEqual(len(analyzer.prizm_segments), 67)
+        self.assertEqual(analyzer.prizm_segments['01']['name'], 'The A-List')
+        self.assertIn('Very Wealthy', analyzer.prizm_segments['01']['demographics']['income'])
+        self.assertEqual(analyzer._get_segment_profile('The A-List')['demographics']['location'], 'Urban')
+        ranking = analyzer.rank_segments(['affluent', 'urban'])
+        self.assertEqual(analyzer.prizm_segments[ranking[0]['code']]['demographics']['location'], 'Urban')
+    
+    def test_cache_skips_workbook_parsing(self):
+        """Test later loads come from the cache without opening the workbook"""
+        first = prizm_reference.load_prizm_reference(cache_dir=self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        with mock.patch.object(prizm_reference, '_parse_workbook', side_effect=AssertionError):
+            self.assertEqual(prizm_reference.load_prizm_reference(cache_dir=self.cache_dir), first)
+    
+    def test_missing_workbook_uses_builtin_profiles(self):
+        """Test the built-in profiles are used without the workbook"""
+        analyzer = PRIZMAnalyzer(reference_path=os.path.join(self.cache_dir, 'missing.xlsx'),
+                                 cache_dir=self.cache_dir)
+        self.assertEqual(analyzer.prizm_segments['01']['name'], 'Cosmopolitan Elite')
+
 
 class TestPRIZMAnalyzerPerformance(unittest.TestCase):
     """Performance and scalability tests"""
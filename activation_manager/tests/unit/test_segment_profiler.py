@@ -0,0 +1,85 @@
+"""
+Unit tests for grouped results and single-pass segment profiling
+"""
+
+import io
+import unittest
+import numpy as np
+import pandas as pd
+from segment_profiler import GroupedFrame, profile_groups
+
+
+class TestSegmentProfiler(unittest.TestCase):
+
+    def setUp(self):
+        """Clustered results with numeric, categorical and missing values"""
+        rng = np.random.default_rng(42)
+        n_rows = 1000
+        self.data = pd.DataFrame({
+            'INCOME': rng.normal(60000, 15000, n_rows),
+            'TECH_SCORE': rng.integers(1, 11, n_rows),
+            'PRIZM_SEGMENT': rng.choice(['Young Digerati', 'Money & Brains', 'Kids & Cul-de-Sacs'], n_rows),
+            'Group': rng.choice([7, 2, 4, 9], n_rows)
+        })
+        self.data.loc[::17, 'INCOME'] = np.nan
+        self.grouped = GroupedFrame(self.data)
+
+    def test_group_offsets(self):
+        """Test groups come out in ascending order with rows in their original order"""
+        np.testing.assert_array_equal(self.grouped.group_ids, [2, 4, 7, 9])
+        np.testing.assert_array_equal(self.grouped.sizes, self.data.groupby('Group').size().to_numpy())
+        for group_id, rows in self.grouped:
+            np.testing.assert_array_equal(rows, np.flatnonzero(self.data['Group'] == group_id))
+        self.assertEqual(len(self.grouped.group(4)), (self.data['Group'] == 4).sum())
+        with self.assertRaises(KeyError):
+            self.grouped.rows(3)
+
+    def test_non_integer_labels(self):
+        """Test labels that cannot be counted directly fall back to unique"""
+        grouped = GroupedFrame(self.data, self.data['PRIZM_SEGMENT'])
+        self.assertEqual(list(grouped.group_ids), sorted(self.data['PRIZM_SEGMENT'].unique()))
+        sparse = GroupedFrame(self.data, self.data['Group'] * 10 ** 9)
+        np.testing.assert_array_equal(sparse.sizes, self.grouped.sizes)
+
+    def test_to_csv_matches_sorted_frame(self):
+        """Test exporting in group order matches a stable sort of the frame"""
+        output = io.StringIO()
+        self.grouped.to_csv(output, index=False)
+        expected = self.data.sort_values('Group', kind='stable').to_csv(index=False)
+        self.assertEqual(output.getvalue(), expected)
+
+    def test_numeric_profiles_match_pandas(self):
+        """Test numeric statistics match a pandas groupby"""
+        profiles = profile_groups(self.grouped, exclude=['Group'])
+        for col in ['INCOME', 'TECH_SCORE']:
+            expected = self.data.groupby('Group')[col].agg(['count', 'mean', 'median', 'std', 'min', 'max'])
+            for group_id, row in expected.iterrows():
+                stats = profiles[group_id][col]
+                self.assertEqual(stats['type'], 'numeric')
+                for name in expected.columns:
+                    self.assertAlmostEqual(stats[name], row[name], places=6)
+        self.assertEqual(list(profiles[2]), ['INCOME', 'TECH_SCORE', 'PRIZM_SEGMENT'])
+
+    def test_categorical_profiles_match_value_counts(self):
+        """Test categorical top values match a grouped value_counts"""
+        profiles = profile_groups(self.grouped, top_k=2)
+        for group_id, rows in self.grouped:
+            counts = self.data['PRIZM_SEGMENT'].iloc[rows].value_counts()
+            stats = profiles[group_id]['PRIZM_SEGMENT']
+            self.assertEqual(stats['type'], 'categorical')
+            self.assertEqual(stats['dominant_value'], counts.index[0])
+            self.assertEqual(stats['dominant_count'], counts.iloc[0])
+            self.assertEqual(len(stats['distribution']), 2)
+            self.assertEqual(stats['count'], len(rows))
+
+    def test_empty_frame(self):
+        """Test an empty frame has no groups"""
+        grouped = GroupedFrame(pd.DataFrame({'Group': pd.Series([], dtype=int)}))
+        self.assertEqual(len(grouped), 0)
+        self.assertEqual(profile_groups(grouped), {})
+        with self.assertRaises(ValueError):
+            GroupedFrame(self.data, [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)